@@ -0,0 +1,228 @@
+import bisect
+import math
+
+import numpy as np
+
+# starting item difficulty (b) for each difficulty label, on the ability scale
+DIFFICULTY_PRIORS = {
+    "Easy": -1.0,
+    "Medium": 0.0,
+    "Hard": 1.0
+}
+
+
+def item_information(theta, a, b):
+    """
+    Fisher information of 2PL items at an ability level.
+
+    Args:
+        theta (float): Ability
+        a (numpy.ndarray): Item discriminations
+        b (numpy.ndarray): Item difficulties
+
+    Returns:
+        numpy.ndarray: Information of each item
+    """
+    p = 1.0 / (1.0 + np.exp(-a * (theta - b)))
+    return a * a * p * (1.0 - p)
+
+
+def item_parameters(question, attempts=0, correct=0, prior_weight=10):
+    """
+    Calibrate the 2PL parameters of a question.
+
+    The difficulty starts from the question's label and moves toward the
+    difficulty implied by how often it was answered correctly, weighted by the
+    number of attempts, so items with few responses stay close to their label.
+
+    Args:
+        question (dict): Question dictionary
+        attempts (int): Number of recorded responses
+        correct (int): Number of correct responses
+        prior_weight (int): Number of responses the label is worth
+
+    Returns:
+        tuple: (discrimination a, difficulty b)
+    """
+    b = DIFFICULTY_PRIORS.get(question.get('difficulty'), 0.0)
+    if attempts:
+        p = (correct + 0.5) / (attempts + 1.0)
+        observed_b = -math.log(p / (1.0 - p))
+        b = (prior_weight * b + attempts * observed_b) / (prior_weight + attempts)
+    return 1.0, b
+
+
+class ItemPool:
+    def __init__(self, items):
+        """
+        Initialize a pool of calibrated items sorted by difficulty.
+
+        For 2PL items with similar discrimination, information at an ability
+        level is highest for the items whose difficulty is closest to it, so
+        the next item is found by a binary search on difficulty followed by a
+        scan of a few neighbours, instead of a pass over the whole pool.
+
+        Args:
+            items (list): Dictionaries with 'id', 'question', 'a' and 'b'
+        """
+        self.items = sorted(items, key=lambda item: item['b'])
+        self.b_values = [item['b'] for item in self.items]
+        self.a = np.array([item['a'] for item in self.items], dtype=float)
+        self.b = np.array(self.b_values, dtype=float)
+
+    def __len__(self):
+        return len(self.items)
+
+    def best_item(self, theta, exclude, window=8):
+        """
+        Find the unused item with the most information at an ability level.
+
+        Args:
+            theta (float): Current ability estimate
+            exclude (set): Positions of items already administered
+            window (int): Number of unused items nearest in difficulty to compare
+
+        Returns:
+            int: Position of the item in the pool, or None if every item was used
+        """
+        right = bisect.bisect_left(self.b_values, theta)
+        left = right - 1
+        candidates = []
+        # walk outward from theta, nearest difficulty first
+        while len(candidates) < window and (left >= 0 or right < len(self.items)):
+            if right >= len(self.items) or (left >= 0 and theta - self.b_values[left] <= self.b_values[right] - theta):
+                position, left = left, left - 1
+            else:
+                position, right = right, right + 1
+            if position not in exclude:
+                candidates.append(position)
+
+        if not candidates:
+            return None
+        candidates = np.array(candidates)
+        information = item_information(theta, self.a[candidates], self.b[candidates])
+        return int(candidates[np.argmax(information)])
+
+
+class AbilityEstimator:
+    def __init__(self, grid_points=81, grid_limit=4.0):
+        """
+        Initialize an expected a posteriori (EAP) ability estimate with a
+        standard normal prior, kept on a fixed quadrature grid.
+        """
+        self.grid = np.linspace(-grid_limit, grid_limit, grid_points)
+        self.log_posterior = -0.5 * self.grid ** 2
+
+    def update(self, a, b, correct):
+        """
+        Add one scored response to the posterior.
+        """
+        p = 1.0 / (1.0 + np.exp(-a * (self.grid - b)))
+        self.log_posterior += np.log(p if correct else 1.0 - p)
+
+    def estimate(self):
+        """
+        Get the ability estimate and its standard error.
+
+        Returns:
+            tuple: (theta, standard error)
+        """
+        weights = np.exp(self.log_posterior - self.log_posterior.max())
+        weights /= weights.sum()
+        theta = float(np.dot(weights, self.grid))
+        se = float(np.sqrt(np.dot(weights, (self.grid - theta) ** 2)))
+        return theta, se
+
+
+class AdaptiveSession:
+    def __init__(self, pool, se_target=0.5, min_items=5, max_items=20):
+        """
+        Initialize a computerized adaptive test over an item pool.
+
+        Each next item is the one with the most information at the current
+        ability estimate, and the test stops as soon as the standard error of
+        the estimate reaches se_target.
+
+        Args:
+            pool (ItemPool): Calibrated items
+            se_target (float): Standard error at which the test stops
+            min_items (int): Minimum number of items before stopping
+            max_items (int): Maximum number of items
+        """
+        self.pool = pool
+        self.se_target = se_target
+        self.min_items = min_items
+        self.max_items = max_items
+
+        self.estimator = AbilityEstimator()
+        self.theta, self.se = self.estimator.estimate()
+        self.administered = []  # pool positions in the order they were asked
+        self.responses = []  # correctness of each administered item
+        self.current = None
+
+    @property
+    def finished(self):
+        """
+        Whether the stopping rule has been met or the pool is used up.
+        """
+        count = len(self.administered)
+        return (
+            count >= self.max_items
+            or count >= len(self.pool)
+            or (count >= self.min_items and self.se <= self.se_target)
+        )
+
+    def next_question(self):
+        """
+        Pick the next item.
+
+        Returns:
+            dict: The item's question dictionary, or None if the test is finished
+        """
+        if self.finished:
+            return None
+        if self.current is None:
+            self.current = self.pool.best_item(self.theta, set(self.administered))
+            if self.current is None:
+                return None
+        return self.pool.items[self.current]['question']
+
+    def record(self, correct):
+        """
+        Score the answer to the current item and update the ability estimate.
+
+        Args:
+            correct (bool): Whether the answer was correct
+        """
+        item = self.pool.items[self.current]
+        self.estimator.update(item['a'], item['b'], correct)
+        self.theta, self.se = self.estimator.estimate()
+        self.administered.append(self.current)
+        self.responses.append(bool(correct))
+        self.current = None
+
+    def administered_questions(self):
+        """
+        Get the questions asked so far, in order.
+        """
+        return [self.pool.items[position]['question'] for position in self.administered]
+
+
+def build_item_pool(question_bank, subject, topics, user_id=None):
+    """
+    Build a calibrated item pool from the question bank.
+
+    Args:
+        question_bank (QuestionBank): Bank to draw items from
+        subject (str): The subject area
+        topics (list): List of topics
+        user_id (str, optional): User taking the test; questions they have seen are left out
+
+    Returns:
+        ItemPool: The pool
+    """
+    items = []
+    for question_id, item in question_bank.get_items(subject, topics, exclude_user=user_id):
+        a, b = item_parameters(item['question'], item.get('attempts', 0), item.get('correct', 0))
+        items.append({'id': question_id, 'question': item['question'], 'a': a, 'b': b})
+    return ItemPool(items)
@@ -2,6 +2,36 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict, Counter
 
+
+def score_by_answer(test_results, field, default):
+    """
+    Split a test's score by a field recorded on its answers.
+    
+    Answers without the field (e.g. results saved before questions were tagged)
+    count for the test-level default.
+    
+    Args:
+        test_results (dict): Test results
+        field (str): Answer field to group by, e.g. 'subject' or 'difficulty'
+        default (str): Value used for answers without the field
+        
+    Returns:
+        dict: Field value -> score (0-100) over the answers with that value
+    """
+    answers = test_results.get('answers') or []
+    if not answers:
+        return {default: test_results.get('score', 0)}
+    
+    correct = defaultdict(int)
+    total = defaultdict(int)
+    for answer in answers:
+        value = answer.get(field) or default
+        total[value] += 1
+        if answer.get('is_correct', False):
+            correct[value] += 1
+    return {value: (correct[value] / count) * 100 for value, count in total.items()}
+
+
 class PerformanceAnalytics:
     def __init__(self):
         """
@@ -49,21 +79,22 @@ class PerformanceAnalytics:
             difficulty_total = defaultdict(int)
             
             # Get actual test metadata
-            test_subject = test_results.get('subject', 'General')
             test_topics = test_results.get('topics', ['General'])
             test_difficulty = test_results.get('difficulty', 'Medium')
             
             for answer in test_results['answers']:
-                # Use actual test metadata
-                # Since all questions in a test share the same topic/difficulty in this system
-                for topic in test_topics:
+                # a question tagged with its own topic only counts for that topic;
+                # untagged questions count for every topic of the test
+                for topic in ([answer['topic']] if answer.get('topic') else test_topics):
                     topic_total[topic] += 1
                     if answer.get('is_correct', False):
                         topic_correct[topic] += 1
                 
-                difficulty_total[test_difficulty] += 1
+                # sections of a mixed test keep their own difficulty
+                difficulty = answer.get('difficulty') or test_difficulty
+                difficulty_total[difficulty] += 1
                 if answer.get('is_correct', False):
-                    difficulty_correct[test_difficulty] += 1
+                    difficulty_correct[difficulty] += 1
             
             # Update topic performance
             for topic, total in topic_total.items():
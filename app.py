@@ -1,12 +1,51 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import nltk
+import os
+import threading
 from mcq_generator import MCQGenerator
 from user_manager import UserManager
-from analytics import PerformanceAnalytics
+from analytics import PerformanceAnalytics, score_by_answer
+from question_variants import build_variant
+from adaptive_testing import AdaptiveSession, build_item_pool
+from prefetch import get_prefetch_manager, weak_topic_names
+from question_bank import get_question_bank
+from topic_classifier import get_topic_classifier
+from document_ingestion import get_document_index
 
 # no longer needed - using direct st.rerun() calls instead
 
+# seconds the practice button waits for the AI before filling in stored questions
+PRACTICE_DEADLINE_SECONDS = 5.0
+
+# longest a single page run waits for the next question of a test still being generated
+NEXT_QUESTION_WAIT_SECONDS = 2.0
+
+# lecture notes can only be indexed from folders under this directory
+NOTES_ROOT = os.path.realpath(os.environ.get("MCQ_NOTES_ROOT", "data/notes"))
+
+
+def resolve_notes_folder(folder):
+    """
+    Resolve a lecture notes folder given relative to NOTES_ROOT.
+
+    Returns:
+        str: The absolute folder, or None if it is outside NOTES_ROOT or does not exist
+    """
+    path = os.path.realpath(os.path.join(NOTES_ROOT, folder))
+    if os.path.commonpath([path, NOTES_ROOT]) != NOTES_ROOT or not os.path.isdir(path):
+        return None
+    return path
+
+SUBJECT_TOPICS = {
+    "Mathematics": ["Algebra", "Geometry", "Calculus", "Statistics", "Trigonometry"],
+    "Science": ["Physics", "Chemistry", "Biology", "Astronomy", "Environmental Science"],
+    "History": ["Ancient History", "Medieval History", "Modern History", "World Wars", "Cold War"],
+    "English": ["Grammar", "Literature", "Comprehension", "Vocabulary", "Writing"],
+    "Computer Science": ["Programming", "Data Structures", "Algorithms", "Databases", "Networking"]
+}
+
 # initialize page state if needed
 if 'page' not in st.session_state:
     st.session_state.page = "Login/Register"
@@ -40,19 +79,43 @@ st.set_page_config(
 
 # initialize session state variables
 if 'user_manager' not in st.session_state:
-    st.session_state.user_manager = UserManager()
+    # questions are tagged with their own topic by a classifier trained on the question bank
+    st.session_state.user_manager = UserManager(topic_classifier=get_topic_classifier(get_question_bank()))
 if 'mcq_generator' not in st.session_state:
-    st.session_state.mcq_generator = MCQGenerator()
+    try:
+        st.session_state.mcq_generator = MCQGenerator()
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
+    # make every stored question available to the question bank and duplicate checks
+    st.session_state.mcq_generator.ingest_tests(st.session_state.user_manager.tests)
+    # questions of new tests become searchable for later custom descriptions
+    retrieval_index = st.session_state.mcq_generator.retrieval_index
+    st.session_state.user_manager.add_test_listener(
+        lambda test_id, questions, test: retrieval_index.add_questions(questions, test['subject'])
+    )
+if 'prefetch_manager' not in st.session_state:
+    st.session_state.prefetch_manager = get_prefetch_manager(st.session_state.mcq_generator)
+if 'practice_request' not in st.session_state:
+    st.session_state.practice_request = None
 if 'analytics' not in st.session_state:
     st.session_state.analytics = PerformanceAnalytics()
 if 'current_user_id' not in st.session_state:
     st.session_state.current_user_id = None
 if 'current_test' not in st.session_state:
     st.session_state.current_test = None
+if 'current_test_id' not in st.session_state:
+    st.session_state.current_test_id = None
+if 'adaptive_session' not in st.session_state:
+    st.session_state.adaptive_session = None
+if 'test_variant' not in st.session_state:
+    st.session_state.test_variant = None
 if 'test_in_progress' not in st.session_state:
     st.session_state.test_in_progress = False
 if 'question_index' not in st.session_state:
     st.session_state.question_index = 0
+if 'awaiting_question' not in st.session_state:
+    st.session_state.awaiting_question = False
 if 'user_answers' not in st.session_state:
     st.session_state.user_answers = []
 if 'test_results' not in st.session_state:
@@ -182,18 +245,8 @@ elif st.session_state.page == "Generate Test":
         
         with col1:
             test_name = st.text_input("Test Name")
-            subject = st.selectbox("Subject", ["Mathematics", "Science", "History", "English", "Computer Science"])
-            
-            if subject == "Mathematics":
-                topics = ["Algebra", "Geometry", "Calculus", "Statistics", "Trigonometry"]
-            elif subject == "Science":
-                topics = ["Physics", "Chemistry", "Biology", "Astronomy", "Environmental Science"]
-            elif subject == "History":
-                topics = ["Ancient History", "Medieval History", "Modern History", "World Wars", "Cold War"]
-            elif subject == "English":
-                topics = ["Grammar", "Literature", "Comprehension", "Vocabulary", "Writing"]
-            elif subject == "Computer Science":
-                topics = ["Programming", "Data Structures", "Algorithms", "Databases", "Networking"]
+            subject = st.selectbox("Subject", list(SUBJECT_TOPICS.keys()))
+            topics = SUBJECT_TOPICS[subject]
             
             selected_topics = st.multiselect("Topics", topics)
             
@@ -216,37 +269,88 @@ elif st.session_state.page == "Generate Test":
                                          height=150,
                                          help="If provided, the AI will generate questions based on this specific content.")
         
+        notes_folder = st.text_input("Lecture Notes Folder (Optional)",
+                                     placeholder="e.g. networking/week-3",
+                                     help=f"Folder of .txt, .md or .html notes under {NOTES_ROOT}. Changed files are "
+                                          "re-indexed and the passages most relevant to the topics are used as the "
+                                          "content.")
+        
+        engine_options = {"AI (Cohere)": "cohere", "Offline fill-in-the-blank (from content)": "cloze"}
+        engine_label = st.selectbox("Question Engine", list(engine_options.keys()),
+                                    help="The offline engine builds questions from the educational content without any AI call.")
+        engine = engine_options[engine_label]
+        
         if st.button("🚀 Generate AI-Powered Test", type="primary"):
             if not test_name:
                 st.error("Please enter a test name.")
             elif not selected_topics:
                 st.error("Please select at least one topic.")
+            elif engine == "cloze" and not educational_content.strip() and not notes_folder.strip():
+                st.error("The offline engine needs educational content to build questions from.")
+            elif notes_folder.strip() and resolve_notes_folder(notes_folder.strip()) is None:
+                st.error(f"The lecture notes folder must be an existing folder under {NOTES_ROOT}.")
             else:
-                with st.spinner("🤖 Generating questions using AI... This may take a moment."):
-                    # generate test questions using AI
-                    questions = st.session_state.mcq_generator.generate_questions(
-                        subject=subject,
-                        topics=selected_topics,
-                        difficulty=difficulty,
-                        num_questions=num_questions,
-                        content=educational_content,
-                        custom_description=custom_description
+                document_index = None
+                if notes_folder.strip():
+                    notes_path = resolve_notes_folder(notes_folder.strip())
+                    document_index = get_document_index(notes_path)
+                    with st.spinner("📚 Indexing lecture notes..."):
+                        ingest_stats = document_index.ingest(notes_path, workers=2)
+                    st.caption(f"Lecture notes: {ingest_stats['added'] + ingest_stats['updated']} file(s) indexed, "
+                               f"{ingest_stats['unchanged']} unchanged")
+                
+                # a test predicted from the last result may already be ready
+                prefetched = None
+                if (engine == "cohere" and not custom_description.strip() and not educational_content.strip()
+                        and document_index is None):
+                    prefetched = st.session_state.prefetch_manager.take(
+                        st.session_state.current_user_id, subject, selected_topics, difficulty, num_questions
                     )
                 
+                # stream questions so the test can start as soon as the first one is ready
+                question_stream = iter(prefetched) if prefetched else st.session_state.mcq_generator.generate_questions_stream(
+                    subject=subject,
+                    topics=selected_topics,
+                    difficulty=difficulty,
+                    num_questions=num_questions,
+                    content=educational_content,
+                    custom_description=custom_description,
+                    user_id=st.session_state.current_user_id,
+                    engine=engine,
+                    document_index=document_index
+                )
+                
+                with st.spinner("🤖 Generating questions using AI... This may take a moment."):
+                    first_question = next(question_stream, None)
+                questions = [first_question] if first_question else []
+                
                 # save test for the user
-                test_id = st.session_state.user_manager.create_test(
+                user_manager = st.session_state.user_manager
+                test_id = user_manager.create_test(
                     user_id=st.session_state.current_user_id,
                     test_name=test_name,
                     subject=subject,
                     topics=selected_topics,
                     questions=questions,
                     difficulty=difficulty,
-                    adaptive=adaptive
+                    adaptive=adaptive,
+                    generating=first_question is not None
                 )
                 
+                if first_question is not None:
+                    # keep appending the remaining questions in the background
+                    def finish_generation(stream=question_stream, test_id=test_id):
+                        try:
+                            for question in stream:
+                                user_manager.append_questions(test_id, [question])
+                        finally:
+                            user_manager.finish_generation(test_id)
+                    
+                    threading.Thread(target=finish_generation, daemon=True).start()
+                
                 if questions and len(questions) > 0:
-                    st.success(f"✅ AI successfully generated {len(questions)} questions for '{test_name}'!")
-                    st.info("🎯 The questions were created using advanced AI based on your specifications. You can now take this test from the 'Take Test' page.")
+                    st.success(f"✅ AI is generating {num_questions} questions for '{test_name}'!")
+                    st.info("🎯 The first question is ready and the rest are being generated in the background. You can already start this test from the 'Take Test' page.")
                     
                     # Show a preview of the first question
                     if len(questions) > 0:
@@ -256,6 +360,62 @@ elif st.session_state.page == "Generate Test":
                                 st.write(f"{chr(65+i)}. {option}")
                 else:
                     st.error("❌ Failed to generate questions. Please try again with different parameters or check your internet connection.")
+        
+        # a diagnostic spanning several subjects, generated section by section in parallel
+        with st.expander("🧩 Mixed-Subject Diagnostic"):
+            mixed_name = st.text_input("Diagnostic Name", key="mixed_name")
+            mixed_subjects = st.multiselect("Subjects", list(SUBJECT_TOPICS.keys()), key="mixed_subjects")
+            blueprint = []
+            for mixed_subject in mixed_subjects:
+                col1, col2, col3 = st.columns([3, 2, 1])
+                with col1:
+                    section_topics = st.multiselect(f"{mixed_subject} Topics", SUBJECT_TOPICS[mixed_subject],
+                                                    key=f"mixed_topics_{mixed_subject}")
+                with col2:
+                    section_difficulty = st.select_slider(f"{mixed_subject} Difficulty",
+                                                          options=["Easy", "Medium", "Hard"],
+                                                          value="Medium", key=f"mixed_difficulty_{mixed_subject}")
+                with col3:
+                    section_count = st.number_input("Questions", min_value=1, max_value=20, value=5,
+                                                    key=f"mixed_count_{mixed_subject}")
+                if section_topics:
+                    blueprint.append({
+                        "subject": mixed_subject,
+                        "topics": section_topics,
+                        "difficulty": section_difficulty,
+                        "count": int(section_count)
+                    })
+            layout_options = {"Grouped by subject": "grouped", "Interleaved": "interleaved"}
+            layout_label = st.radio("Question Order", list(layout_options.keys()), horizontal=True)
+            
+            if st.button("🧩 Generate Diagnostic"):
+                if not mixed_name:
+                    st.error("Please enter a diagnostic name.")
+                elif not blueprint:
+                    st.error("Please select topics for at least one subject.")
+                else:
+                    with st.spinner(f"🤖 Generating {len(blueprint)} sections in parallel..."):
+                        questions = st.session_state.mcq_generator.assemble_test(
+                            blueprint, layout_options[layout_label], user_id=st.session_state.current_user_id
+                        )
+                    if questions:
+                        # answers carry their section's difficulty; the test is only
+                        # labelled with one when every section shares it
+                        section_difficulties = {section["difficulty"] for section in blueprint}
+                        st.session_state.user_manager.create_test(
+                            user_id=st.session_state.current_user_id,
+                            test_name=mixed_name,
+                            subject="Mixed",
+                            topics=[topic for section in blueprint for topic in section["topics"]],
+                            questions=questions,
+                            difficulty=section_difficulties.pop() if len(section_difficulties) == 1 else "Mixed",
+                            adaptive=False,
+                            sections=blueprint
+                        )
+                        st.success(f"✅ '{mixed_name}' is ready with {len(questions)} questions from "
+                                   f"{len(blueprint)} subjects. Start it from the 'Take Test' page.")
+                    else:
+                        st.error("❌ Failed to generate questions. Please try again.")
 
 # take test page
 elif st.session_state.page == "Take Test":
@@ -266,7 +426,85 @@ elif st.session_state.page == "Take Test":
     else:
         st.header("Take MCQ Test")
         
-        if not st.session_state.test_in_progress:
+        if st.session_state.adaptive_session is not None:
+            # adaptive session: every next question is picked from the bank by the ability estimate
+            session = st.session_state.adaptive_session
+            current_q = session.next_question()
+            
+            st.subheader(f"Adaptive Question {len(session.administered) + 1}")
+            st.caption(f"Current ability estimate: {session.theta:+.2f} (± {session.se:.2f})")
+            st.write(current_q["question"])
+            
+            options = current_q["options"]
+            user_answer = st.radio("Select your answer:", options, key=f"adaptive_{len(session.administered)}")
+            
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                submitted = st.button("Submit Answer")
+            with col2:
+                stopped = st.button("Finish Test")
+            
+            if submitted:
+                is_correct = user_answer == current_q["correct_answer"]
+                st.session_state.user_answers.append({
+                    "question_index": len(session.administered),
+                    "question": current_q["question"],
+                    "user_answer": user_answer,
+                    "correct_answer": current_q["correct_answer"],
+                    "is_correct": is_correct,
+                    "topic": current_q.get("topic"),
+                    "difficulty": current_q.get("difficulty")
+                })
+                session.record(is_correct)
+            
+            if (submitted and session.next_question() is None) or (stopped and session.administered):
+                # store the administered questions as a test so the results show up everywhere else
+                user_manager = st.session_state.user_manager
+                user_id = st.session_state.current_user_id
+                questions = session.administered_questions()
+                test_id = user_manager.create_test(
+                    user_id=user_id,
+                    test_name=f"Adaptive {st.session_state.adaptive_subject} Test",
+                    subject=st.session_state.adaptive_subject,
+                    topics=st.session_state.adaptive_topics,
+                    questions=questions,
+                    difficulty="Medium",
+                    adaptive=True
+                )
+                st.session_state.mcq_generator.question_bank.record_responses(
+                    list(zip(questions, session.responses)), user_id
+                )
+                st.session_state.mcq_generator.difficulty_estimator.record_answers(st.session_state.user_answers)
+                
+                correct_answers = sum(session.responses)
+                st.session_state.test_results = {
+                    "test_id": test_id,
+                    "test_name": f"Adaptive {st.session_state.adaptive_subject} Test",
+                    "total_questions": len(questions),
+                    "correct_answers": correct_answers,
+                    "score": correct_answers / len(questions) * 100,
+                    "answers": st.session_state.user_answers,
+                    "ability": session.theta,
+                    "ability_se": session.se
+                }
+                user_manager.save_test_results(user_id=user_id, test_id=test_id,
+                                               results=st.session_state.test_results)
+                st.session_state.test_results["timestamp"] = pd.Timestamp.now().isoformat()
+                st.session_state.analytics.process_test_results(
+                    user_id=user_id,
+                    test_results=st.session_state.test_results
+                )
+                
+                st.session_state.adaptive_session = None
+                st.success(f"Test completed after {len(questions)} questions! Estimated ability: "
+                           f"{session.theta:+.2f} (± {session.se:.2f})")
+                st.rerun()
+            elif submitted or stopped:
+                if stopped:
+                    st.session_state.adaptive_session = None
+                st.rerun()
+        
+        elif not st.session_state.test_in_progress:
             user_tests = st.session_state.user_manager.get_user_tests(st.session_state.current_user_id)
             
             if not user_tests:
@@ -278,24 +516,90 @@ elif st.session_state.page == "Take Test":
                 if st.button("Start Test"):
                     selected_test_id = test_options[selected_test]
                     st.session_state.current_test = user_tests[selected_test_id]
+                    st.session_state.current_test_id = selected_test_id
+                    
+                    # each attempt gets its own order of questions and options; tests that are
+                    # still being generated keep the question order so new questions can be appended
+                    generating = st.session_state.current_test.get("generating", False)
+                    st.session_state.test_variant = build_variant(
+                        st.session_state.current_test["questions"],
+                        seed=int(np.random.SeedSequence().entropy % 2**32),
+                        shuffle_questions=not generating,
+                        shuffle_options=not generating
+                    )
                     st.session_state.test_in_progress = True
                     st.session_state.question_index = 0
+                    st.session_state.awaiting_question = False
                     st.session_state.user_answers = []
                     st.rerun()
+            
+            # adaptive mode asks stored questions one at a time until the ability estimate is precise enough
+            with st.expander("🎯 Adaptive Test from the Question Bank"):
+                adaptive_subject = st.selectbox("Subject", list(SUBJECT_TOPICS.keys()), key="adaptive_subject_select")
+                adaptive_topics = st.multiselect("Topics", SUBJECT_TOPICS[adaptive_subject], key="adaptive_topics_select")
+                
+                if st.button("Start Adaptive Test"):
+                    if not adaptive_topics:
+                        st.error("Please select at least one topic.")
+                    else:
+                        pool = build_item_pool(
+                            st.session_state.mcq_generator.question_bank, adaptive_subject, adaptive_topics,
+                            st.session_state.current_user_id
+                        )
+                        if len(pool) < 5:
+                            st.warning("Not enough stored questions for these topics yet. Generate a test on them first.")
+                        else:
+                            st.session_state.adaptive_session = AdaptiveSession(pool)
+                            st.session_state.adaptive_subject = adaptive_subject
+                            st.session_state.adaptive_topics = adaptive_topics
+                            st.session_state.user_answers = []
+                            st.session_state.test_results = None
+                            st.rerun()
         
         else:
             # Display current question
             questions = st.session_state.current_test["questions"]
-            current_q = questions[st.session_state.question_index]
+            variant = st.session_state.test_variant
+            still_generating = st.session_state.current_test.get("generating", False)
+            finish_test = False
+            
+            # the last answer is in and the next question is still being generated:
+            # wait a bounded time per run and rerun until it arrives or generation ends
+            if st.session_state.awaiting_question:
+                with st.spinner("⏳ Generating the next question..."):
+                    st.session_state.user_manager.wait_for_questions(
+                        st.session_state.current_test_id, st.session_state.question_index + 2,
+                        NEXT_QUESTION_WAIT_SECONDS
+                    )
+                questions = st.session_state.current_test["questions"]
+                if st.session_state.question_index < len(questions) - 1:
+                    st.session_state.awaiting_question = False
+                    st.session_state.question_index += 1
+                    st.rerun()
+                elif st.session_state.current_test.get("generating", False):
+                    st.rerun()
+                else:
+                    st.session_state.awaiting_question = False
+                    finish_test = True
+            
+            if variant is not None and st.session_state.question_index < len(variant):
+                current_q = variant.question(st.session_state.question_index)
+                canonical_index = variant.canonical_index(st.session_state.question_index)
+            else:
+                # questions generated after the test was started are shown as stored
+                current_q = questions[st.session_state.question_index]
+                canonical_index = st.session_state.question_index
             
-            st.subheader(f"Question {st.session_state.question_index + 1} of {len(questions)}")
+            st.subheader(f"Question {st.session_state.question_index + 1} of {len(questions)}{'+' if still_generating else ''}")
             st.write(current_q["question"])
             
-            # Randomize answer options to avoid patterns
+            # options are shown in the order of this attempt's variant
             options = current_q["options"]
             correct_answer = current_q["correct_answer"]
             
-            user_answer = st.radio("Select your answer:", options, key=f"q_{st.session_state.question_index}")
+            option_position = st.radio("Select your answer:", range(len(options)), format_func=lambda i: options[i],
+                                       key=f"q_{st.session_state.question_index}")
+            user_answer = options[option_position]
             
             col1, col2, col3 = st.columns([1, 1, 1])
             
@@ -306,62 +610,112 @@ elif st.session_state.page == "Take Test":
             
             with col2:
                 if st.button("Submit Answer"):
-                    # Save the answer
-                    is_correct = user_answer == correct_answer
+                    # Save the answer, graded against the canonical question and options
+                    if variant is not None and st.session_state.question_index < len(variant):
+                        is_correct = variant.is_correct(st.session_state.question_index, option_position)
+                    else:
+                        is_correct = user_answer == correct_answer
                     st.session_state.user_answers.append({
-                        "question_index": st.session_state.question_index,
+                        "question_index": canonical_index,
                         "question": current_q["question"],
                         "user_answer": user_answer,
                         "correct_answer": correct_answer,
-                        "is_correct": is_correct
+                        "is_correct": is_correct,
+                        "topic": current_q.get("topic"),
+                        "subject": current_q.get("subject"),
+                        "difficulty": current_q.get("difficulty")
                     })
                     
-                    # Move to next question or finish test
+                    # Move to next question, wait for it if it is still being generated, or finish test
                     if st.session_state.question_index < len(questions) - 1:
                         st.session_state.question_index += 1
                         st.rerun()
-                    else:
-                        # Finish test
-                        test_id = list(st.session_state.user_manager.get_user_tests(st.session_state.current_user_id).keys())[0]
-                        
-                        # Calculate results
-                        total_questions = len(questions)
-                        correct_answers = sum(answer["is_correct"] for answer in st.session_state.user_answers)
-                        score = (correct_answers / total_questions) * 100
-                        
-                        st.session_state.test_results = {
-                            "test_id": test_id,
-                            "test_name": st.session_state.current_test["test_name"],
-                            "total_questions": total_questions,
-                            "correct_answers": correct_answers,
-                            "score": score,
-                            "answers": st.session_state.user_answers
-                        }
-                        
-                        # Save results
-                        st.session_state.user_manager.save_test_results(
-                            user_id=st.session_state.current_user_id,
-                            test_id=test_id,
-                            results=st.session_state.test_results
-                        )
-                        
-                        # Add timestamp to results
-                        st.session_state.test_results["timestamp"] = pd.Timestamp.now().isoformat()
-                        
-                        # Update analytics
-                        st.session_state.analytics.process_test_results(
-                            user_id=st.session_state.current_user_id,
-                            test_results=st.session_state.test_results
-                        )
-                        
-                        st.session_state.test_in_progress = False
-                        st.success("Test completed! View your results below.")
+                    elif still_generating:
+                        st.session_state.awaiting_question = True
                         st.rerun()
+                    else:
+                        finish_test = True
             
             with col3:
                 if st.button("Finish Test"):
                     st.session_state.test_in_progress = False
+                    st.session_state.awaiting_question = False
                     st.rerun()
+            
+            if finish_test:
+                # Finish test
+                test_id = st.session_state.current_test_id
+                
+                # Calculate results
+                total_questions = len(questions)
+                correct_answers = sum(answer["is_correct"] for answer in st.session_state.user_answers)
+                score = (correct_answers / total_questions) * 100
+                
+                st.session_state.test_results = {
+                    "test_id": test_id,
+                    "test_name": st.session_state.current_test["test_name"],
+                    "total_questions": total_questions,
+                    "correct_answers": correct_answers,
+                    "score": score,
+                    "answers": st.session_state.user_answers,
+                    "variant_seed": variant.seed if variant is not None else None,
+                    "subject": st.session_state.current_test["subject"],
+                    "topics": st.session_state.current_test["topics"],
+                    "difficulty": st.session_state.current_test["difficulty"]
+                }
+                
+                # Save results
+                st.session_state.user_manager.save_test_results(
+                    user_id=st.session_state.current_user_id,
+                    test_id=test_id,
+                    results=st.session_state.test_results
+                )
+                
+                # answers calibrate the difficulty of the stored questions for adaptive tests;
+                # the variant holds the questions as they were when the attempt started
+                answered = variant.questions if variant is not None else questions
+                st.session_state.mcq_generator.question_bank.record_responses(
+                    [((answered if answer["question_index"] < len(answered) else questions)[answer["question_index"]],
+                      answer["is_correct"])
+                     for answer in st.session_state.user_answers],
+                    st.session_state.current_user_id
+                )
+                # observed correctness also checks the difficulty labels of new questions
+                st.session_state.mcq_generator.difficulty_estimator.record_answers(
+                    st.session_state.user_answers
+                )
+                
+                # Add timestamp to results
+                st.session_state.test_results["timestamp"] = pd.Timestamp.now().isoformat()
+                
+                # Update analytics
+                st.session_state.analytics.process_test_results(
+                    user_id=st.session_state.current_user_id,
+                    test_results=st.session_state.test_results
+                )
+                
+                # start generating the most likely next tests while the user reads the results
+                # (mixed-subject diagnostics have no single subject to predict from)
+                predictions = {}
+                if not st.session_state.current_test.get("sections"):
+                    _, weaknesses = st.session_state.analytics.get_strengths_and_weaknesses(
+                        st.session_state.current_user_id
+                    )
+                    predictions = st.session_state.prefetch_manager.predict(
+                        st.session_state.current_test["subject"],
+                        st.session_state.current_test["topics"],
+                        st.session_state.current_test["difficulty"],
+                        score / 100,
+                        weak_topic_names(weaknesses),
+                        num_questions=min(50, max(5, total_questions))
+                    )
+                for request in predictions.values():
+                    st.session_state.prefetch_manager.schedule(st.session_state.current_user_id, request)
+                st.session_state.practice_request = predictions.get("weak_areas")
+                
+                st.session_state.test_in_progress = False
+                st.success("Test completed! View your results below.")
+                st.rerun()
                     
             # Display progress bar
             st.progress((st.session_state.question_index + 1) / len(questions))
@@ -400,6 +754,53 @@ elif st.session_state.page == "Take Test":
                     else:
                         st.error("Incorrect")
             
+            practice_request = st.session_state.practice_request
+            if practice_request and st.button("🎯 Practice weak areas"):
+                practice_subject, practice_topics, practice_difficulty, practice_count = practice_request
+                questions = st.session_state.prefetch_manager.take(
+                    st.session_state.current_user_id, *practice_request
+                )
+                user_manager = st.session_state.user_manager
+                practice_test = {}
+                test_saved = threading.Event()
+                
+                def upgrade_practice_test(late_questions):
+                    # AI questions that miss the deadline replace the locally filled ones
+                    # and complete the test where the fill came up short
+                    if test_saved.wait(timeout=60) and practice_test.get("id"):
+                        return user_manager.upgrade_questions(practice_test["id"], late_questions,
+                                                              num_questions=practice_count)
+                    return [], []
+                
+                if not questions:
+                    with st.spinner("🤖 Generating practice questions..."):
+                        questions = st.session_state.mcq_generator.generate_questions(
+                            practice_subject, practice_topics, practice_difficulty, practice_count,
+                            user_id=st.session_state.current_user_id,
+                            deadline=PRACTICE_DEADLINE_SECONDS,
+                            on_late_questions=upgrade_practice_test
+                        )
+                
+                if questions:
+                    test_name = f"Practice: {', '.join(practice_topics)}"
+                    practice_test["id"] = user_manager.create_test(
+                        user_id=st.session_state.current_user_id,
+                        test_name=test_name,
+                        subject=practice_subject,
+                        topics=practice_topics,
+                        questions=questions,
+                        difficulty=practice_difficulty
+                    )
+                    st.session_state.practice_request = None
+                    if len(questions) < practice_count:
+                        st.success(f"✅ '{test_name}' is ready with {len(questions)} questions, more are added "
+                                   f"as they are generated. Select it above to start.")
+                    else:
+                        st.success(f"✅ '{test_name}' is ready with {len(questions)} questions. Select it above to start.")
+                else:
+                    st.error("❌ No practice questions could be generated in time. Please try again.")
+                test_saved.set()
+            
             if st.button("Take Another Test"):
                 st.session_state.test_results = None
                 st.rerun()
@@ -488,15 +889,18 @@ elif st.session_state.page == "View Analytics":
             topic_performance = {}
             
             for result in user_results:
-                subject = result.get('subject', 'General')
-                topics = result.get('topics', ['General'])
-                score = result['score']
-                
-                if subject not in subject_performance:
-                    subject_performance[subject] = []
-                subject_performance[subject].append(score)
+                # a mixed test counts once for each subject and topic its answers cover
+                for subject, score in score_by_answer(result, 'subject', result.get('subject', 'General')).items():
+                    if subject not in subject_performance:
+                        subject_performance[subject] = []
+                    subject_performance[subject].append(score)
                 
-                for topic in topics:
+                tagged_topics = score_by_answer(result, 'topic', None)
+                untagged_score = tagged_topics.pop(None, None)
+                if untagged_score is not None:
+                    for topic in result.get('topics', ['General']):
+                        tagged_topics.setdefault(topic, untagged_score)
+                for topic, score in tagged_topics.items():
                     if topic not in topic_performance:
                         topic_performance[topic] = []
                     topic_performance[topic].append(score)
@@ -573,12 +977,10 @@ elif st.session_state.page == "View Analytics":
             
             difficulty_performance = {}
             for result in user_results:
-                difficulty = result.get('difficulty', 'Medium')
-                score = result['score']
-                
-                if difficulty not in difficulty_performance:
-                    difficulty_performance[difficulty] = []
-                difficulty_performance[difficulty].append(score)
+                for difficulty, score in score_by_answer(result, 'difficulty', result.get('difficulty', 'Medium')).items():
+                    if difficulty not in difficulty_performance:
+                        difficulty_performance[difficulty] = []
+                    difficulty_performance[difficulty].append(score)
             
             if difficulty_performance:
                 # Order difficulties logically
@@ -0,0 +1,236 @@
+import re
+import threading
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokenize(text):
+    return [token for token in _TOKEN_RE.findall(str(text).lower()) if token not in ENGLISH_STOP_WORDS]
+
+
+def _question_key(question):
+    return " ".join(str(question.get('question', '')).lower().split())
+
+
+class _Postings:
+    """
+    Growable arrays of the documents a term occurs in and its frequency in each.
+    """
+
+    def __init__(self):
+        self.docs = np.empty(4, dtype=np.int32)
+        self.freqs = np.empty(4, dtype=np.float32)
+        self.size = 0
+
+    def append(self, doc, freq):
+        if self.size == len(self.docs):
+            # double the capacity so appends stay amortized O(1)
+            self.docs = np.resize(self.docs, 2 * self.size)
+            self.freqs = np.resize(self.freqs, 2 * self.size)
+        self.docs[self.size] = doc
+        self.freqs[self.size] = freq
+        self.size += 1
+
+
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75):
+        """
+        Initialize an incremental BM25 inverted index over stored questions.
+
+        Each question and its options form one document. Postings are numpy
+        arrays that grow in place, so adding questions never rebuilds the
+        index, and a query only touches the postings of its own terms.
+
+        Args:
+            k1 (float): Term frequency saturation
+            b (float): Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+
+        self.postings = {}  # term -> _Postings
+        self.questions = []  # doc id -> question dictionary
+        self.keys = {}  # normalized question text -> doc id
+        self.lengths = np.empty(1024, dtype=np.float32)
+        self.subjects = np.empty(1024, dtype=np.int16)
+        self.difficulties = np.empty(1024, dtype=np.int8)
+        self.codes = {'subject': {}, 'difficulty': {}}
+        self.total_length = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.questions)
+
+    def _code(self, kind, value):
+        return self.codes[kind].setdefault(value, len(self.codes[kind]))
+
+    def add_questions(self, questions, subject):
+        """
+        Add questions to the index, skipping ones it already holds.
+
+        Args:
+            questions (list): List of question dictionaries
+            subject (str): Subject of questions without their own 'subject' tag
+
+        Returns:
+            int: Number of questions added
+        """
+        added = 0
+        with self.lock:
+            for question in questions:
+                key = _question_key(question)
+                if not key or key in self.keys or 'options' not in question:
+                    continue
+
+                doc = len(self.questions)
+                if doc == len(self.lengths):
+                    self.lengths = np.resize(self.lengths, 2 * doc)
+                    self.subjects = np.resize(self.subjects, 2 * doc)
+                    self.difficulties = np.resize(self.difficulties, 2 * doc)
+
+                tokens = _tokenize(" ".join([str(question['question'])] + [str(o) for o in question['options']]))
+                counts = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    postings = self.postings.get(token)
+                    if postings is None:
+                        postings = self.postings[token] = _Postings()
+                    postings.append(doc, count)
+
+                self.keys[key] = doc
+                self.questions.append({k: question[k] for k in ('question', 'options', 'correct_answer', 'difficulty')
+                                       if k in question})
+                self.lengths[doc] = len(tokens)
+                self.subjects[doc] = self._code('subject', question.get('subject') or subject)
+                self.difficulties[doc] = self._code('difficulty', question.get('difficulty'))
+                self.total_length += len(tokens)
+                added += 1
+        return added
+
+    def add_test(self, test):
+        """
+        Add the questions of one stored test.
+
+        Args:
+            test (dict): Test data (as stored by UserManager)
+        """
+        return self.add_questions(test.get('questions', []), test.get('subject', 'General'))
+
+    def add_tests(self, tests):
+        """
+        Add the questions of stored tests (e.g. UserManager.tests).
+
+        Args:
+            tests (dict): Dictionary of test_id -> test data
+        """
+        return sum(self.add_test(test) for test in tests.values())
+
+    def search(self, query, subject=None, difficulty=None, k=10, min_match=0.0):
+        """
+        Find the stored questions that best match a query.
+
+        Scores are divided by the score a document containing every query term
+        once would get, so min_match is comparable across queries.
+
+        Args:
+            query (str): Free-text query (e.g. a custom description)
+            subject (str, optional): Only return questions of this subject
+            difficulty (str, optional): Only return questions of this difficulty
+            k (int): Maximum number of results
+            min_match (float): Smallest normalized score returned
+
+        Returns:
+            list: (question dictionary copy, normalized score) tuples, best first
+        """
+        terms = list(dict.fromkeys(_tokenize(query)))
+        with self.lock:
+            count = len(self.questions)
+            if not terms or not count:
+                return []
+
+            filters = []
+            for kind, value, values in (('subject', subject, self.subjects), ('difficulty', difficulty, self.difficulties)):
+                if value is None:
+                    continue
+                code = self.codes[kind].get(value)
+                if code is None:
+                    return []
+                filters.append((values, code))
+
+            average_length = max(self.total_length / count, 1e-6)
+            scores = np.zeros(count, dtype=np.float32)
+            best_possible = 0.0
+            for term in terms:
+                postings = self.postings.get(term)
+                frequency = postings.size if postings else 0
+                idf = np.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+                best_possible += idf
+                if not frequency:
+                    continue
+                docs = postings.docs[:postings.size]
+                freqs = postings.freqs[:postings.size]
+                norms = self.k1 * (1 - self.b + self.b * self.lengths[docs] / average_length)
+                # each doc appears once in a term's postings, so plain fancy-index addition is safe
+                scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norms)
+
+            # a term occurring once in an average-length document scores exactly its idf
+            scores /= best_possible
+            candidates = np.flatnonzero(scores > max(min_match, 0.0))
+            for values, code in filters:
+                candidates = candidates[values[candidates] == code]
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [(dict(self.questions[doc]), float(scores[doc])) for doc in candidates]
+
+
+_shared_index = None
+_shared_index_lock = threading.Lock()
+
+
+def get_bm25_index():
+    """
+    Get the process-wide BM25 index shared by all sessions.
+
+    Returns:
+        BM25Index: The shared index
+    """
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            _shared_index = BM25Index()
+        return _shared_index
+
+
+if __name__ == "__main__":
+    # benchmark: query latency over a large synthetic corpus
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(50000)] + ["subnetting", "cidr", "netmask", "routing", "ipv4"]
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    index = BM25Index()
+
+    size = 1000000
+    start = time.perf_counter()
+    words = rng.choice(len(vocabulary), size=(size, 16), p=weights)
+    for i in range(size):
+        row = [vocabulary[w] for w in words[i]]
+        index.add_questions([{
+            'question': f"q{i} " + " ".join(row[:10]),
+            'options': row[10:14],
+            'correct_answer': row[10],
+            'difficulty': ["Easy", "Medium", "Hard"][i % 3]
+        }], "Computer Science")
+    print(f"indexed {len(index)} questions in {time.perf_counter() - start:.1f}s")
+
+    for query in ["subnetting and CIDR", "term1 term2 term3 routing", "netmask for an ipv4 network"]:
+        start = time.perf_counter()
+        for _ in range(20):
+            results = index.search(query, subject="Computer Science", difficulty="Medium", k=10)
+        elapsed = (time.perf_counter() - start) / 20
+        print(f"{query!r}: {len(results)} results in {elapsed * 1000:.1f}ms, best {results[0][1]:.2f}")
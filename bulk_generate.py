@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from llm_backend import LLMBackend, get_default_backend
+from question_bank import QuestionBank, get_question_bank
+
+# generator of the current worker process, created by _init_worker
+_worker_generator = None
+
+
+class SharedRateLimiter:
+    def __init__(self, calls_per_second):
+        """
+        Initialize a rate limit shared by all worker processes.
+
+        Every LLM call reserves the next free time slot in shared memory, so
+        the calls of all workers together never exceed the rate.
+
+        Args:
+            calls_per_second (float): Maximum LLM calls per second, or 0 for no limit
+        """
+        self.interval = 1.0 / calls_per_second if calls_per_second > 0 else 0.0
+        self.next_slot = multiprocessing.Value('d', 0.0)
+
+    def acquire(self):
+        """
+        Wait until this process may make its next call.
+        """
+        if not self.interval:
+            return
+        with self.next_slot.get_lock():
+            now = time.time()
+            slot = max(now, self.next_slot.value)
+            self.next_slot.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RateLimitedBackend(LLMBackend):
+    def __init__(self, backend, rate_limiter):
+        """
+        Wrap a backend so every attempt, retries included, goes through a rate limiter.
+
+        Args:
+            backend (LLMBackend): Backend making the actual calls
+            rate_limiter (SharedRateLimiter): Limiter shared by all workers
+        """
+        super().__init__(backend.timeout, backend.retry_policy, backend.circuit_breaker, backend.scheduler)
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.rate_limiter = rate_limiter
+
+    def _generate(self, prompt, max_tokens, temperature, timeout):
+        self.rate_limiter.acquire()
+        return self.backend._generate(prompt, max_tokens, temperature, timeout)
+
+    def _generate_stream(self, prompt, max_tokens, temperature, timeout):
+        self.rate_limiter.acquire()
+        return self.backend._generate_stream(prompt, max_tokens, temperature, timeout)
+
+
+def _init_worker(rate_limiter, tests):
+    """
+    Create the generator of a worker process.
+
+    Workers keep their question bank in memory only; the parent process adds
+    the generated questions to the shared bank, so the bank file has a single
+    writer.
+    """
+    global _worker_generator
+    from mcq_generator import MCQGenerator
+
+    bank = QuestionBank(bank_path=None, min_bucket_size=0)
+    bank.ingest_tests(tests)
+    _worker_generator = MCQGenerator(
+        backend=RateLimitedBackend(get_default_backend(), rate_limiter), question_bank=bank
+    )
+    _worker_generator.near_duplicate_index.index_tests(tests)
+
+
+def _run_job(job):
+    """
+    Generate the questions of one manifest entry in a worker process.
+
+    Returns:
+        dict: The job key, the questions and the generation time in seconds
+    """
+    start = time.perf_counter()
+    questions = _worker_generator.generate_questions(
+        subject=job['subject'],
+        topics=job['topics'],
+        difficulty=job['difficulty'],
+        num_questions=job['num_questions'],
+        content=job.get('content'),
+        custom_description=job['custom_description'],
+        user_id=job['owner'],
+        priority="bulk"
+    )
+    return {'key': job['key'], 'questions': questions, 'seconds': time.perf_counter() - start}
+
+
+def load_manifest(manifest_path):
+    """
+    Read a JSONL manifest with one test per line.
+
+    Each line needs 'subject', 'topics' and 'owner', and may set 'difficulty',
+    'num_questions', 'custom_description', 'content', 'test_name' and 'adaptive'.
+
+    Args:
+        manifest_path (str): Path of the manifest
+
+    Returns:
+        list: One job dictionary per line, keyed by the line's content so an edited
+            line is generated again and moving lines around is not
+    """
+    jobs = []
+    occurrences = defaultdict(int)
+    with open(manifest_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            digest = hashlib.sha1(json.dumps(entry, sort_keys=True).encode()).hexdigest()[:16]
+            # identical lines ask for one test each
+            occurrences[digest] += 1
+            topics = entry['topics']
+            if isinstance(topics, str):
+                topics = [topic.strip() for topic in topics.split(',') if topic.strip()]
+
+            jobs.append({
+                'key': digest if occurrences[digest] == 1 else f"{digest}-{occurrences[digest]}",
+                'subject': entry['subject'],
+                'topics': topics,
+                'difficulty': entry.get('difficulty', 'Medium'),
+                'num_questions': int(entry.get('num_questions', 10)),
+                'custom_description': entry.get('custom_description', ''),
+                'content': entry.get('content'),
+                'owner': entry['owner'],
+                'test_name': entry.get('test_name') or f"{entry['subject']} - {', '.join(topics)}",
+                'adaptive': entry.get('adaptive', True)
+            })
+    return jobs
+
+
+def load_checkpoint(checkpoint_path, tests=None):
+    """
+    Get the keys of the jobs finished by earlier runs.
+
+    Args:
+        checkpoint_path (str): JSONL file recording finished jobs
+        tests (dict, optional): Stored tests (test_id -> test data); a test carries the
+            key of the job that created it, so a run interrupted between storing the
+            test and writing the checkpoint does not create it again
+
+    Returns:
+        set: Keys of the finished jobs
+    """
+    done = {test['manifest_key'] for test in (tests or {}).values() if test.get('manifest_key')}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'r') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['key'])
+                except (ValueError, KeyError):
+                    # a line cut off by an interrupted run
+                    continue
+    return done
+
+
+def bulk_generate(manifest_path, checkpoint_path='data/bulk_checkpoint.jsonl', workers=4, calls_per_second=2.0):
+    """
+    Generate every test of a manifest in parallel and store it with UserManager.create_test.
+
+    Each test is stored together with the key of its job, and finished jobs are
+    also appended to the checkpoint file, so an interrupted run resumes with the
+    jobs that are left.
+
+    Args:
+        manifest_path (str): JSONL manifest of tests to generate
+        checkpoint_path (str): JSONL file recording finished jobs
+        workers (int): Number of worker processes
+        calls_per_second (float): Global limit on LLM calls, or 0 for no limit
+
+    Returns:
+        dict: Throughput summary
+    """
+    from topic_classifier import get_topic_classifier
+    from user_manager import UserManager
+
+    question_bank = get_question_bank()
+    # bulk tests get the same per-question topic tags as tests created in the app
+    user_manager = UserManager(topic_classifier=get_topic_classifier(question_bank))
+
+    jobs = load_manifest(manifest_path)
+    done = load_checkpoint(checkpoint_path, user_manager.tests)
+    pending = [job for job in jobs if job['key'] not in done]
+    jobs_by_key = {job['key']: job for job in pending}
+
+    summary = {'jobs': len(jobs), 'skipped': len(jobs) - len(pending), 'created': 0, 'failed': 0,
+               'questions': 0, 'job_seconds': []}
+    print(f"{len(pending)} of {len(jobs)} test(s) to generate ({summary['skipped']} already done)")
+
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(checkpoint_path) or '.', exist_ok=True)
+    executor = ProcessPoolExecutor(
+        max_workers=max(1, workers), initializer=_init_worker,
+        initargs=(SharedRateLimiter(calls_per_second), user_manager.tests)
+    )
+    try:
+        with open(checkpoint_path, 'a') as checkpoint:
+            futures = {executor.submit(_run_job, job): job['key'] for job in pending}
+            for future in as_completed(futures):
+                job = jobs_by_key[futures[future]]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error generating '{job['test_name']}': {e}")
+                    summary['failed'] += 1
+                    continue
+                if not result['questions']:
+                    print(f"No questions generated for '{job['test_name']}'")
+                    summary['failed'] += 1
+                    continue
+
+                test_id = user_manager.create_test(
+                    user_id=job['owner'],
+                    test_name=job['test_name'],
+                    subject=job['subject'],
+                    topics=job['topics'],
+                    questions=result['questions'],
+                    difficulty=job['difficulty'],
+                    adaptive=job['adaptive'],
+                    manifest_key=job['key']
+                )
+                question_bank.add_questions(job['subject'], job['topics'], result['questions'],
+                                            served_to=job['owner'])
+
+                checkpoint.write(json.dumps({'key': job['key'], 'test_id': test_id,
+                                             'questions': len(result['questions'])}) + "\n")
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+
+                summary['created'] += 1
+                summary['questions'] += len(result['questions'])
+                summary['job_seconds'].append(result['seconds'])
+                print(f"[{summary['created'] + summary['failed']}/{len(pending)}] '{job['test_name']}': "
+                      f"{len(result['questions'])} question(s) in {result['seconds']:.1f}s")
+    except KeyboardInterrupt:
+        print("Interrupted, finished tests are saved and the next run resumes from the checkpoint")
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        question_bank.save()
+        summary['elapsed'] = time.perf_counter() - start
+        print_summary(summary)
+
+    return summary
+
+
+def print_summary(summary):
+    """
+    Print the throughput of a bulk run.
+    """
+    elapsed = max(summary['elapsed'], 1e-9)
+    seconds = sorted(summary['job_seconds'])
+    print(f"\nCreated {summary['created']} test(s), {summary['failed']} failed, "
+          f"{summary['skipped']} skipped, {summary['questions']} question(s) in {elapsed:.1f}s")
+    print(f"Throughput: {summary['created'] / elapsed * 60:.1f} tests/min, "
+          f"{summary['questions'] / elapsed:.2f} questions/s")
+    if seconds:
+        p95 = seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))]
+        print(f"Per test: mean {sum(seconds) / len(seconds):.1f}s, p95 {p95:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate many tests from a JSONL manifest")
+    parser.add_argument("manifest", help="JSONL file with one test per line")
+    parser.add_argument("--checkpoint", default="data/bulk_checkpoint.jsonl",
+                        help="file recording finished tests, used to resume an interrupted run")
+    parser.add_argument("--workers", type=int, default=4, help="number of worker processes")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="maximum LLM calls per second across all workers (0 for no limit)")
+    args = parser.parse_args()
+
+    try:
+        bulk_generate(args.manifest, args.checkpoint, args.workers, args.rate)
+    except KeyboardInterrupt:
+        raise SystemExit(130)
@@ -0,0 +1,167 @@
+import re
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from content_processor import split_sentences
+
+_BLANK = "_____"
+
+
+class ClozeGenerator:
+    # how many of the most similar terms a distractor is drawn from, by difficulty;
+    # harder questions use the terms that are closest to the answer
+    distractor_pool_sizes = {
+        "Easy": 12,
+        "Medium": 6,
+        "Hard": 3
+    }
+
+    def __init__(self, keyword_engine, stop_words=None, min_sentence_words=6, max_sentence_words=60,
+                 keywords_per_sentence=3, seed=None):
+        """
+        Initialize the offline fill-in-the-blank question generator.
+
+        Sentences of the educational content become questions with one keyword
+        blanked out. Distractors are other terms of the same content that are
+        similar to the answer, both in the sentences they occur in and in their
+        spelling, so no LLM call is needed.
+
+        Args:
+            keyword_engine (KeywordEngine): Engine used to pick the answer terms
+            stop_words (set, optional): Words never used as answers or distractors
+            min_sentence_words (int): Shortest sentence turned into a question
+            max_sentence_words (int): Longest sentence turned into a question
+            keywords_per_sentence (int): Candidate answer terms considered per sentence
+            seed (int, optional): Seed for repeatable output
+        """
+        self.keyword_engine = keyword_engine
+        self.stop_words = set(stop_words or [])
+        self.min_sentence_words = min_sentence_words
+        self.max_sentence_words = max_sentence_words
+        self.keywords_per_sentence = keywords_per_sentence
+        self.rng = np.random.default_rng(seed)
+
+    def _candidate_sentences(self, content):
+        # repeated sentences would only produce repeated questions
+        sentences = dict.fromkeys(" ".join(sentence.split()) for sentence in split_sentences(content))
+        return [
+            sentence for sentence in sentences
+            if self.min_sentence_words <= len(sentence.split()) <= self.max_sentence_words
+        ]
+
+    def _term_similarity(self, sentences, terms):
+        """
+        Score every pair of terms by how similar they are, in one sparse pass.
+
+        Two signals are averaged: the cosine similarity of the sentences the
+        terms occur in (terms used in the same context) and of their character
+        n-grams (terms that look alike).
+
+        Returns:
+            numpy.ndarray: Symmetric terms x terms similarity matrix with a zero diagonal
+        """
+        occurrences = CountVectorizer(vocabulary=terms, token_pattern=r"(?u)\b[a-zA-Z][a-zA-Z0-9]+\b",
+                                      binary=True, dtype=np.float32).fit_transform(sentences)
+        context = normalize(occurrences.T.tocsr())
+        spelling = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), dtype=np.float32).fit_transform(terms)
+
+        similarity = 0.5 * (context @ context.T).toarray() + 0.5 * (spelling @ spelling.T).toarray()
+        np.fill_diagonal(similarity, 0)
+        return similarity
+
+    def generate(self, content, difficulty, num_questions):
+        """
+        Generate fill-in-the-blank MCQs from educational content.
+
+        Args:
+            content (str): Educational content
+            difficulty (str): Difficulty level (Easy, Medium, Hard)
+            num_questions (int): Maximum number of questions
+
+        Returns:
+            list: A list of question dictionaries (fewer than requested if the
+                content is too short)
+        """
+        sentences = self._candidate_sentences(content or "")
+        if not sentences:
+            return []
+
+        keywords = self.keyword_engine.top_keywords_batch(sentences, self.keywords_per_sentence)
+
+        # the answer must be a whole word of its sentence and not a stop word
+        blanks = []
+        for sentence, sentence_keywords in zip(sentences, keywords):
+            for keyword in sentence_keywords:
+                if keyword in self.stop_words or keyword.isdigit():
+                    continue
+                pattern = re.compile(rf"\b{re.escape(keyword)}\b", re.IGNORECASE)
+                if pattern.search(sentence):
+                    blanks.append((sentence, pattern, keyword.lower()))
+                    break
+
+        terms = sorted({answer for _, _, answer in blanks})
+        if len(terms) < 4:
+            # not enough distinct terms for three distractors
+            return []
+        term_ids = {term: i for i, term in enumerate(terms)}
+        similarity = self._term_similarity(sentences, terms)
+
+        # most similar terms first; terms that contain each other are too close to be wrong
+        ranked = np.argsort(-similarity, axis=1, kind='stable')
+        pool_size = self.distractor_pool_sizes.get(difficulty, self.distractor_pool_sizes["Medium"])
+
+        order = self.rng.permutation(len(blanks))
+        questions = []
+        for position in order:
+            if len(questions) >= num_questions:
+                break
+            sentence, pattern, answer = blanks[position]
+
+            pool = [
+                terms[i] for i in ranked[term_ids[answer]][:pool_size + 3]
+                if answer not in terms[i] and terms[i] not in answer
+            ][:max(pool_size, 3)]
+            if len(pool) < 3:
+                continue
+            distractors = [pool[i] for i in self.rng.choice(len(pool), 3, replace=False)]
+
+            options = [answer] + distractors
+            options = [options[i] for i in self.rng.permutation(4)]
+            question = {
+                # every occurrence is blanked, so the sentence does not give the answer away
+                "question": f"Fill in the blank: {pattern.sub(_BLANK, sentence)}",
+                "options": options,
+                "correct_answer": answer,
+                "difficulty": difficulty,
+                "source": "cloze"
+            }
+            questions.append(question)
+
+        return questions
+
+
+if __name__ == "__main__":
+    # benchmark: questions per second on one core
+    from keyword_engine import KeywordEngine
+
+    facts = [
+        "Photosynthesis converts light energy into chemical energy stored in glucose.",
+        "Mitochondria release energy from glucose through cellular respiration in the cell.",
+        "Chlorophyll absorbs red and blue light and reflects green light in plant leaves.",
+        "The nucleus stores the genetic material of the cell as chromosomes made of DNA.",
+        "Ribosomes assemble proteins from amino acids using instructions carried by messenger RNA.",
+        "Osmosis moves water across a membrane from low to high solute concentration.",
+        "Enzymes lower the activation energy of reactions without being consumed themselves.",
+        "The cell membrane controls which substances enter and leave the cytoplasm.",
+    ]
+    generator = ClozeGenerator(KeywordEngine(model_path='/nonexistent/keyword_vectorizer.pkl'), seed=0)
+    text = " ".join(f"In lesson {i + 1}, {fact[0].lower()}{fact[1:]}" for i in range(250) for fact in facts)
+
+    start = time.perf_counter()
+    questions = generator.generate(text, "Medium", 2000)
+    elapsed = time.perf_counter() - start
+    print(f"{len(questions)} questions in {elapsed:.2f}s ({len(questions) / elapsed:.0f} questions/s)")
+    print(questions[0])
@@ -0,0 +1,246 @@
+import math
+import re
+import time
+
+import numpy as np
+from nltk.tokenize import sent_tokenize
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimate the number of LLM tokens in a text (about 4 characters per token).
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return math.ceil(len(text or "") / 4)
+
+
+def split_sentences(text):
+    """
+    Split text into sentences, falling back to a simple regex if the NLTK
+    tokenizer data is not available.
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        list: List of sentences
+    """
+    try:
+        sentences = sent_tokenize(text)
+    except LookupError:
+        sentences = re.split(r"(?<=[.!?])\s+", text)
+    return [sentence.strip() for sentence in sentences if sentence.strip()]
+
+
+class ContentSelector:
+    def __init__(self, token_budget=800, chunk_tokens=80):
+        """
+        Initialize the educational content pre-processor.
+
+        Long content is split into sentence chunks, the chunks are ranked by
+        TF-IDF similarity to the topics and custom description, and only the
+        most relevant chunks are kept within the token budget.
+
+        Args:
+            token_budget (int): Maximum estimated tokens of content per prompt
+            chunk_tokens (int): Target size of a chunk in estimated tokens
+        """
+        self.token_budget = token_budget
+        self.chunk_tokens = chunk_tokens
+
+    def _split_long_sentence(self, sentence):
+        """
+        Split a sentence longer than chunk_tokens into pieces by words.
+
+        Text without sentence punctuation (e.g. bullet lists) is one long
+        "sentence", and a chunk larger than the token budget would never be selected.
+        """
+        max_chars = self.chunk_tokens * 4
+        pieces = []
+        current = []
+        current_chars = 0
+        for word in sentence.split():
+            # a single word longer than a chunk (e.g. an encoded blob) is cut by characters
+            for start in range(0, len(word), max_chars):
+                part = word[start:start + max_chars]
+                if current and current_chars + 1 + len(part) > max_chars:
+                    pieces.append(" ".join(current))
+                    current = []
+                    current_chars = 0
+                current.append(part)
+                current_chars += len(part) + (1 if current_chars else 0)
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+    def make_chunks(self, text):
+        """
+        Group consecutive sentences into chunks of about chunk_tokens tokens.
+
+        Sentences longer than a chunk are split by words first.
+
+        Args:
+            text (str): Content to split
+
+        Returns:
+            list: List of chunk strings in their original order
+        """
+        sentences = []
+        for sentence in split_sentences(text):
+            if estimate_tokens(sentence) > self.chunk_tokens:
+                sentences.extend(self._split_long_sentence(sentence))
+            else:
+                sentences.append(sentence)
+
+        chunks = []
+        current = []
+        current_tokens = 0
+        for sentence in sentences:
+            sentence_tokens = estimate_tokens(sentence)
+            if current and current_tokens + sentence_tokens > self.chunk_tokens:
+                chunks.append(" ".join(current))
+                current = []
+                current_tokens = 0
+            current.append(sentence)
+            current_tokens += sentence_tokens
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+
+    def rank_chunks(self, chunks, topics, custom_description=""):
+        """
+        Score chunks by TF-IDF cosine similarity to the topics and custom description.
+
+        Args:
+            chunks (list): List of chunk strings
+            topics (list): List of topics
+            custom_description (str): Custom user description
+
+        Returns:
+            numpy.ndarray: One relevance score per chunk
+        """
+        query = " ".join(list(topics or []) + [custom_description or ""])
+        try:
+            vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True)
+            matrix = vectorizer.fit_transform(chunks + [query])
+        except ValueError:
+            # only stop words or empty text, so nothing can be ranked
+            return np.zeros(len(chunks))
+
+        # rows are l2-normalized, so the dot product is the cosine similarity
+        return (matrix[:-1] @ matrix[-1].T).toarray().ravel()
+
+    def _ranked_chunks(self, text, topics, custom_description):
+        chunks = self.make_chunks(text)
+        scores = self.rank_chunks(chunks, topics, custom_description)
+        # stable sort keeps the original order between equally relevant chunks
+        order = np.argsort(-scores, kind='stable')
+        if scores.max(initial=0) > 0:
+            # chunks that share no terms with the topics only cost tokens
+            order = order[scores[order] > 0]
+        return chunks, order
+
+    def select(self, text, topics, custom_description="", token_budget=None):
+        """
+        Keep only the most relevant parts of the content within the token budget.
+
+        Args:
+            text (str): Educational content
+            topics (list): List of topics
+            custom_description (str): Custom user description
+            token_budget (int, optional): Overrides the default token budget
+
+        Returns:
+            str: Selected content, in its original order
+        """
+        budget = token_budget or self.token_budget
+        if not text or estimate_tokens(text) <= budget:
+            return text
+
+        chunks, order = self._ranked_chunks(text, topics, custom_description)
+        selected = []
+        used_tokens = 0
+        for position in order:
+            chunk_tokens = estimate_tokens(chunks[position])
+            if used_tokens + chunk_tokens > budget:
+                continue
+            selected.append(position)
+            used_tokens += chunk_tokens
+
+        return " ".join(chunks[position] for position in sorted(selected))
+
+    def split_for_parallel(self, text, topics, custom_description="", parts=2, token_budget=None):
+        """
+        Spread the most relevant content over several prompts, one per parallel call.
+
+        Chunks are dealt out in order of relevance, so every part gets some of
+        the best material and each part stays within the token budget.
+
+        Args:
+            text (str): Educational content
+            topics (list): List of topics
+            custom_description (str): Custom user description
+            parts (int): Number of parallel calls
+            token_budget (int, optional): Overrides the default token budget per part
+
+        Returns:
+            list: One content string per part
+        """
+        budget = token_budget or self.token_budget
+        if not text or parts <= 1 or estimate_tokens(text) <= budget:
+            return [self.select(text, topics, custom_description, budget)] * max(parts, 1)
+
+        chunks, order = self._ranked_chunks(text, topics, custom_description)
+        selected = [[] for _ in range(parts)]
+        used_tokens = [0] * parts
+        part = 0
+        for position in order:
+            chunk_tokens = estimate_tokens(chunks[position])
+            # give the chunk to the next part that still has room for it
+            for offset in range(parts):
+                candidate = (part + offset) % parts
+                if used_tokens[candidate] + chunk_tokens <= budget:
+                    selected[candidate].append(position)
+                    used_tokens[candidate] += chunk_tokens
+                    part = (candidate + 1) % parts
+                    break
+
+        return [" ".join(chunks[position] for position in sorted(positions)) for positions in selected]
+
+
+if __name__ == "__main__":
+    # benchmark: prompt size and selection latency against input length
+    import random
+
+    random.seed(0)
+    relevant = [
+        "A subnet mask divides an IP address into a network part and a host part.",
+        "CIDR notation writes the prefix length after a slash, such as /24.",
+        "Routers forward packets between networks using routing tables.",
+    ]
+    filler = [
+        "The committee met on Tuesday to discuss the annual budget.",
+        "Many painters of the period preferred landscapes to portraits.",
+        "The recipe calls for two cups of flour and a pinch of salt.",
+        "Rainfall in the region varies considerably between seasons.",
+    ]
+
+    selector = ContentSelector()
+    print(f"{'input words':>12} {'input tokens':>13} {'content tokens in prompt':>25} {'select ms':>10}")
+    for sentence_count in [20, 200, 2000, 20000]:
+        sentences = [random.choice(filler) for _ in range(sentence_count)]
+        for i in range(max(1, sentence_count // 20)):
+            sentences[random.randrange(sentence_count)] = random.choice(relevant)
+        text = " ".join(sentences)
+
+        start = time.perf_counter()
+        selected = selector.select(text, ["Networking"], "subnetting and CIDR")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{len(text.split()):>12} {estimate_tokens(text):>13} {estimate_tokens(selected):>25} {elapsed_ms:>10.1f}")
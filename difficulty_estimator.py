@@ -0,0 +1,296 @@
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9']*")
+_SENTENCE_RE = re.compile(r"[.!?]+")
+_VOWEL_GROUP_RE = re.compile(r"[aeiouy]+", re.IGNORECASE)
+_OPTION_WORD_RE = re.compile(r"[a-z]+")
+
+DIFFICULTY_LEVELS = ["Easy", "Medium", "Hard"]
+
+
+def _normalize_text(text):
+    return " ".join(str(text).lower().split())
+
+
+def _distinguishing_words(options):
+    """
+    Reduce each option to the words that set it apart from the other options.
+
+    Words every option shares (a unit such as "square units", a common stem)
+    and numbers say nothing about how close the distractors are, so
+    "15 square units" and "8 square units" have nothing left to compare.
+    """
+    words = [_OPTION_WORD_RE.findall(str(option).lower()) for option in options]
+    shared = set.intersection(*(set(option_words) for option_words in words)) if len(words) > 1 else set()
+    return [" ".join(word for word in option_words if word not in shared) for option_words in words]
+
+
+class DifficultyEstimator:
+    # score bands of each label; scores run from 0 (trivial) to 1 (hard)
+    difficulty_bands = {
+        "Easy": (0.0, 0.35),
+        "Medium": (0.35, 0.6),
+        "Hard": (0.6, 1.0)
+    }
+
+    # weights of the text features in the score before any answers are observed
+    feature_weights = {
+        "rarity": 0.45,
+        "readability": 0.25,
+        "option_similarity": 0.3
+    }
+
+    def __init__(self, keyword_engine=None, results_path='data/results.json', prior_weight=5, margin=0.1):
+        """
+        Initialize a local estimator that checks the difficulty labels of questions.
+
+        A batch of questions is scored in a few sparse-matrix passes from term
+        rarity (corpus IDF of the question's words), readability (Flesch-Kincaid
+        grade), and how alike the options are. Each question's score depends on
+        that question alone, not on the rest of the batch. Once a question has
+        been answered, its observed rate of wrong answers takes over from the
+        text features, weighted by the number of answers.
+
+        Args:
+            keyword_engine (KeywordEngine, optional): Engine whose corpus IDF weights
+                measure term rarity; without one rarity stays neutral
+            results_path (str): Stored test results the observed correctness is read from
+            prior_weight (int): Number of answers the text features are worth
+            margin (float): How far outside its label's band a score must be to disagree
+        """
+        self.keyword_engine = keyword_engine
+        self.results_path = results_path
+        self.prior_weight = prior_weight
+        self.margin = margin
+
+        self.observed = {}  # normalized question text -> [attempts, correct]
+        self.observed_loaded = False
+        self.lock = threading.Lock()
+        self.stats = {'checked': 0, 'relabelled': 0, 'filtered': 0}
+
+    def _load_observed(self):
+        with self.lock:
+            if self.observed_loaded:
+                return
+            self.observed_loaded = True
+        try:
+            if self.results_path and os.path.exists(self.results_path):
+                with open(self.results_path, 'r') as f:
+                    content = f.read().strip()
+                if content:
+                    self.record_results(json.loads(content))
+        except Exception as e:
+            print(f"Error loading observed results: {e}")
+
+    def record_results(self, results):
+        """
+        Add answered questions to the observed correctness rates.
+
+        Args:
+            results (dict): Stored results, user_id -> test_id -> test results
+                (the structure of UserManager.results)
+        """
+        with self.lock:
+            for user_results in results.values():
+                for test_results in user_results.values():
+                    self._record_answers(test_results.get('answers', []))
+
+    def record_answers(self, answers):
+        """
+        Add the answers of one finished test to the observed correctness rates.
+
+        Args:
+            answers (list): Answer dictionaries with 'question' and 'is_correct'
+        """
+        with self.lock:
+            self._record_answers(answers)
+
+    def _record_answers(self, answers):
+        for answer in answers:
+            if 'question' not in answer:
+                continue
+            counts = self.observed.setdefault(_normalize_text(answer['question']), [0, 0])
+            counts[0] += 1
+            counts[1] += 1 if answer.get('is_correct', False) else 0
+
+    def _rarity(self, texts):
+        """
+        Mean IDF of each text's words, scaled to 0-1 by the vocabulary's IDF range.
+        """
+        vectorizer = self.keyword_engine.corpus_vectorizer() if self.keyword_engine else None
+        if vectorizer is None:
+            # IDF fitted on the batch would make a question's score depend on its batch
+            return np.full(len(texts), 0.5)
+
+        present = vectorizer.transform(texts)
+        present.data[:] = 1.0
+        counts = np.asarray(present.sum(axis=1)).ravel()
+        idf = vectorizer.idf_
+        spread = max(float(idf.max() - idf.min()), 1e-6)
+        mean_idf = np.divide(present @ idf, counts, out=np.full(len(texts), idf.min()), where=counts > 0)
+        return np.clip((mean_idf - idf.min()) / spread, 0.0, 1.0)
+
+    def _readability(self, texts):
+        """
+        Flesch-Kincaid grade of each text, scaled so grade 4 is 0 and grade 16 is 1.
+        """
+        words = np.array([len(_WORD_RE.findall(text)) for text in texts], dtype=float)
+        sentences = np.array([max(1, len(_SENTENCE_RE.findall(text))) for text in texts], dtype=float)
+        syllables = np.array([len(_VOWEL_GROUP_RE.findall(text)) for text in texts], dtype=float)
+        words = np.maximum(words, 1.0)
+        grade = 0.39 * words / sentences + 11.8 * np.maximum(syllables, words) / words - 15.59
+        return np.clip((grade - 4.0) / 12.0, 0.0, 1.0)
+
+    def _option_similarity(self, questions):
+        """
+        Mean pairwise cosine similarity of each question's options (character n-grams).
+
+        Options that look alike are harder to tell apart. Only the words that
+        differ between a question's options are compared (see
+        _distinguishing_words), with plain term frequencies so the score does
+        not depend on the batch. The pairwise mean of unit vectors follows from
+        the length of their sum, so every question is scored by one sparse product.
+        """
+        options = [option for question in questions
+                   for option in _distinguishing_words(question.get('options', []))]
+        sizes = np.array([len(question.get('options', [])) for question in questions])
+        if not any(options):
+            return np.zeros(len(questions))
+
+        # options repeat a lot across a bank, so each distinct option is vectorized once
+        distinct = {}
+        rows = np.array([distinct.setdefault(option, len(distinct)) for option in options])
+        try:
+            vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), use_idf=False, dtype=np.float32)
+            vectors = vectorizer.fit_transform(list(distinct))[rows]
+        except ValueError:
+            return np.zeros(len(questions))
+        owners = np.repeat(np.arange(len(questions)), sizes)
+        membership = csr_matrix(
+            (np.ones(len(options), dtype=np.float32), (owners, np.arange(len(options)))),
+            shape=(len(questions), len(options))
+        )
+        sums = membership @ vectors
+        squared_norms = np.asarray(sums.multiply(sums).sum(axis=1)).ravel()
+        # |sum|^2 = (options with any words, unit vectors) + twice the sum over distinct pairs
+        nonempty = membership @ (np.asarray(vectors.getnnz(axis=1)) > 0).astype(np.float32)
+        pairs = sizes * (sizes - 1)
+        similarity = np.divide(squared_norms - nonempty, pairs, out=np.zeros(len(questions)), where=pairs > 0)
+        # near-identical options are rare, so 0.6 already counts as maximally alike
+        return np.clip(similarity / 0.6, 0.0, 1.0)
+
+    def estimate(self, questions):
+        """
+        Score the difficulty of a batch of questions.
+
+        Args:
+            questions (list): List of question dictionaries
+
+        Returns:
+            numpy.ndarray: One score per question, from 0 (trivial) to 1 (hard)
+        """
+        if not questions:
+            return np.zeros(0)
+        self._load_observed()
+
+        texts = [str(question.get('question', '')) for question in questions]
+        scores = (
+            self.feature_weights['rarity'] * self._rarity(texts)
+            + self.feature_weights['readability'] * self._readability(texts)
+            + self.feature_weights['option_similarity'] * self._option_similarity(questions)
+        )
+
+        with self.lock:
+            counts = np.array([self.observed.get(_normalize_text(text), (0, 0)) for text in texts], dtype=float)
+        attempts, correct = counts[:, 0], counts[:, 1]
+        # observed share of wrong answers, pulled toward the text score by prior_weight answers
+        wrong_rate = 1.0 - (correct + 0.5) / (attempts + 1.0)
+        weight = attempts / (attempts + self.prior_weight)
+        return (1.0 - weight) * scores + weight * wrong_rate
+
+    def labels(self, scores):
+        """
+        Map scores to difficulty labels.
+        """
+        cuts = [self.difficulty_bands["Medium"][0], self.difficulty_bands["Hard"][0]]
+        return [DIFFICULTY_LEVELS[level] for level in np.searchsorted(cuts, scores, side='right')]
+
+    def check(self, questions, mode="relabel"):
+        """
+        Check the difficulty labels of a batch of questions against the estimate.
+
+        Args:
+            questions (list): List of question dictionaries
+            mode (str): "relabel" gives questions whose label disagrees the estimated
+                label, "filter" leaves them out
+
+        Returns:
+            tuple: (questions kept, with relabelled copies where the label was changed,
+                questions left out, relabelled to their estimated difficulty)
+        """
+        if not questions:
+            return [], []
+
+        scores = self.estimate(questions)
+        estimated = self.labels(scores)
+        kept = []
+        rejected = []
+        for question, score, label in zip(questions, scores, estimated):
+            low, high = self.difficulty_bands.get(question.get('difficulty'), (0.0, 1.0))
+            if low - self.margin <= score <= high + self.margin:
+                kept.append(question)
+                continue
+            relabelled = dict(question)
+            relabelled['difficulty'] = label
+            if mode == "filter":
+                rejected.append(relabelled)
+            else:
+                kept.append(relabelled)
+
+        with self.lock:
+            self.stats['checked'] += len(questions)
+            if mode == "filter":
+                self.stats['filtered'] += len(rejected)
+            else:
+                self.stats['relabelled'] += sum(1 for a, b in zip(questions, kept) if a is not b)
+        return kept, rejected
+
+    def get_stats(self):
+        """
+        Get the number of questions checked, relabelled and filtered.
+        """
+        with self.lock:
+            return dict(self.stats)
+
+
+if __name__ == "__main__":
+    # benchmark: questions per second on one core, over a bank-sized batch
+    stems = [
+        ("What is 2 + 2?", ["3", "4", "5", "6"], "Easy"),
+        ("Which colour is the sky on a clear day?", ["Blue", "Green", "Red", "Yellow"], "Hard"),
+        ("Which thermodynamic potential is minimized at equilibrium under constant temperature and pressure?",
+         ["Gibbs free energy", "Helmholtz free energy", "Internal energy", "Enthalpy"], "Medium"),
+        ("In asymptotic analysis, which recurrence characterizes the complexity of mergesort?",
+         ["T(n) = 2T(n/2) + O(n)", "T(n) = T(n/2) + O(1)", "T(n) = 2T(n/2) + O(1)", "T(n) = T(n-1) + O(n)"], "Hard"),
+    ]
+    bank = [
+        {'question': f"{stem} (variant {i})", 'options': options, 'correct_answer': options[0], 'difficulty': label}
+        for i in range(5000) for stem, options, label in stems
+    ]
+    estimator = DifficultyEstimator(results_path=None)
+
+    start = time.perf_counter()
+    kept, rejected = estimator.check(bank, mode="filter")
+    elapsed = time.perf_counter() - start
+    print(f"{len(bank)} questions in {elapsed:.2f}s ({len(bank) / elapsed:.0f} questions/s)")
+    for (stem, _, label), score in zip(stems, estimator.estimate(bank[:len(stems)])):
+        print(f"{label:>6} -> {score:.2f} {stem[:60]}")
+    print(estimator.get_stats())
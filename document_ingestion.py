@@ -0,0 +1,554 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from html.parser import HTMLParser
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from content_processor import split_sentences
+
+# file extension -> markup handled by normalize_document
+SUPPORTED_EXTENSIONS = {
+    ".txt": "text",
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".html": "html",
+    ".htm": "html"
+}
+
+# hashed vocabulary size; hashing needs no fitted vocabulary, so every worker vectorizes independently
+N_FEATURES = 2 ** 18
+
+_BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "pre"}
+
+
+def _hashing_vectorizer():
+    return HashingVectorizer(
+        n_features=N_FEATURES,
+        token_pattern=r"(?u)\b[a-zA-Z][a-zA-Z0-9]+\b",
+        stop_words='english',
+        alternate_sign=False,
+        norm=None,
+        dtype=np.float32
+    )
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Collect the visible text of an HTML page, one line per block element.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self.skipping += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def normalize_document(text, kind="text"):
+    """
+    Turn a text, markdown or HTML document into plain text.
+
+    Args:
+        text (str): Raw document
+        kind (str): "text", "markdown" or "html"
+
+    Returns:
+        str: Plain text with one paragraph per line
+    """
+    if kind == "html":
+        extractor = _TextExtractor()
+        extractor.feed(text)
+        extractor.close()
+        text = "".join(extractor.parts)
+    elif kind == "markdown":
+        text = re.sub(r"^```.*$", "", text, flags=re.MULTILINE)
+        text = re.sub(r"!\[([^\]]*)\]\([^)]*\)", r"\1", text)
+        text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+        text = re.sub(r"^\s{0,3}(?:#{1,6}|>|[-*+]|\d+[.)])\s+", "", text, flags=re.MULTILINE)
+        text = re.sub(r"(\*\*|__|\*|_|`)(?=\S)(.+?)(?<=\S)\1", r"\2", text)
+
+    text = unicodedata.normalize("NFKC", text)
+    paragraphs = (" ".join(paragraph.split()) for paragraph in re.split(r"\n\s*\n|\n", text))
+    return "\n".join(paragraph for paragraph in paragraphs if paragraph)
+
+
+def chunk_sentences(sentences, chunk_words=200):
+    """
+    Group consecutive sentences into chunks of about chunk_words words.
+    """
+    chunks = []
+    current = []
+    words = 0
+    for sentence in sentences:
+        length = len(sentence.split())
+        if current and words + length > chunk_words:
+            chunks.append(" ".join(current))
+            current, words = [], 0
+        current.append(sentence)
+        words += length
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def _process_file(path, chunk_words):
+    """
+    Normalize, sentence-split, chunk and vectorize one file (run in a worker process).
+
+    Returns:
+        dict: The chunks and their sublinear, L2-normalized term frequency rows
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    kind = SUPPORTED_EXTENSIONS.get(os.path.splitext(path)[1].lower(), "text")
+
+    sentences = []
+    for paragraph in normalize_document(text, kind).split("\n"):
+        sentences.extend(split_sentences(paragraph))
+    chunks = chunk_sentences(sentences, chunk_words)
+    if not chunks:
+        return {'path': path, 'chunks': [], 'indptr': np.zeros(1, dtype=np.int64),
+                'indices': np.zeros(0, dtype=np.int32), 'data': np.zeros(0, dtype=np.float32)}
+
+    matrix = _hashing_vectorizer().transform(chunks).tocsr()
+    matrix.sort_indices()
+    matrix.data = 1.0 + np.log(matrix.data)
+    matrix = normalize(matrix)
+    return {
+        'path': path,
+        'chunks': chunks,
+        'indptr': matrix.indptr.astype(np.int64),
+        'indices': matrix.indices.astype(np.int32),
+        'data': matrix.data.astype(np.float32)
+    }
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentIndex:
+    # raw append-only arrays of the index, file name -> dtype
+    arrays = {
+        'indptr.i64': np.int64,
+        'indices.i32': np.int32,
+        'data.f32': np.float32,
+        'text_offsets.i64': np.int64,
+        'deleted.u8': np.uint8
+    }
+
+    def __init__(self, index_dir='data/document_index', block_rows=65536):
+        """
+        Initialize a persisted chunk index of lecture notes.
+
+        Chunks are stored as an append-only CSR matrix of hashed term
+        frequencies in flat binary files, which are memory-mapped for search
+        and scanned in blocks of block_rows chunks, so memory use does not grow
+        with the corpus. Document frequencies are kept alongside and turned
+        into IDF weights at query time. Chunks of changed or removed files are
+        masked as deleted; rebuild the index to reclaim their space.
+
+        Args:
+            index_dir (str): Directory the index files are stored in
+            block_rows (int): Chunks scored per block during search
+        """
+        self.index_dir = index_dir
+        self.block_rows = block_rows
+        self.lock = threading.Lock()
+        self.manifest = None
+        self.manifest_mtime = None
+        self.document_frequency = None
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _load(self):
+        """
+        Load the manifest and document frequencies, or start an empty index.
+        """
+        manifest_path = self._path('manifest.json')
+        mtime = os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None
+        if self.manifest is not None and mtime == self.manifest_mtime:
+            return
+
+        self.manifest = {'rows': 0, 'nnz': 0, 'text_bytes': 0, 'deleted': 0, 'files': {}}
+        self.document_frequency = np.zeros(N_FEATURES, dtype=np.float64)
+        try:
+            if mtime is not None:
+                with open(manifest_path, 'r') as f:
+                    self.manifest = json.load(f)
+                self.document_frequency = np.load(self._path('df.npy'))
+        except Exception as e:
+            print(f"Error loading document index: {e}")
+        self.manifest_mtime = mtime
+
+    def _memmap(self, name, length):
+        if length <= 0:
+            return np.zeros(0, dtype=self.arrays[name])
+        return np.memmap(self._path(name), dtype=self.arrays[name], mode='r', shape=(length,))
+
+    def _save(self):
+        manifest_path = self._path('manifest.json')
+        np.save(self._path('df.tmp.npy'), self.document_frequency)
+        os.replace(self._path('df.tmp.npy'), self._path('df.npy'))
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f)
+        # the manifest is replaced last, so readers never see rows that are not fully written
+        os.replace(manifest_path + '.tmp', manifest_path)
+        self.manifest_mtime = os.path.getmtime(manifest_path)
+
+    def _create_files(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        for name, dtype in self.arrays.items():
+            path = self._path(name)
+            if not os.path.exists(path) or self.manifest['rows'] == 0:
+                with open(path, 'wb') as f:
+                    if name in ('indptr.i64', 'text_offsets.i64'):
+                        f.write(np.zeros(1, dtype=dtype).tobytes())
+        if not os.path.exists(self._path('text.bin')) or self.manifest['rows'] == 0:
+            open(self._path('text.bin'), 'wb').close()
+
+    def _truncate_files(self):
+        """
+        Cut every file back to the length the manifest records.
+
+        A run that was interrupted has appended chunks the manifest never
+        recorded, and new chunks must be appended right after the recorded ones.
+        """
+        rows, nnz = self.manifest['rows'], self.manifest['nnz']
+        lengths = {
+            'indptr.i64': rows + 1,
+            'indices.i32': nnz,
+            'data.f32': nnz,
+            'text_offsets.i64': rows + 1,
+            'deleted.u8': rows
+        }
+        sizes = {name: length * np.dtype(self.arrays[name]).itemsize for name, length in lengths.items()}
+        sizes['text.bin'] = self.manifest['text_bytes']
+        for name, size in sizes.items():
+            if os.path.getsize(self._path(name)) > size:
+                os.truncate(self._path(name), size)
+
+    def _delete_rows(self, start, end):
+        """
+        Mask the chunks of a file and remove them from the document frequencies.
+        """
+        if end <= start:
+            return
+        indptr = self._memmap('indptr.i64', self.manifest['rows'] + 1)
+        indices = self._memmap('indices.i32', self.manifest['nnz'])
+        removed = indices[indptr[start]:indptr[end]]
+        self.document_frequency -= np.bincount(removed, minlength=N_FEATURES)
+        del indptr, indices, removed
+
+        deleted = np.memmap(self._path('deleted.u8'), dtype=np.uint8, mode='r+', shape=(self.manifest['rows'],))
+        deleted[start:end] = 1
+        deleted.flush()
+        del deleted
+        self.manifest['deleted'] += end - start
+
+    def _append(self, handles, result):
+        """
+        Append the chunks of one processed file to the index files.
+
+        Returns:
+            tuple: (first row, end row) of the file's chunks
+        """
+        start = self.manifest['rows']
+        encoded = [chunk.encode('utf-8') for chunk in result['chunks']]
+        offsets = self.manifest['text_bytes'] + np.cumsum([len(chunk) for chunk in encoded], dtype=np.int64)
+
+        handles['text.bin'].write(b"".join(encoded))
+        handles['text_offsets.i64'].write(offsets.tobytes())
+        handles['indptr.i64'].write((result['indptr'][1:] + self.manifest['nnz']).astype(np.int64).tobytes())
+        handles['indices.i32'].write(result['indices'].tobytes())
+        handles['data.f32'].write(result['data'].tobytes())
+        handles['deleted.u8'].write(np.zeros(len(encoded), dtype=np.uint8).tobytes())
+        # hashed rows hold each term once, so the counts are document frequencies
+        self.document_frequency += np.bincount(result['indices'], minlength=N_FEATURES)
+
+        self.manifest['rows'] += len(encoded)
+        self.manifest['nnz'] += len(result['indices'])
+        self.manifest['text_bytes'] = int(offsets[-1]) if len(encoded) else self.manifest['text_bytes']
+        return start, self.manifest['rows']
+
+    def ingest(self, folder, workers=4, chunk_words=200):
+        """
+        Ingest every supported file under a folder, reprocessing only changed files.
+
+        Files are processed by a pool of worker processes with a bounded number
+        in flight, and each result is appended to the index as soon as it is
+        ready, so memory use does not depend on the number of files.
+
+        Args:
+            folder (str): Folder of .txt, .md and .html files (searched recursively)
+            workers (int): Number of worker processes
+            chunk_words (int): Approximate words per chunk
+
+        Returns:
+            dict: Counts of files added, updated, unchanged and removed, and the chunks added
+        """
+        stats = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'chunks': 0}
+        paths = []
+        for root, _, names in os.walk(folder):
+            for name in sorted(names):
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    paths.append(os.path.abspath(os.path.join(root, name)))
+        folder = os.path.abspath(folder)
+
+        with self.lock:
+            self._load()
+            self._create_files()
+            self._truncate_files()
+            files = self.manifest['files']
+
+            changed = []
+            for path in paths:
+                status = os.stat(path)
+                entry = files.get(path)
+                if entry and entry['size'] == status.st_size and entry['mtime'] == status.st_mtime:
+                    stats['unchanged'] += 1
+                    continue
+                digest = _file_digest(path)
+                if entry and entry['sha1'] == digest:
+                    entry['mtime'] = status.st_mtime
+                    stats['unchanged'] += 1
+                    continue
+                if entry:
+                    self._delete_rows(entry['start'], entry['end'])
+                stats['updated' if entry else 'added'] += 1
+                files[path] = {'size': status.st_size, 'mtime': status.st_mtime, 'sha1': digest,
+                               'start': 0, 'end': 0}
+                changed.append(path)
+
+            # files that were removed from the folder
+            present = set(paths)
+            for path in [p for p in files if p.startswith(folder + os.sep) and p not in present]:
+                self._delete_rows(files[path]['start'], files[path]['end'])
+                del files[path]
+                stats['removed'] += 1
+
+            handles = {name: open(self._path(name), 'ab') for name in list(self.arrays) + ['text.bin']}
+            try:
+                with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+                    remaining = iter(changed)
+                    in_flight = {}
+                    while True:
+                        while len(in_flight) < 2 * max(1, workers):
+                            path = next(remaining, None)
+                            if path is None:
+                                break
+                            in_flight[executor.submit(_process_file, path, chunk_words)] = path
+                        if not in_flight:
+                            break
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            path = in_flight.pop(future)
+                            try:
+                                result = future.result()
+                            except Exception as e:
+                                print(f"Error ingesting {path}: {e}")
+                                # forget the file so the next run tries it again
+                                del files[path]
+                                continue
+                            start, end = self._append(handles, result)
+                            files[result['path']].update({'start': start, 'end': end})
+                            stats['chunks'] += end - start
+            except BaseException:
+                # the manifest in memory no longer matches the files, so read it again next time
+                self.manifest = None
+                raise
+            finally:
+                for handle in handles.values():
+                    handle.close()
+            self._save()
+        return stats
+
+    def search(self, query, k=5):
+        """
+        Find the chunks most relevant to a query.
+
+        Args:
+            query (str): Free-text query (e.g. topics and a custom description)
+            k (int): Maximum number of chunks
+
+        Returns:
+            list: (score, chunk text, source file) tuples, best first
+        """
+        with self.lock:
+            self._load()
+            manifest = self.manifest
+            rows = manifest['rows']
+            if not rows or not str(query).strip():
+                return []
+            live = max(1, rows - manifest['deleted'])
+            idf = np.log((1.0 + live) / (1.0 + np.maximum(self.document_frequency, 0))) + 1.0
+
+            query_vector = _hashing_vectorizer().transform([query]).tocsr()
+            if not query_vector.nnz:
+                return []
+            weights = np.zeros(N_FEATURES, dtype=np.float32)
+            weights[query_vector.indices] = (1.0 + np.log(query_vector.data)) * idf[query_vector.indices] ** 2
+
+            indptr = self._memmap('indptr.i64', rows + 1)
+            indices = self._memmap('indices.i32', manifest['nnz'])
+            data = self._memmap('data.f32', manifest['nnz'])
+            deleted = self._memmap('deleted.u8', rows)
+
+            best_rows = np.zeros(0, dtype=np.int64)
+            best_scores = np.zeros(0, dtype=np.float32)
+            for start in range(0, rows, self.block_rows):
+                end = min(rows, start + self.block_rows)
+                first, last = indptr[start], indptr[end]
+                block = csr_matrix(
+                    (data[first:last], indices[first:last], indptr[start:end + 1] - first),
+                    shape=(end - start, N_FEATURES)
+                )
+                scores = block @ weights
+                scores[deleted[start:end] == 1] = 0
+                candidates = np.flatnonzero(scores > 0)
+                if len(candidates) > k:
+                    candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+                best_rows = np.concatenate([best_rows, candidates + start])
+                best_scores = np.concatenate([best_scores, scores[candidates]])
+                if len(best_rows) > k:
+                    keep = np.argpartition(-best_scores, k)[:k]
+                    best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+            order = np.argsort(-best_scores, kind='stable')
+            offsets = self._memmap('text_offsets.i64', rows + 1)
+            text = np.memmap(self._path('text.bin'), dtype=np.uint8, mode='r') if manifest['text_bytes'] else None
+            owners = sorted((entry['start'], entry['end'], path) for path, entry in manifest['files'].items())
+
+            results = []
+            for position in order:
+                row = int(best_rows[position])
+                chunk = bytes(text[offsets[row]:offsets[row + 1]]).decode('utf-8')
+                source = next((path for start, end, path in owners if start <= row < end), None)
+                results.append((float(best_scores[position]), chunk, source))
+            return results
+
+    def content_for(self, topics, custom_description="", k=5):
+        """
+        Get the chunks most relevant to a request as educational content.
+
+        Args:
+            topics (list): Topics of the request
+            custom_description (str, optional): Custom description of the request
+            k (int): Maximum number of chunks
+
+        Returns:
+            str: The chunks joined by blank lines (empty if nothing matches)
+        """
+        query = " ".join(list(topics) + [custom_description or ""])
+        return "\n\n".join(chunk for _, chunk, _ in self.search(query, k))
+
+    def get_stats(self):
+        """
+        Get the number of files, chunks and deleted chunks in the index.
+        """
+        with self.lock:
+            self._load()
+            return {
+                'files': len(self.manifest['files']),
+                'chunks': self.manifest['rows'] - self.manifest['deleted'],
+                'deleted_chunks': self.manifest['deleted']
+            }
+
+
+def index_dir_for(folder, index_root='data/document_index'):
+    """
+    Get the directory the index of one notes folder is stored in.
+
+    Every folder has its own index, so a search only ranks the chunks of the
+    folder it was made for.
+
+    Args:
+        folder (str): Folder of lecture notes
+        index_root (str): Directory all folder indexes are stored under
+
+    Returns:
+        str: The index directory
+    """
+    folder = os.path.realpath(folder)
+    name = re.sub(r"[^A-Za-z0-9_-]+", "_", os.path.basename(folder))[:40] or "root"
+    return os.path.join(index_root, f"{name}-{hashlib.sha1(folder.encode('utf-8')).hexdigest()[:12]}")
+
+
+_shared_indexes = {}
+_shared_indexes_lock = threading.Lock()
+
+
+def get_document_index(folder, index_root='data/document_index'):
+    """
+    Get the process-wide index of a notes folder, shared by all sessions.
+
+    Args:
+        folder (str): Folder of lecture notes
+        index_root (str): Directory all folder indexes are stored under
+
+    Returns:
+        DocumentIndex: The shared index of the folder
+    """
+    index_dir = index_dir_for(folder, index_root)
+    with _shared_indexes_lock:
+        if index_dir not in _shared_indexes:
+            _shared_indexes[index_dir] = DocumentIndex(index_dir)
+        return _shared_indexes[index_dir]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a folder of lecture notes into the document index")
+    parser.add_argument("folder", help="folder of .txt, .md and .html files")
+    parser.add_argument("--index", help="directory the index is stored in, defaults to the folder's own "
+                                        "directory under data/document_index")
+    parser.add_argument("--workers", type=int, default=4, help="number of worker processes")
+    parser.add_argument("--chunk-words", type=int, default=200, help="approximate words per chunk")
+    parser.add_argument("--rebuild", action="store_true", help="discard the index and ingest every file again")
+    parser.add_argument("--query", help="search the index after ingesting")
+    args = parser.parse_args()
+
+    index_dir = args.index or index_dir_for(args.folder)
+    if args.rebuild and os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+    index = DocumentIndex(index_dir)
+
+    started = time.perf_counter()
+    stats = index.ingest(args.folder, args.workers, args.chunk_words)
+    print(f"{stats['added']} added, {stats['updated']} updated, {stats['unchanged']} unchanged, "
+          f"{stats['removed']} removed file(s); {stats['chunks']} chunk(s) in {time.perf_counter() - started:.1f}s")
+    print(index.get_stats())
+
+    if args.query:
+        for score, chunk, source in index.search(args.query):
+            print(f"{score:.3f} {os.path.basename(source or '')}: {chunk[:100]}")
@@ -0,0 +1,233 @@
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_text(text):
+    """
+    Normalize free text so that trivial differences map to the same key.
+    """
+    return " ".join(str(text or "").lower().split())
+
+
+def make_cache_key(subject, topics, difficulty, custom_description="", content=None, model_params=None):
+    """
+    Build a content-addressed key for a generation request.
+
+    The number of questions is deliberately left out, so a cached pool of
+    questions can serve requests of any size up to the pool size.
+
+    Args:
+        subject (str): The subject area
+        topics (list): List of topics
+        difficulty (str): Difficulty level
+        custom_description (str): Custom user description
+        content (str, optional): Educational content
+        model_params (dict, optional): Model name, temperature and similar settings
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    payload = {
+        'subject': _normalize_text(subject),
+        'topics': sorted(_normalize_text(topic) for topic in (topics or [])),
+        'difficulty': _normalize_text(difficulty),
+        'custom_description': _normalize_text(custom_description),
+        'content': _normalize_text(content),
+        'model_params': model_params or {}
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class GenerationCache:
+    def __init__(self, cache_dir='data/generation_cache', max_memory_entries=128, max_disk_entries=2000,
+                 ttl_seconds=7 * 24 * 3600, max_questions_per_entry=100):
+        """
+        Initialize a two-tier (memory LRU + disk) cache of generated questions.
+
+        Args:
+            cache_dir (str): Directory for the on-disk tier
+            max_memory_entries (int): Maximum number of entries kept in memory
+            max_disk_entries (int): Maximum number of entry files kept on disk
+            ttl_seconds (int): Age after which an entry is considered stale
+            max_questions_per_entry (int): Maximum size of the question pool per key
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_questions_per_entry = max_questions_per_entry
+
+        self.memory = OrderedDict()  # key -> {'questions': [...], 'created_at': float}
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, key, num_questions):
+        """
+        Get a random subset of cached questions for a request.
+
+        Args:
+            key (str): Cache key from make_cache_key
+            num_questions (int): Number of questions requested
+
+        Returns:
+            list: A list of question dictionaries, or None on a miss
+        """
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and self._is_expired(entry):
+                del self.memory[key]
+                entry = None
+
+            if entry is not None:
+                self.memory.move_to_end(key)
+                tier = 'memory_hits'
+            else:
+                entry = self._read_from_disk(key)
+                tier = 'disk_hits'
+                if entry is not None:
+                    self._store_in_memory(key, entry)
+
+            if entry is None or len(entry['questions']) < num_questions:
+                self.stats['misses'] += 1
+                return None
+
+            self.stats[tier] += 1
+            # serve a different random subset each time the pool is larger than the request
+            questions = random.sample(entry['questions'], num_questions)
+            return copy.deepcopy(questions)
+
+    def put(self, key, questions):
+        """
+        Add generated questions to the pool for a key.
+
+        The entry keeps the creation time of its first questions, so a pool that
+        keeps growing still expires ttl_seconds after it was started.
+
+        Args:
+            key (str): Cache key from make_cache_key
+            questions (list): List of question dictionaries
+        """
+        if not questions:
+            return
+
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and self._is_expired(entry):
+                del self.memory[key]
+                entry = None
+            entry = entry or self._read_from_disk(key)
+            pool = entry['questions'] if entry else []
+
+            # merge, skipping questions that are already in the pool
+            seen = set(_normalize_text(q.get('question')) for q in pool)
+            for question in questions:
+                text = _normalize_text(question.get('question'))
+                if text not in seen:
+                    seen.add(text)
+                    pool.append(copy.deepcopy(question))
+
+            entry = {
+                'questions': pool[-self.max_questions_per_entry:],
+                'created_at': entry['created_at'] if entry else time.time()
+            }
+            self._store_in_memory(key, entry)
+            self._write_to_disk(key, entry)
+
+    def get_stats(self):
+        """
+        Get cache hit/miss counters.
+
+        Returns:
+            dict: Counters plus the overall hit rate
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self.memory)
+
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = hits / lookups if lookups > 0 else 0
+        return stats
+
+    def _is_expired(self, entry):
+        return time.time() - entry.get('created_at', 0) > self.ttl_seconds
+
+    def _store_in_memory(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_from_disk(self, key):
+        """
+        Read an entry from the disk tier, removing it if it has expired.
+        """
+        path = self._entry_path(key)
+        try:
+            if not os.path.exists(path):
+                return None
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            if self._is_expired(entry):
+                os.remove(path)
+                return None
+            return entry
+        except Exception as e:
+            print(f"Error reading cache entry: {e}")
+            return None
+
+    def _write_to_disk(self, key, entry):
+        """
+        Write an entry to the disk tier and evict the oldest files if the tier is full.
+        """
+        try:
+            path = self._entry_path(key)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+
+            files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                     if name.endswith('.json')]
+            if len(files) > self.max_disk_entries:
+                files.sort(key=os.path.getmtime)
+                for old_path in files[:len(files) - self.max_disk_entries]:
+                    os.remove(old_path)
+                    self.stats['evictions'] += 1
+        except Exception as e:
+            print(f"Error writing cache entry: {e}")
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_generation_cache():
+    """
+    Get the process-wide generation cache shared by all sessions.
+
+    Returns:
+        GenerationCache: The shared cache instance
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = GenerationCache()
+        return _shared_cache
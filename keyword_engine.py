@@ -0,0 +1,206 @@
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# words of at least two characters that start with a letter
+_TOKEN_PATTERN = r"(?u)\b[a-zA-Z][a-zA-Z0-9]+\b"
+_TOKEN_RE = re.compile(_TOKEN_PATTERN)
+
+
+class KeywordEngine:
+    def __init__(self, model_path='data/keyword_vectorizer.pkl', stop_words=None, max_features=50000):
+        """
+        Initialize a keyword engine backed by a corpus-fitted TF-IDF vectorizer.
+
+        The vectorizer is fitted once on the question/content corpus, persisted
+        to disk and loaded lazily on first use, so IDF weights reflect the whole
+        corpus rather than the single document being analysed.
+
+        Args:
+            model_path (str): File the fitted vectorizer is persisted to
+            stop_words (set, optional): Words never returned as keywords
+            max_features (int): Maximum vocabulary size
+        """
+        self.model_path = model_path
+        self.stop_words = set(stop_words or [])
+        self.max_features = max_features
+
+        self.vectorizer = None
+        self.feature_names = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def _new_vectorizer(self):
+        return TfidfVectorizer(
+            token_pattern=_TOKEN_PATTERN,
+            stop_words=sorted(self.stop_words) or None,
+            sublinear_tf=True,
+            max_features=self.max_features,
+            dtype=np.float32
+        )
+
+    def _get_vectorizer(self):
+        """
+        Get the fitted vectorizer, loading it from disk on first use.
+
+        Returns:
+            TfidfVectorizer: The fitted vectorizer, or None if there is none yet
+        """
+        with self.lock:
+            if not self.loaded:
+                self.loaded = True
+                try:
+                    if os.path.exists(self.model_path):
+                        with open(self.model_path, 'rb') as f:
+                            self._set_vectorizer(pickle.load(f))
+                except Exception as e:
+                    print(f"Error loading keyword model: {e}")
+            return self.vectorizer
+
+    def _set_vectorizer(self, vectorizer):
+        self.vectorizer = vectorizer
+        self.feature_names = vectorizer.get_feature_names_out()
+
+    def fit(self, documents):
+        """
+        Fit the vectorizer on a corpus and persist it.
+
+        Args:
+            documents (list): List of corpus documents
+        """
+        vectorizer = self._new_vectorizer()
+        vectorizer.fit(documents)
+
+        with self.lock:
+            self._set_vectorizer(vectorizer)
+            self.loaded = True
+
+        try:
+            os.makedirs(os.path.dirname(self.model_path) or '.', exist_ok=True)
+            with open(self.model_path, 'wb') as f:
+                pickle.dump(vectorizer, f)
+        except Exception as e:
+            print(f"Error saving keyword model: {e}")
+
+    def fit_from_tests(self, tests, extra_documents=()):
+        """
+        Fit the vectorizer on every stored question, its options, and any extra content.
+
+        Args:
+            tests (dict): Dictionary of test_id -> test data
+            extra_documents (iterable): Additional content documents
+        """
+        documents = [
+            " ".join([str(q.get('question', ''))] + [str(option) for option in q.get('options', [])])
+            for test in tests.values()
+            for q in test.get('questions', [])
+        ]
+        documents.extend(extra_documents)
+        if documents:
+            self.fit(documents)
+
+    def ensure_fitted(self, tests):
+        """
+        Load the persisted vectorizer, or fit one on the stored tests if there is none.
+
+        Args:
+            tests (dict): Dictionary of test_id -> test data
+        """
+        if self._get_vectorizer() is None:
+            self.fit_from_tests(tests)
+
+    def corpus_vectorizer(self):
+        """
+        Get the corpus-fitted vectorizer (e.g. for its IDF weights).
+
+        Returns:
+            TfidfVectorizer: The fitted vectorizer, or None if there is none yet
+        """
+        return self._get_vectorizer()
+
+    def top_keywords(self, text, k=5):
+        """
+        Get the top-k keywords of one document.
+
+        Args:
+            text (str): Document text
+            k (int): Number of keywords
+
+        Returns:
+            list: Keywords, most important first
+        """
+        return self.top_keywords_batch([text], k)[0]
+
+    def top_keywords_batch(self, documents, k=5):
+        """
+        Get the top-k keywords of many documents in one sparse-matrix pass.
+
+        Args:
+            documents (list): List of document texts
+            k (int): Number of keywords per document
+
+        Returns:
+            list: One list of keywords (most important first) per document
+        """
+        vectorizer = self._get_vectorizer()
+        if vectorizer is None:
+            # no corpus model yet, so the batch itself is the best available corpus
+            vectorizer = self._new_vectorizer()
+            try:
+                matrix = vectorizer.fit_transform(documents).tocsr()
+            except ValueError:
+                return [self._frequent_words(document, k) for document in documents]
+            feature_names = vectorizer.get_feature_names_out()
+        else:
+            matrix = vectorizer.transform(documents).tocsr()
+            feature_names = self.feature_names
+
+        results = []
+        for row, document in enumerate(documents):
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            scores = matrix.data[start:end]
+            if len(scores) == 0:
+                # nothing in the corpus vocabulary, so rank by frequency instead
+                results.append(self._frequent_words(document, k))
+                continue
+
+            top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind='stable')]
+            results.append([feature_names[i] for i in matrix.indices[start:end][top]])
+
+        return results
+
+    def _frequent_words(self, text, k):
+        """
+        Fast fallback: the most frequent non-stop-words of a document.
+        """
+        counts = Counter(
+            word for word in _TOKEN_RE.findall(str(text).lower()) if word not in self.stop_words
+        )
+        return [word for word, _ in counts.most_common(k)]
+
+
+_shared_engine = None
+_shared_engine_lock = threading.Lock()
+
+
+def get_keyword_engine(stop_words=None):
+    """
+    Get the process-wide keyword engine shared by all sessions.
+
+    Args:
+        stop_words (set, optional): Stop words used when the engine is first created
+
+    Returns:
+        KeywordEngine: The shared engine
+    """
+    global _shared_engine
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            _shared_engine = KeywordEngine(stop_words=stop_words)
+        return _shared_engine
@@ -0,0 +1,487 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cohere
+import httpx
+
+from scheduler import current_request, get_llm_scheduler
+
+
+class BackendUnavailableError(Exception):
+    """
+    Raised when the provider is unhealthy or a call ran out of retries or time.
+    """
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=2, base_delay=0.5, max_delay=8.0):
+        """
+        Initialize a jittered exponential backoff policy.
+
+        Args:
+            max_retries (int): Number of retries after the first attempt
+            base_delay (float): Delay before the first retry in seconds
+            max_delay (float): Upper bound for any single delay in seconds
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt):
+        """
+        Get the delay before a retry, using full jitter.
+
+        Args:
+            attempt (int): Number of the attempt that just failed, starting at 0
+
+        Returns:
+            float: Delay in seconds
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, probe_timeout=60.0):
+        """
+        Initialize a circuit breaker.
+
+        After failure_threshold consecutive failures the breaker opens and calls
+        fail fast. After reset_timeout seconds a single probe call is let through,
+        and its outcome closes or re-opens the breaker. A probe that reports no
+        outcome within probe_timeout seconds counts as failed.
+
+        Args:
+            failure_threshold (int): Consecutive failures before opening
+            reset_timeout (float): Seconds to stay open before probing
+            probe_timeout (float): Seconds a probe may run before it is abandoned
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Check whether a call may go to the provider.
+
+        Returns:
+            bool: True if the call is allowed
+        """
+        with self.lock:
+            if self.state == 'closed':
+                return True
+
+            now = time.monotonic()
+            if self.state == 'half_open' and now - self.probe_started >= self.probe_timeout:
+                # the probe was abandoned without an outcome, so the breaker re-opens
+                self.state = 'open'
+                self.opened_at = self.probe_started
+
+            if self.state == 'open' and now - self.opened_at >= self.reset_timeout:
+                # let exactly one probe through
+                self.state = 'half_open'
+                self.probe_started = now
+                return True
+
+            return False
+
+    def release_probe(self):
+        """
+        Give back a probe that never reached the provider, so the next call may probe.
+        """
+        with self.lock:
+            if self.state == 'half_open':
+                self.state = 'open'
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class LLMBackend:
+    model_name = "unknown"
+
+    def __init__(self, timeout=30.0, retry_policy=None, circuit_breaker=None, scheduler=None):
+        """
+        Initialize the shared call policy of an LLM backend.
+
+        Subclasses implement _generate, and may implement _generate_stream.
+
+        Args:
+            timeout (float): Default deadline for a whole call, including retries
+            retry_policy (RetryPolicy, optional): Backoff policy for failed attempts
+            circuit_breaker (CircuitBreaker, optional): Breaker guarding the provider
+            scheduler (LLMScheduler, optional): Scheduler every attempt must be admitted by
+        """
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.scheduler = scheduler
+
+    def _admit(self, prompt, max_tokens, deadline, priority, user_id):
+        """
+        Wait for the scheduler to admit one attempt.
+
+        The priority and user default to the current request_context.
+        """
+        if self.scheduler is None:
+            return
+        context_priority, context_user = current_request()
+        try:
+            self.scheduler.acquire(
+                math.ceil(len(prompt) / 4) + max_tokens,
+                priority or context_priority,
+                user_id if user_id is not None else context_user,
+                timeout=max(0.0, deadline - time.monotonic())
+            )
+        except TimeoutError as e:
+            raise BackendUnavailableError(f"{self.model_name} call was not scheduled in time: {e}")
+
+    def generate(self, prompt, max_tokens, temperature, timeout=None, priority=None, user_id=None):
+        """
+        Generate a completion, retrying failed attempts within the deadline.
+
+        Args:
+            prompt (str): Prompt text
+            max_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature
+            timeout (float, optional): Deadline for the call in seconds
+            priority (str, optional): Scheduler priority class, defaults to the request context
+            user_id (str, optional): User the call is made for, defaults to the request context
+
+        Returns:
+            str: The generated text
+
+        Raises:
+            BackendUnavailableError: If the breaker is open or the call failed
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+
+        while True:
+            if not self.circuit_breaker.allow_request():
+                raise BackendUnavailableError(f"{self.model_name} backend is unavailable (circuit open)")
+
+            try:
+                self._admit(prompt, max_tokens, deadline, priority, user_id)
+            except BaseException:
+                self.circuit_breaker.release_probe()
+                raise
+            remaining = deadline - time.monotonic()
+            try:
+                text = self._generate(prompt, max_tokens, temperature, remaining)
+                self.circuit_breaker.record_success()
+                return text
+            except Exception as e:
+                self.circuit_breaker.record_failure()
+                delay = self.retry_policy.get_delay(attempt)
+                attempt += 1
+                if attempt > self.retry_policy.max_retries or time.monotonic() + delay >= deadline:
+                    raise BackendUnavailableError(f"{self.model_name} call failed after {attempt} attempt(s): {e}")
+                print(f"LLM call failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def generate_stream(self, prompt, max_tokens, temperature, timeout=None, priority=None, user_id=None):
+        """
+        Generate a completion as a stream of text pieces.
+
+        Failed attempts are retried only until the first piece has been yielded.
+
+        Args:
+            prompt (str): Prompt text
+            max_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature
+            timeout (float, optional): Deadline for the call in seconds
+            priority (str, optional): Scheduler priority class, defaults to the request context
+            user_id (str, optional): User the call is made for, defaults to the request context
+
+        Yields:
+            str: Pieces of the generated text
+
+        Raises:
+            BackendUnavailableError: If the breaker is open or the call failed
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+
+        while True:
+            if not self.circuit_breaker.allow_request():
+                raise BackendUnavailableError(f"{self.model_name} backend is unavailable (circuit open)")
+
+            try:
+                self._admit(prompt, max_tokens, deadline, priority, user_id)
+            except BaseException:
+                self.circuit_breaker.release_probe()
+                raise
+            started = False
+            try:
+                for piece in self._generate_stream(prompt, max_tokens, temperature, deadline - time.monotonic()):
+                    if not started:
+                        # the provider answered, so a caller closing the stream early still counts as success
+                        started = True
+                        self.circuit_breaker.record_success()
+                    yield piece
+                if not started:
+                    self.circuit_breaker.record_success()
+                return
+            except Exception as e:
+                self.circuit_breaker.record_failure()
+                delay = self.retry_policy.get_delay(attempt)
+                attempt += 1
+                if (started or attempt > self.retry_policy.max_retries
+                        or time.monotonic() + delay >= deadline):
+                    raise BackendUnavailableError(f"{self.model_name} stream failed after {attempt} attempt(s): {e}")
+                print(f"LLM stream failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _generate(self, prompt, max_tokens, temperature, timeout):
+        raise NotImplementedError
+
+    def _generate_stream(self, prompt, max_tokens, temperature, timeout):
+        # backends without native streaming return the whole completion as one piece
+        yield self._generate(prompt, max_tokens, temperature, timeout)
+
+
+_shared_http_client = None
+_shared_http_client_lock = threading.Lock()
+
+
+def get_shared_http_client():
+    """
+    Get the keep-alive HTTP connection pool shared by every backend in the process.
+
+    Returns:
+        httpx.Client: The shared client
+    """
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is None:
+            _shared_http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+                timeout=httpx.Timeout(60.0, connect=5.0)
+            )
+        return _shared_http_client
+
+
+class CohereBackend(LLMBackend):
+    def __init__(self, api_key=None, model="command", **kwargs):
+        """
+        Initialize the Cohere backend.
+
+        Args:
+            api_key (str, optional): Cohere API key, defaults to the COHERE_API_KEY
+                environment variable
+            model (str): Cohere generation model
+            **kwargs: Call policy options passed to LLMBackend
+
+        Raises:
+            ValueError: If no API key is given or set in the environment
+        """
+        api_key = api_key or os.environ.get("COHERE_API_KEY")
+        if not api_key:
+            raise ValueError("No Cohere API key: set the COHERE_API_KEY environment variable "
+                             "(or MCQ_LLM_BACKEND=local to use the local backend)")
+        super().__init__(**kwargs)
+        self.model_name = model
+        self.client = cohere.Client(api_key, httpx_client=get_shared_http_client())
+
+    def _request_options(self, timeout):
+        # retries are handled by LLMBackend, not by the SDK
+        return {"timeout_in_seconds": max(1, math.ceil(timeout)), "max_retries": 0}
+
+    def _generate(self, prompt, max_tokens, temperature, timeout):
+        response = self.client.generate(
+            model=self.model_name,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop_sequences=[],
+            request_options=self._request_options(timeout)
+        )
+        return response.generations[0].text
+
+    def _generate_stream(self, prompt, max_tokens, temperature, timeout):
+        stream = self.client.generate_stream(
+            model=self.model_name,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            request_options=self._request_options(timeout)
+        )
+        for event in stream:
+            if getattr(event, "event_type", None) == "text-generation":
+                yield event.text
+
+
+class LocalHTTPBackend(LLMBackend):
+    def __init__(self, base_url="http://127.0.0.1:8765", model="local-stub", **kwargs):
+        """
+        Initialize a backend that talks to a local HTTP stand-in for the provider.
+
+        The server accepts POST /generate with a JSON body containing prompt,
+        max_tokens, temperature and stream. It answers with {"text": ...}, or with
+        one such JSON object per line when stream is true.
+
+        Args:
+            base_url (str): Base URL of the local server
+            model (str): Model name reported by the backend
+            **kwargs: Call policy options passed to LLMBackend
+        """
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+        self.model_name = model
+        self.client = get_shared_http_client()
+
+    def _payload(self, prompt, max_tokens, temperature, stream):
+        return {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "stream": stream}
+
+    def _generate(self, prompt, max_tokens, temperature, timeout):
+        response = self.client.post(
+            f"{self.base_url}/generate",
+            json=self._payload(prompt, max_tokens, temperature, False),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json()["text"]
+
+    def _generate_stream(self, prompt, max_tokens, temperature, timeout):
+        with self.client.stream(
+            "POST",
+            f"{self.base_url}/generate",
+            json=self._payload(prompt, max_tokens, temperature, True),
+            timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)["text"]
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_default_backend():
+    """
+    Get the backend shared by all sessions in the process.
+
+    Set MCQ_LLM_BACKEND=local (and optionally MCQ_LOCAL_LLM_URL) to use the
+    local HTTP stand-in instead of Cohere.
+
+    Returns:
+        LLMBackend: The shared backend
+    """
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            if os.environ.get("MCQ_LLM_BACKEND", "cohere").lower() == "local":
+                _default_backend = LocalHTTPBackend(
+                    os.environ.get("MCQ_LOCAL_LLM_URL", "http://127.0.0.1:8765"), scheduler=get_llm_scheduler()
+                )
+            else:
+                _default_backend = CohereBackend(scheduler=get_llm_scheduler())
+        return _default_backend
+
+
+class _StubLLMHandler(BaseHTTPRequestHandler):
+    # set on the server class by serve_stub
+    delay = 0.0
+    failure_rate = 0.0
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        time.sleep(self.delay)
+        if random.random() < self.failure_rate:
+            self.send_error(503, "Simulated provider failure")
+            return
+
+        text = json.dumps(self._make_questions(body.get("prompt", "")), indent=2)
+
+        self.send_response(200)
+        if body.get("stream"):
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for start in range(0, len(text), 16):
+                self.wfile.write((json.dumps({"text": text[start:start + 16]}) + "\n").encode())
+                self.wfile.flush()
+        else:
+            payload = json.dumps({"text": text}).encode()
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def _make_questions(self, prompt):
+        match = re.search(r"Generate (\d+) multiple-choice", prompt)
+        count = int(match.group(1)) if match else 5
+        difficulty = re.search(r"Difficulty Level: (\w+)", prompt)
+        difficulty = difficulty.group(1) if difficulty else "Medium"
+        salt = random.randint(0, 10 ** 6)
+        return [
+            {
+                "question": f"Stub question {salt}-{i + 1}?",
+                "options": ["Option A", "Option B", "Option C", "Option D"],
+                "correct_answer": "Option A",
+                "difficulty": difficulty
+            }
+            for i in range(count)
+        ]
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stub(host="127.0.0.1", port=8765, delay=0.0, failure_rate=0.0):
+    """
+    Run a local stand-in for the LLM provider, for use with LocalHTTPBackend.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to listen on
+        delay (float): Seconds to wait before answering each request
+        failure_rate (float): Fraction of requests answered with HTTP 503
+
+    Returns:
+        ThreadingHTTPServer: The server (call serve_forever or run it in a thread)
+    """
+    handler = type("StubLLMHandler", (_StubLLMHandler,), {"delay": delay, "failure_rate": failure_rate})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the LLM provider")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"Serving stub LLM on http://{args.host}:{args.port}/generate")
+    serve_stub(args.host, args.port, args.delay, args.failure_rate).serve_forever()
@@ -1,17 +1,92 @@
+import copy
+import hashlib
 import random
 import nltk
 import numpy as np
-from nltk.tokenize import sent_tokenize, word_tokenize
+from nltk.tokenize import sent_tokenize
 from nltk.corpus import stopwords
-from sklearn.feature_extraction.text import TfidfVectorizer
-import cohere
 import json
 import os
+import re
+import time
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from generation_cache import get_generation_cache, make_cache_key
+from response_parser import IncrementalQuestionParser, salvage_questions
+from llm_backend import get_default_backend
+from question_bank import get_question_bank
+from near_duplicates import get_near_duplicate_index
+from content_processor import ContentSelector
+from prompt_builder import PromptBuilder
+from keyword_engine import get_keyword_engine
+from cloze_generator import ClozeGenerator
+from single_flight import get_single_flight
+from scheduler import request_context
+from difficulty_estimator import DifficultyEstimator
+from bm25_index import get_bm25_index
+from question_validator import QuestionValidator
+
+# whether questions are marked as served to the user while they are generated
+_recording_served = contextvars.ContextVar("recording_served", default=True)
+
+
+@contextmanager
+def recording_served(enabled=True):
+    """
+    Turn marking questions as served on or off for the generation inside the block.
+
+    Speculative generation (e.g. prefetching) turns it off and records the
+    questions with MCQGenerator.record_served once they are actually used.
+
+    Args:
+        enabled (bool): Mark questions as served to the user
+    """
+    token = _recording_served.set(enabled)
+    try:
+        yield
+    finally:
+        _recording_served.reset(token)
 
 class MCQGenerator:
-    def __init__(self):
+    def __init__(self, chunk_size=5, max_concurrency=4, generation_cache=None, backend=None, request_timeout=60.0,
+                 question_bank=None, flag_near_duplicates=False, content_token_budget=800,
+                 max_top_up_rounds=2, top_up_deadline=30.0, engine="cohere", difficulty_check=None,
+                 retrieval_index=None, retrieval_min_match=0.5):
         """
         Initialize the MCQ Generator with default settings.
+        
+        Args:
+            chunk_size (int): Maximum number of questions requested per AI call
+            max_concurrency (int): Maximum number of AI calls running at the same time
+            generation_cache (GenerationCache, optional): Cache of generated questions,
+                defaults to the cache shared by all sessions
+            backend (LLMBackend, optional): LLM backend, defaults to the backend shared
+                by all sessions
+            request_timeout (float): Deadline in seconds for each AI call, including retries
+            question_bank (QuestionBank, optional): Bank of stored questions served before
+                any AI call, defaults to the bank shared by all sessions
+            flag_near_duplicates (bool): Keep near-duplicate questions but mark them with
+                'near_duplicate' instead of dropping them
+            content_token_budget (int): Maximum estimated tokens of educational content
+                embedded in each prompt
+            max_top_up_rounds (int): Maximum number of extra AI calls made to fill a
+                shortfall of valid questions
+            top_up_deadline (float): Total time in seconds the top-up calls may take
+            engine (str): Default question engine, "cohere" for AI generation or "cloze"
+                for offline fill-in-the-blank questions built from the content
+            difficulty_check (str, optional): What to do with AI questions whose difficulty
+                label disagrees with the local estimate: "relabel" them, "filter" them
+                out (and top up the test), or None (the default) to trust the labels;
+                the estimate comes from text features until questions have been answered
+            retrieval_index (BM25Index, optional): Index of stored questions searched for a
+                custom description before any AI call, defaults to the index shared by
+                all sessions
+            retrieval_min_match (float): Smallest normalized BM25 score of a stored
+                question used for a custom description
         """
         # try to load stopwords safely
         try:
@@ -36,8 +111,59 @@ class MCQGenerator:
                               'can', 'will', 'just', 'don', 'should', 'now'])
         self.difficulty_levels = ["Easy", "Medium", "Hard"]
         
-        # initialize cohere client
-        self.cohere_client = cohere.Client("YOb0y5NihggjPCahUAP2S8i8k2epnfsDElDbZGxz")
+        # initialize the LLM backend (pooled connections, retries and circuit breaker)
+        self.backend = backend or get_default_backend()
+        self.request_timeout = request_timeout
+        self.model_params = {
+            "model": self.backend.model_name,
+            "temperature": 0.3  # Lower temperature for more focused, instruction-following responses
+        }
+        
+        # repeated requests are served from the cache instead of the AI
+        self.generation_cache = generation_cache or get_generation_cache()
+        
+        # identical requests made at the same time share a single AI call
+        self.single_flight = get_single_flight()
+        
+        # requests with enough unused stored questions are served from the bank
+        self.question_bank = question_bank or get_question_bank()
+        self.question_bank.start_refill_worker(self)
+        
+        # reworded copies of earlier questions are filtered before tests are saved
+        self.near_duplicate_index = get_near_duplicate_index()
+        self.flag_near_duplicates = flag_near_duplicates
+        
+        # long educational content is trimmed to its most relevant parts
+        self.content_selector = ContentSelector(token_budget=content_token_budget)
+        
+        # prompts and max_tokens are sized to the number of questions requested
+        self.prompt_builder = PromptBuilder()
+        
+        # shortfalls are filled by asking only for the missing questions
+        self.max_top_up_rounds = max_top_up_rounds
+        self.top_up_deadline = top_up_deadline
+        
+        # keywords are scored against a vectorizer fitted on the whole corpus
+        self.keyword_engine = get_keyword_engine(self.stop_words)
+        
+        # content-based questions can also be built offline, without any AI call
+        self.cloze_generator = ClozeGenerator(self.keyword_engine, self.stop_words)
+        self.engine = engine
+        
+        # malformed AI questions are repaired locally; only unrepairable ones are requested again
+        self.question_validator = QuestionValidator(difficulty_levels=self.difficulty_levels)
+        
+        # difficulty labels claimed by the AI are checked against a local estimate
+        self.difficulty_estimator = DifficultyEstimator(self.keyword_engine)
+        self.difficulty_check = difficulty_check
+        
+        # custom descriptions are matched against stored questions before the AI fills the rest
+        self.retrieval_index = retrieval_index if retrieval_index is not None else get_bm25_index()
+        self.retrieval_min_match = retrieval_min_match
+        
+        # large requests are split into chunks that are generated concurrently
+        self.chunk_size = max(1, chunk_size)
+        self.max_concurrency = max(1, max_concurrency)
         
                 # fallback questions only used if AI generation fails
         self.fallback_questions = self._load_fallback_questions()
@@ -87,7 +213,9 @@ class MCQGenerator:
         
         return fallback_questions
     
-    def generate_questions(self, subject, topics, difficulty, num_questions, content=None, custom_description=""):
+    def generate_questions(self, subject, topics, difficulty, num_questions, content=None, custom_description="",
+                           user_id=None, engine=None, priority="interactive", deadline=None, on_late_questions=None,
+                           document_index=None, record_served=True):
         """
         Generate MCQ questions using Cohere AI based on subject, topics, difficulty, and custom description.
         
@@ -98,134 +226,925 @@ class MCQGenerator:
             num_questions (int): Number of questions to generate
             content (str, optional): Educational content to base questions on
             custom_description (str, optional): Custom user description of what they want
+            user_id (str, optional): User the test is for, so stored questions they
+                have already seen are not served again
+            engine (str, optional): "cohere" or "cloze", defaults to the generator's engine
+            priority (str): Scheduler priority of the AI calls ("interactive", "prefetch" or "bulk")
+            deadline (float, optional): Seconds to wait for the AI; questions still missing
+                then are filled from the question bank or the fallback questions
+            on_late_questions (callable, optional): With a deadline, called from a background
+                thread with each AI question that arrives after it, returning the questions
+                it used and the ones they replaced (see _generate_by_deadline)
+            document_index (DocumentIndex, optional): Ingested lecture notes; without content,
+                the chunks most relevant to the topics are used as the content
+            record_served (bool): Mark the questions as served to the user (history and
+                question bank); turn off for speculative generation and call record_served
+                once the questions are used
             
         Returns:
-            list: A list of question dictionaries
+            list: A list of question dictionaries, each tagged with its 'source'
+                ("ai", "cache", "retrieval", "bank", "cloze" or "fallback")
+        """
+        content = self._content_from_documents(document_index, topics, custom_description, content)
+        
+        with recording_served(record_served):
+            if deadline is not None:
+                return self._generate_by_deadline(subject, topics, difficulty, num_questions, content,
+                                                  custom_description, user_id, engine, priority, deadline,
+                                                  on_late_questions)
+            
+            if (engine or self.engine) == "cloze":
+                return self._generate_cloze_questions(subject, topics, difficulty, num_questions, content, user_id)
+            
+            with request_context(priority, user_id):
+                return self._generate_ai_questions(subject, topics, difficulty, num_questions, content,
+                                                   custom_description, user_id)
+    
+    def record_served(self, questions, subject, topics, user_id):
+        """
+        Mark questions generated with record_served off as served to the user.
+        
+        Questions are recorded as generation would have recorded them: AI,
+        cached, retrieved and cloze questions join the user's near-duplicate history,
+        and AI and bank questions are marked served in the question bank.
+        
+        Args:
+            questions (list): Question dictionaries tagged with their 'source'
+            subject (str): Subject of the questions
+            topics (list): Topics of the questions
+            user_id (str): User the questions were served to
+        """
+        if not user_id or not questions:
+            return
+        self.near_duplicate_index.register(
+            [q for q in questions if q.get('source') in ('ai', 'cache', 'retrieval', 'cloze')
+             and not q.get('near_duplicate')],
+            user_id
+        )
+        self.question_bank.add_questions(
+            subject, topics, [q for q in questions if q.get('source') in ('ai', 'bank')], served_to=user_id
+        )
+    
+    def _register_history(self, questions, user_id):
+        """
+        Add questions to the user's near-duplicate history, unless served questions are not being recorded.
+        """
+        if _recording_served.get():
+            self.near_duplicate_index.register([q for q in questions if not q.get('near_duplicate')], user_id)
+    
+    def _served_user(self, user_id):
+        # the user the questions are marked served to in the bank, if served questions are being recorded
+        return user_id if _recording_served.get() else None
+    
+    def _generate_ai_questions(self, subject, topics, difficulty, num_questions, content, custom_description, user_id):
+        """
+        Serve a request from the bank or the cache, or generate it with AI,
+        falling back to stored questions if the AI fails.
         """
         try:
-            # Generate questions using Cohere AI
-            ai_questions = self._generate_cohere_questions(
-                subject=subject,
-                topics=topics,
-                difficulty=difficulty,
-                num_questions=num_questions,
-                content=content,
-                custom_description=custom_description
+            # Serve from the question bank before making any AI call
+            bank_questions = self._draw_from_bank(subject, topics, difficulty, num_questions, content,
+                                                  custom_description, user_id)
+            if bank_questions:
+                return self._tag_source(bank_questions, 'bank')
+            
+            # Use stored questions matching the custom description, so the AI only writes the rest
+            retrieved = self._retrieve_questions(subject, difficulty, num_questions, content, custom_description,
+                                                 user_id)
+            if len(retrieved) >= num_questions:
+                return retrieved
+            remaining = num_questions - len(retrieved)
+            
+            # Serve repeated requests from the cache
+            cache_key = make_cache_key(subject, topics, difficulty, custom_description, content, self.model_params)
+            cached_questions = self.generation_cache.get(cache_key, remaining)
+            if cached_questions:
+                # a user repeating a request only gets the cached questions they have not seen,
+                # and the AI writes the rest
+                cached_questions = self._remove_near_duplicates(
+                    self._tag_source(cached_questions, 'cache'), user_id, register=False, accepted=retrieved
+                )
+            if cached_questions:
+                extra = self._tag_source(self._top_up_questions(
+                    retrieved + cached_questions, subject, topics, difficulty, num_questions, content,
+                    custom_description, user_id
+                ), 'ai')
+                self._register_history(cached_questions + extra, user_id)
+                if extra:
+                    self.generation_cache.put(cache_key, extra)
+                    self.question_bank.add_questions(subject, topics, extra, served_to=self._served_user(user_id))
+                return retrieved + cached_questions + extra
+            
+            # Generate questions using Cohere AI, sharing the call with identical concurrent requests
+            ai_questions, shared = self.single_flight.do(
+                f"{cache_key}:{remaining}",
+                lambda: self._generate_new_questions(
+                    subject, topics, difficulty, remaining, content, custom_description, user_id, cache_key
+                ),
+                timeout=self.request_timeout + self.top_up_deadline
             )
             
+            if shared and ai_questions:
+                # every waiting session gets its own shuffled copy, checked against its own history
+                ai_questions = self._remove_near_duplicates(self._shuffled_copy(ai_questions), user_id,
+                                                            register=False)
+                if not ai_questions:
+                    # the user has seen every shared question, so the request is generated for them alone
+                    ai_questions = self._generate_new_questions(
+                        subject, topics, difficulty, remaining, content, custom_description, user_id, cache_key
+                    )
+                else:
+                    ai_questions += self._tag_source(self._top_up_questions(
+                        ai_questions, subject, topics, difficulty, remaining, content, custom_description, user_id
+                    ), 'ai')
+                    self._register_history(ai_questions, user_id)
+                    self.question_bank.add_questions(subject, topics, ai_questions, served_to=self._served_user(user_id))
+            
             if ai_questions and len(ai_questions) > 0:
-                return ai_questions
+                return retrieved + ai_questions
             else:
                 # fallback to minimal hardcoded questions only if AI fails
                 print("AI generation failed, using fallback questions")
-                return self._get_fallback_questions(subject, topics, difficulty, num_questions)
+                return retrieved + self._get_fallback_questions(subject, topics, difficulty, remaining, user_id,
+                                                                content)
                 
         except Exception as e:
             print(f"Error generating questions: {e}")
             # fallback to minimal hardcoded questions
-            return self._get_fallback_questions(subject, topics, difficulty, num_questions)
+            return self._get_fallback_questions(subject, topics, difficulty, num_questions, user_id, content)
     
-    def _generate_cohere_questions(self, subject, topics, difficulty, num_questions, content, custom_description):
+    def _generate_new_questions(self, subject, topics, difficulty, num_questions, content, custom_description,
+                                user_id, cache_key):
         """
-        Generate questions using Cohere AI.
+        Generate, deduplicate and top up questions with AI, then store them in
+        the cache and the question bank.
+        
+        Returns:
+            list: A list of question dictionaries (empty if the AI failed)
+        """
+        ai_questions = self._generate_cohere_questions(
+            subject=subject,
+            topics=topics,
+            difficulty=difficulty,
+            num_questions=num_questions,
+            content=content,
+            custom_description=custom_description
+        )
+        
+        ai_questions = self._remove_near_duplicates(ai_questions, user_id, register=False)
+        ai_questions = self._check_difficulty(ai_questions, subject, topics)
+        
+        # Ask only for the missing questions if the AI returned too few
+        ai_questions += self._top_up_questions(
+            ai_questions, subject, topics, difficulty, num_questions, content, custom_description, user_id
+        )
+        self._tag_source(ai_questions, 'ai')
+        
+        if ai_questions:
+            self._register_history(ai_questions, user_id)
+            self.generation_cache.put(cache_key, ai_questions)
+            self.question_bank.add_questions(subject, topics, ai_questions, served_to=self._served_user(user_id))
+        return ai_questions
+    
+    def _generate_by_deadline(self, subject, topics, difficulty, num_questions, content, custom_description, user_id,
+                              engine, priority, deadline, on_late_questions):
+        """
+        Collect streamed questions until the deadline, then fill the rest locally.
+        
+        The stream keeps running after the deadline. Each AI question it still
+        produces is handed to on_late_questions, until one has been used per
+        question missing at the deadline, so the caller can swap it in for the
+        fill or append it where the fill came up short (e.g.
+        UserManager.upgrade_questions). on_late_questions returns a tuple of
+        the late questions it used and the questions they replaced.
+        
+        Questions are only marked as served to the user once the test keeps
+        them: the ones in time and the local fill right away, or, while late
+        questions may still replace the fill, once the stream has ended.
+        
+        Returns:
+            list: Up to num_questions question dictionaries; fewer if nothing local is
+                left, in which case late questions can still complete the test
+        """
+        produced = queue.Queue()
+        record = _recording_served.get()
+        
+        def produce():
+            try:
+                with recording_served(False):
+                    for question in self.generate_questions_stream(subject, topics, difficulty, num_questions,
+                                                                   content, custom_description, user_id, engine,
+                                                                   priority):
+                        produced.put(question)
+            except Exception as e:
+                print(f"Error generating questions: {e}")
+            finally:
+                produced.put(None)
+        
+        threading.Thread(target=produce, daemon=True).start()
+        
+        questions = []
+        finished = False
+        end = time.monotonic() + deadline
+        while len(questions) < num_questions:
+            remaining = end - time.monotonic()
+            try:
+                question = produced.get(timeout=max(remaining, 0)) if remaining > 0 else produced.get_nowait()
+            except queue.Empty:
+                break
+            if question is None:
+                finished = True
+                break
+            questions.append(question)
+        
+        if record:
+            self.record_served(questions, subject, topics, user_id)
+        
+        missing = num_questions - len(questions)
+        if missing > 0:
+            print(f"Deadline of {deadline:.1f}s reached with {len(questions)} question(s), filling {missing} locally")
+            with recording_served(False):
+                fill = self._get_fallback_questions(subject, topics, difficulty, missing, user_id, content)
+            questions += fill
+            
+            if finished or on_late_questions is None:
+                if record:
+                    self.record_served(fill, subject, topics, user_id)
+            else:
+                def deliver_late():
+                    delivered = 0
+                    swapped = []
+                    try:
+                        while delivered < missing:
+                            question = produced.get()
+                            if question is None:
+                                break
+                            # only AI output is an upgrade over the local fill
+                            if question.get('source') != 'ai':
+                                continue
+                            try:
+                                used, replaced = on_late_questions([question])
+                            except Exception as e:
+                                print(f"Error delivering late questions: {e}")
+                                continue
+                            if used and record:
+                                self.record_served(used, subject, topics, user_id)
+                            delivered += len(used)
+                            swapped.extend(replaced)
+                    finally:
+                        if record:
+                            swapped_texts = {q.get('question') for q in swapped}
+                            kept = [q for q in fill if q.get('question') not in swapped_texts]
+                            self.record_served(kept, subject, topics, user_id)
+                
+                threading.Thread(target=deliver_late, daemon=True).start()
+        return questions
+    
+    def _content_from_documents(self, document_index, topics, custom_description, content):
+        """
+        Pull the lecture-note chunks most relevant to a request when no content was given.
+        """
+        if document_index is None or (content and content.strip()):
+            return content
+        try:
+            return document_index.content_for(topics, custom_description) or content
+        except Exception as e:
+            print(f"Error reading lecture notes: {e}")
+            return content
+    
+    def _tag_source(self, questions, source):
+        """
+        Mark where questions came from, e.g. to tune the deadline against quality.
+        """
+        for question in questions:
+            question['source'] = source
+        return questions
+    
+    def _shuffled_copy(self, questions):
+        """
+        Copy questions with the question order and each question's options shuffled.
+        """
+        questions = copy.deepcopy(questions)
+        random.shuffle(questions)
+        for question in questions:
+            random.shuffle(question['options'])
+        return questions
+    
+    def generate_questions_stream(self, subject, topics, difficulty, num_questions, content=None, custom_description="",
+                                  user_id=None, engine=None, priority="interactive", document_index=None):
+        """
+        Generate MCQ questions like generate_questions, yielding each question as
+        soon as the AI has finished writing it.
+        
+        Args:
+            subject (str): The subject area (e.g., Mathematics, Science)
+            topics (list): List of specific topics within the subject
+            difficulty (str): Difficulty level (Easy, Medium, Hard)
+            num_questions (int): Number of questions to generate
+            content (str, optional): Educational content to base questions on
+            custom_description (str, optional): Custom user description of what they want
+            user_id (str, optional): User the test is for
+            engine (str, optional): "cohere" or "cloze", defaults to the generator's engine
+            priority (str): Scheduler priority of the AI calls ("interactive", "prefetch" or "bulk")
+            document_index (DocumentIndex, optional): Ingested lecture notes; without content,
+                the chunks most relevant to the topics are used as the content
+            
+        Yields:
+            dict: One question dictionary at a time
         """
+        content = self._content_from_documents(document_index, topics, custom_description, content)
+        
+        if (engine or self.engine) == "cloze":
+            # cloze questions take milliseconds, so there is nothing to stream
+            yield from self._generate_cloze_questions(subject, topics, difficulty, num_questions, content, user_id)
+            return
+        
+        generated = []
         try:
-            # Build the prompt for Cohere
-            topics_str = ", ".join(topics)
+            # Serve from the question bank before making any AI call
+            bank_questions = self._draw_from_bank(subject, topics, difficulty, num_questions, content,
+                                                  custom_description, user_id)
+            if bank_questions:
+                yield from self._tag_source(bank_questions, 'bank')
+                return
             
-            prompt = f"""Generate {num_questions} multiple-choice questions (MCQs) with the following specifications:
-
-Subject: {subject}
-Topics: {topics_str}
-Difficulty Level: {difficulty}
-"""
+            # Use stored questions matching the custom description, so the AI only writes the rest
+            retrieved = self._retrieve_questions(subject, difficulty, num_questions, content, custom_description,
+                                                 user_id)
+            generated.extend(retrieved)
+            yield from retrieved
+            if len(generated) >= num_questions:
+                return
             
-            if custom_description:
-                prompt += f"""
-IMPORTANT CUSTOM REQUIREMENTS (MUST FOLLOW EXACTLY): {custom_description}
-
-CRITICAL: The questions MUST strictly follow the custom requirements above. Do not deviate from the specified topic or requirements.
-"""
+            # Serve repeated requests from the cache
+            cache_key = make_cache_key(subject, topics, difficulty, custom_description, content, self.model_params)
+            cached_questions = self.generation_cache.get(cache_key, num_questions - len(generated))
+            if cached_questions:
+                # a user repeating a request only gets the cached questions they have not seen,
+                # and the AI streams the rest
+                cached_questions = self._remove_near_duplicates(
+                    self._tag_source(cached_questions, 'cache'), user_id, register=False, accepted=generated
+                )
+                generated.extend(cached_questions)
+                yield from cached_questions
+                if len(generated) >= num_questions:
+                    self._register_history(cached_questions, user_id)
+                    return
             
-            if content and len(content.strip()) > 50:
-                prompt += f"Base the questions on this educational content: {content}\n"
+            # Stream new questions with AI, sharing the stream with identical concurrent requests
+            exclusions = [q['question'] for q in generated]
+            missing = num_questions - len(generated)
+            exclusions_key = hashlib.sha1("\n".join(exclusions).encode('utf-8')).hexdigest()
+            flight_key = f"stream:{cache_key}:{missing}:{exclusions_key}"
+            shared_stream, shared = self.single_flight.stream(
+                flight_key,
+                lambda: self._stream_new_questions(subject, topics, difficulty, missing, content, custom_description,
+                                                   exclusions, priority, user_id),
+                timeout=self.request_timeout + self.top_up_deadline
+            )
+            for question in shared_stream:
+                # every session gets its own copy, and waiting sessions their own option order
+                question = self._shuffled_copy([question])[0] if shared else copy.deepcopy(question)
+                
+                # check each question against the ones already yielded and the user's history
+                kept = self._remove_near_duplicates([question], user_id, register=False, accepted=generated)
+                if not kept:
+                    continue
+                question = kept[0]
+                question['source'] = 'ai'
+                generated.append(question)
+                yield question
+                
+                if len(generated) >= num_questions:
+                    break
+            shared_stream.close()
             
-            # Prioritize custom description over general topics if provided
-            focus_area = custom_description if custom_description else topics_str
+            # Ask only for the missing questions if the stream ended early
+            with request_context(priority, user_id):
+                extra = self._top_up_questions(
+                    generated, subject, topics, difficulty, num_questions, content, custom_description, user_id
+                )
+            for question in self._tag_source(extra, 'ai'):
+                generated.append(question)
+                yield question
             
-            prompt += f"""
-Requirements for each question:
-1. Create exactly {num_questions} questions
-2. Each question should have exactly 4 multiple choice options
-3. Mark the correct answer clearly
-4. Make sure the difficulty is {difficulty}
-5. Questions should be educational and test understanding of: {focus_area}
-6. STRICTLY FOLLOW the custom requirements if provided - do not include questions about other topics
+            # retrieved questions are already stored and in the user's history, so only the AI output is kept
+            self._register_history([q for q in generated if q.get('source') == 'cache'], user_id)
+            ai_questions = [q for q in generated if q.get('source') == 'ai']
+            if ai_questions:
+                self._register_history(ai_questions, user_id)
+                if not shared:
+                    self.generation_cache.put(cache_key, ai_questions)
+                self.question_bank.add_questions(subject, topics, ai_questions, served_to=self._served_user(user_id))
+                
+        except Exception as e:
+            print(f"Error streaming questions: {e}")
+        
+        if not generated:
+            # fallback to minimal hardcoded questions only if AI fails
+            print("AI generation failed, using fallback questions")
+            yield from self._get_fallback_questions(subject, topics, difficulty, num_questions, user_id, content)
+    
+    def _stream_new_questions(self, subject, topics, difficulty, num_questions, content, custom_description,
+                              exclusions, priority, user_id):
+        """
+        Stream new AI questions, each yielded as soon as the AI has finished writing it.
+        
+        Questions are validated, deduplicated within the stream and checked for
+        difficulty, but not against any user's history, so the stream can be
+        shared by every session that makes the same request.
+        
+        Yields:
+            dict: One question dictionary at a time, at most num_questions
+        """
+        selected_content = self.content_selector.select(content, topics, custom_description)
+        prompt_spec = self._build_prompt(subject, topics, difficulty, num_questions, selected_content,
+                                         custom_description, exclude_questions=exclusions)
+        parser = IncrementalQuestionParser()
+        
+        stream = self.backend.generate_stream(
+            prompt=prompt_spec['prompt'],
+            max_tokens=prompt_spec['max_tokens'],
+            temperature=self.model_params["temperature"],
+            timeout=self.request_timeout,
+            priority=priority,
+            user_id=user_id
+        )
+        produced = []
+        try:
+            for text in stream:
+                for question in parser.feed(text):
+                    repaired, _ = self.question_validator.validate([question], difficulty)
+                    if not repaired:
+                        continue
+                    question = self._renumber_questions(repaired)[0]
+                    if not self._remove_near_duplicates([question], None, register=False, accepted=produced):
+                        continue
+                    checked = self._check_difficulty([question], subject, topics)
+                    if not checked:
+                        continue
+                    produced.append(checked[0])
+                    yield checked[0]
+                    if len(produced) >= num_questions:
+                        return
+                if parser.finished:
+                    return
+        finally:
+            # release the connection without waiting for the rest of the completion
+            stream.close()
+    
+    def assemble_test(self, blueprint, layout="grouped", user_id=None, priority="interactive"):
+        """
+        Generate a test spanning several subjects from a blueprint of sections.
 
-Format your response as a valid JSON array like this example:
-[
-    {{
-        "question": "What is the time complexity of binary search?",
-        "options": ["O(1)", "O(log n)", "O(n)", "O(n²)"],
-        "correct_answer": "O(log n)",
-        "difficulty": "{difficulty}"
-    }},
-    {{
-        "question": "Which data structure follows LIFO principle?",
-        "options": ["Queue", "Stack", "Array", "Tree"],
-        "correct_answer": "Stack", 
-        "difficulty": "{difficulty}"
-    }}
-]
+        All sections are generated at the same time, so the test takes about as
+        long as its slowest section instead of the sum of all of them.
 
-Generate the questions now:"""
+        Args:
+            blueprint (list): Section dictionaries with 'subject', 'topics',
+                'difficulty' and 'count'
+            layout (str): "grouped" keeps each section together in blueprint order,
+                "interleaved" alternates between sections
+            user_id (str, optional): User the test is for
+            priority (str): Scheduler priority of the AI calls ("interactive", "prefetch" or "bulk")
+
+        Returns:
+            list: A list of question dictionaries, each tagged with its 'section'
+                index and 'subject' (and 'topic' for single-topic sections)
+        """
+        if not blueprint:
+            return []
 
-            # Call Cohere API
-            response = self.cohere_client.generate(
-                model="command",
-                prompt=prompt,
-                max_tokens=3000,
-                temperature=0.3,  # Lower temperature for more focused, instruction-following responses
-                stop_sequences=[]
+        def generate_section(section):
+            return self.generate_questions(
+                section['subject'], section['topics'], section['difficulty'], section['count'],
+                user_id=user_id, priority=priority
             )
+
+        # each section runs in its own thread with a copy of the caller's context
+        with ThreadPoolExecutor(max_workers=len(blueprint)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, generate_section, section)
+                for section in blueprint
+            ]
+            results = []
+            for section, future in zip(blueprint, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"Error generating section {section['subject']}: {e}")
+                    results.append([])
+
+        sections = []
+        for index, (section, questions) in enumerate(zip(blueprint, results)):
+            tagged = []
+            for question in questions[:section['count']]:
+                question = dict(question)
+                question['section'] = index
+                question['subject'] = section['subject']
+                if len(section['topics']) == 1:
+                    question['topic'] = section['topics'][0]
+                tagged.append(question)
+            sections.append(tagged)
+
+        if layout == "interleaved":
+            longest = max(len(questions) for questions in sections)
+            return [questions[i] for i in range(longest) for questions in sections if i < len(questions)]
+        return [question for questions in sections for question in questions]
+
+    def ingest_tests(self, tests):
+        """
+        Make stored tests (e.g. UserManager.tests) known to the question bank, the
+        near-duplicate index and the retrieval index.
+        
+        Args:
+            tests (dict): Dictionary of test_id -> test data
+        """
+        self.question_bank.ingest_tests(tests)
+        self.near_duplicate_index.index_tests(tests)
+        self.retrieval_index.add_tests(tests)
+        # the bank also holds questions that never made it into a test (e.g. bulk runs)
+        for subject, question in self.question_bank.stored_questions():
+            self.retrieval_index.add_questions([question], subject)
+        self.keyword_engine.ensure_fitted(tests)
+    
+    def _generate_cloze_questions(self, subject, topics, difficulty, num_questions, content, user_id):
+        """
+        Build fill-in-the-blank questions from the educational content without any AI call.
+        
+        Returns:
+            list: A list of question dictionaries, topped up with fallback
+                questions if the content is too short
+        """
+        questions = []
+        try:
+            # build extra questions so near-duplicates can be dropped without a shortfall
+            questions = self.cloze_generator.generate(content, difficulty, num_questions * 2)
+            questions = self._remove_near_duplicates(questions, user_id)[:num_questions]
+        except Exception as e:
+            print(f"Error generating cloze questions: {e}")
+        
+        if len(questions) < num_questions:
+            print(f"Content only gave {len(questions)} cloze question(s), using fallback questions for the rest")
+            questions += self._get_fallback_questions(
+                subject, topics, difficulty, num_questions - len(questions), user_id
+            )
+        return questions
+    
+    def _remove_near_duplicates(self, questions, user_id, register=True, accepted=()):
+        """
+        Drop (or flag) near-duplicates within a batch and against the user's history.
+        
+        Args:
+            questions (list): List of question dictionaries
+            user_id (str, optional): User whose earlier questions are checked
+            register (bool): Add the kept questions to the user's history
+            accepted (list): Questions already accepted for the same test, which the
+                new questions must not repeat (they are not checked themselves)
             
-            # Get the response text
-            result = response.generations[0].text.strip()
+        Returns:
+            list: The kept questions
+        """
+        if not questions:
+            return questions
+        
+        kept, duplicates = self.near_duplicate_index.filter_questions(
+            questions, user_id, flag=self.flag_near_duplicates, accepted=accepted
+        )
+        if duplicates and register:
+            print(f"Found {len(duplicates)} near-duplicate question(s)")
+        if register:
+            self._register_history(kept, user_id)
+        return kept
+    
+    def _top_up_questions(self, questions, subject, topics, difficulty, num_questions, content, custom_description,
+                          user_id):
+        """
+        Request only the questions still missing from a partial result.
+        
+        Accepted questions are passed to the model as exclusions, and the loop
+        stops after max_top_up_rounds calls or once top_up_deadline has passed.
+        A result with no questions at all is left to the fallback path.
+        
+        Args:
+            questions (list): Questions accepted so far
+            
+        Returns:
+            list: The additional questions (empty if nothing was missing)
+        """
+        accepted = list(questions)
+        if not accepted:
+            return []
+        
+        deadline = time.monotonic() + self.top_up_deadline
+        selected_content = self.content_selector.select(content, topics, custom_description)
+        rounds = 0
+        
+        while len(accepted) < num_questions and rounds < self.max_top_up_rounds:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            rounds += 1
+            shortfall = num_questions - len(accepted)
             
-            # Try to extract JSON from the response
             try:
-                # Look for JSON array in the response
-                start_idx = result.find('[')
-                end_idx = result.rfind(']') + 1
-                
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = result[start_idx:end_idx]
-                    questions = json.loads(json_str)
-                    
-                    # Validate the questions format
-                    validated_questions = []
-                    for q in questions:
-                        if all(key in q for key in ['question', 'options', 'correct_answer', 'difficulty']):
-                            validated_questions.append(q)
-                    
-                    return validated_questions[:num_questions]
-                else:
-                    print(f"Could not find valid JSON in response: {result}")
-                    return []
-                    
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON response: {e}")
-                print(f"Raw response: {result}")
-                return []
+                extra = self._request_questions(
+                    subject, topics, difficulty, shortfall, selected_content, custom_description,
+                    exclude_questions=[q['question'] for q in accepted],
+                    timeout=min(self.request_timeout, remaining)
+                )
+            except Exception as e:
+                print(f"Error topping up questions: {e}")
+                break
+            
+            # keep only new questions that are not near-duplicates of accepted ones
+            kept = self._remove_near_duplicates(
+                self._renumber_questions(extra), user_id, register=False, accepted=accepted
+            )
+            accepted.extend(self._check_difficulty(kept, subject, topics)[:shortfall])
+        
+        if rounds:
+            print(f"Topped up {len(accepted) - len(questions)} question(s) in {rounds} extra call(s)")
+        return accepted[len(questions):]
+    
+    def _check_difficulty(self, questions, subject, topics):
+        """
+        Relabel or filter out questions whose difficulty label disagrees with the local estimate.
+        
+        Filtered questions are still stored in the question bank under their
+        estimated difficulty, so they can serve later requests.
+        
+        Returns:
+            list: The questions kept
+        """
+        if not self.difficulty_check or not questions:
+            return questions
+        try:
+            kept, rejected = self.difficulty_estimator.check(questions, self.difficulty_check)
+        except Exception as e:
+            print(f"Error checking question difficulty: {e}")
+            return questions
+        if rejected:
+            self.question_bank.add_questions(subject, topics, rejected)
+        return kept
+    
+    def _retrieve_questions(self, subject, difficulty, num_questions, content, custom_description, user_id):
+        """
+        Find stored questions that match a custom description, at the requested difficulty.
+        
+        Questions the user has seen (or near-duplicates of them) are skipped, and
+        the ones returned are added to the user's history.
+        
+        Returns:
+            list: Up to num_questions question dictionaries (empty without a custom
+                description, or when educational content is given)
+        """
+        if not custom_description or not custom_description.strip() or (content and content.strip()):
+            return []
+        try:
+            matches = self.retrieval_index.search(
+                custom_description, subject=subject, difficulty=difficulty,
+                k=num_questions * 3, min_match=self.retrieval_min_match
+            )
+        except Exception as e:
+            print(f"Error searching stored questions: {e}")
+            return []
+        
+        questions = self._remove_near_duplicates([question for question, _ in matches], user_id, register=False)
+        questions = [q for q in questions if not q.get('near_duplicate')][:num_questions]
+        if questions:
+            print(f"Reused {len(questions)} stored question(s) matching the description")
+            self._register_history(questions, user_id)
+        return self._tag_source(questions, 'retrieval')
+    
+    def _draw_from_bank(self, subject, topics, difficulty, num_questions, content, custom_description, user_id):
+        """
+        Draw a full test from the question bank when the request is not tailored.
+        
+        Requests with a custom description or educational content always go to the
+        AI, since stored questions were not written for them.
+        
+        Returns:
+            list: A list of question dictionaries, or None
+        """
+        if custom_description or (content and content.strip()):
+            return None
+        return self.question_bank.draw(subject, topics, difficulty, num_questions, user_id,
+                                       mark_served=_recording_served.get())
+    
+    def _generate_cohere_questions(self, subject, topics, difficulty, num_questions, content, custom_description):
+        """
+        Generate questions using Cohere AI.
+        
+        Requests larger than chunk_size are split into smaller chunks that are
+        generated concurrently, so the total time is set by one small chunk.
+        Long educational content is reduced to its most relevant parts first.
+        """
+        try:
+            if num_questions <= self.chunk_size:
+                return self._request_questions(
+                    subject, topics, difficulty, num_questions,
+                    self.content_selector.select(content, topics, custom_description), custom_description
+                )
+            
+            return self._run_async(self._generate_chunked_questions(
+                subject, topics, difficulty, num_questions, content, custom_description
+            ))
                 
         except Exception as e:
             print(f"Error in Cohere question generation: {e}")
             return []
     
-    def _get_fallback_questions(self, subject, topics, difficulty, num_questions):
+    def _chunk_sizes(self, num_questions):
+        """
+        Split a question count into chunk sizes no larger than chunk_size.
+        
+        Args:
+            num_questions (int): Total number of questions requested
+            
+        Returns:
+            list: List of chunk sizes that add up to num_questions
+        """
+        full_chunks, remainder = divmod(num_questions, self.chunk_size)
+        sizes = [self.chunk_size] * full_chunks
+        if remainder:
+            sizes.append(remainder)
+        return sizes
+    
+    async def _generate_chunked_questions(self, subject, topics, difficulty, num_questions, content, custom_description):
+        """
+        Generate all chunks of a request concurrently and merge the results.
+        
+        Returns:
+            list: Merged and re-numbered list of question dictionaries
+        """
+        sizes = self._chunk_sizes(num_questions)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        # spread long content over the chunks so each prompt stays within the budget
+        content_parts = self.content_selector.split_for_parallel(content, topics, custom_description, len(sizes))
+        content_parts = [part or content_parts[0] for part in content_parts]
+        
+        async def run_chunk(batch_index, chunk_size):
+            async with semaphore:
+                # the client call is blocking, so run it in a worker thread
+                return await asyncio.to_thread(
+                    self._request_questions,
+                    subject, topics, difficulty, chunk_size, content_parts[batch_index], custom_description,
+                    batch_index, len(sizes)
+                )
+        
+        chunks = await asyncio.gather(
+            *(run_chunk(i, size) for i, size in enumerate(sizes)),
+            return_exceptions=True
+        )
+        
+        results = []
+        for chunk in chunks:
+            if isinstance(chunk, Exception):
+                print(f"Error generating question chunk: {chunk}")
+                continue
+            results.append(chunk)
+        
+        return self._merge_question_chunks(results, num_questions)
+    
+    def _run_async(self, coroutine):
+        """
+        Run a coroutine to completion from synchronous code.
+        
+        If an event loop is already running in this thread, the coroutine is run
+        on a fresh loop in a helper thread instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        
+        # copy the context so the calls keep the request's scheduler priority
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(context.run, asyncio.run, coroutine).result()
+    
+    def _merge_question_chunks(self, chunks, num_questions):
+        """
+        Merge chunk results in order, dropping questions repeated across chunks.
+        
+        Args:
+            chunks (list): List of question lists, one per chunk
+            num_questions (int): Number of questions requested
+            
+        Returns:
+            list: Merged list of question dictionaries
+        """
+        merged = []
+        seen = set()
+        for question in self._renumber_questions([q for chunk in chunks for q in chunk]):
+            key = " ".join(question["question"].lower().split())
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(question)
+        
+        return merged[:num_questions]
+    
+    def _renumber_questions(self, questions):
+        """
+        Strip chunk-local numbering (e.g. "1." or "Q3:") from question text.
+        
+        Every chunk starts counting from one, and the app numbers questions by
+        their position in the test, so the model's own numbers are removed.
+        """
+        renumbered = []
+        for question in questions:
+            q_copy = question.copy()
+            q_copy["question"] = re.sub(
+                r"^\s*(?:q(?:uestion)?\s*)?\d+\s*[.):-]\s*", "", str(q_copy["question"]), flags=re.IGNORECASE
+            )
+            renumbered.append(q_copy)
+        return renumbered
+    
+    def _request_questions(self, subject, topics, difficulty, num_questions, content, custom_description,
+                           batch_index=0, batch_count=1, exclude_questions=None, timeout=None):
+        """
+        Request a single batch of questions from Cohere AI.
+        
+        Args:
+            batch_index (int): Position of this batch when a request is chunked
+            batch_count (int): Total number of batches in the request
+            exclude_questions (list, optional): Texts of questions the model must not repeat
+            timeout (float, optional): Deadline for the call, defaults to request_timeout
+            
+        Returns:
+            list: A list of validated question dictionaries
+        """
+        prompt_spec = self._build_prompt(
+            subject, topics, difficulty, num_questions, content, custom_description, batch_index, batch_count,
+            exclude_questions
+        )
+        
+        # Call the LLM backend
+        result = self.backend.generate(
+            prompt=prompt_spec['prompt'],
+            max_tokens=prompt_spec['max_tokens'],
+            temperature=self.model_params["temperature"],
+            timeout=timeout or self.request_timeout
+        ).strip()
+        
+        # Recover every well-formed question, even from a malformed response
+        questions, report = salvage_questions(result)
+        if report['salvaged'] or report['dropped'] or report['truncated']:
+            print(f"Salvaged {report['salvaged']} question(s) from a malformed response "
+                  f"({report['dropped']} dropped, truncated: {report['truncated']})")
+        if not questions:
+            print(f"Could not find valid JSON in response: {result}")
+            return []
+        
+        # Repair the questions where possible; the rest are left to the top-up
+        validated_questions, report = self.question_validator.validate(questions, difficulty)
+        if report['repaired'] or len(validated_questions) < len(questions):
+            applied = ", ".join(f"{rule} {count}" for rule, count in report.items()
+                                if count and rule not in ('checked', 'repaired'))
+            print(f"Repaired {report['repaired']} and rejected {len(questions) - len(validated_questions)} "
+                  f"of {len(questions)} question(s) ({applied})")
+        
+        return validated_questions[:num_questions]
+    
+    def _build_prompt(self, subject, topics, difficulty, num_questions, content, custom_description,
+                      batch_index=0, batch_count=1, exclude_questions=None):
+        """
+        Build the prompt and token settings for one batch of questions.
+        
+        Returns:
+            dict: The prompt, max_tokens, and the estimated prompt and response tokens
+        """
+        prompt_spec = self.prompt_builder.build(
+            subject, topics, difficulty, num_questions, content, custom_description, batch_index, batch_count,
+            exclude_questions
+        )
+        print(f"Requesting {num_questions} {difficulty} question(s): "
+              f"~{prompt_spec['prompt_tokens']} prompt tokens, ~{prompt_spec['response_tokens']} response tokens "
+              f"(max_tokens={prompt_spec['max_tokens']})")
+        return prompt_spec
+    
+    def _get_fallback_questions(self, subject, topics, difficulty, num_questions, user_id=None, content=None):
         """
         Get fallback questions when AI generation fails.
+        
+        Stored questions from the question bank are used first, then cloze
+        questions built from the content (if any), then the hardcoded
+        fallback questions.
         """
+        bank_questions = self._tag_source(self.question_bank.draw(
+            subject, topics, difficulty, num_questions, user_id, allow_partial=True,
+            mark_served=_recording_served.get()
+        ), 'bank')
+        if content and len(bank_questions) < num_questions:
+            bank_questions += self._generate_cloze_questions(
+                subject, topics, difficulty, num_questions - len(bank_questions), content, user_id
+            )
+        if len(bank_questions) >= num_questions:
+            return bank_questions
+        
         questions = []
         
         if subject in self.fallback_questions:
@@ -240,30 +1159,13 @@ Generate the questions now:"""
                             if diff != difficulty and diff in self.fallback_questions[subject][topic]:
                                 questions.extend(self.fallback_questions[subject][topic][diff])
         
-        # shuffle questions first
-        random.shuffle(questions)
+        # pick the questions in random order; options are shuffled per attempt by the
+        # test variant, so the shared fallback questions only need a shallow copy
+        randomized_questions = self._tag_source([
+            dict(question) for question in random.sample(questions, min(num_questions, len(questions)))
+        ], 'fallback')
         
-        # for each question, also randomize the order of options (while keeping track of correct answer)
-        randomized_questions = []
-        for question in questions[:num_questions]:
-            # create a copy to avoid modifying original
-            q_copy = question.copy()
-            options = q_copy["options"].copy()
-            correct_answer = q_copy["correct_answer"]
-            
-            # create pairs of (option, is_correct)
-            option_pairs = [(opt, opt == correct_answer) for opt in options]
-            
-            # shuffle the options
-            random.shuffle(option_pairs)
-            
-            # update the question with shuffled options
-            q_copy["options"] = [pair[0] for pair in option_pairs]
-            q_copy["correct_answer"] = correct_answer  # correct answer text stays the same
-            
-            randomized_questions.append(q_copy)
-        
-        return randomized_questions
+        return (bank_questions + randomized_questions)[:num_questions]
     
     def adjust_difficulty(self, current_difficulty, performance_score):
         """
@@ -300,44 +1202,17 @@ Generate the questions now:"""
         Returns:
             list: List of important keywords
         """
-        try:
-            tokens = word_tokenize(text.lower())
-            filtered_tokens = [word for word in tokens if word.isalnum() and word not in self.stop_words]
+        return self.keyword_engine.top_keywords(text, k=5)
+    
+    def extract_keywords_batch(self, texts, k=5):
+        """
+        Extract important keywords from many texts in one pass.
+        
+        Args:
+            texts (list): Texts to extract keywords from
+            k (int): Number of keywords per text
             
-            # Use TF-IDF to find important words
-            tfidf = TfidfVectorizer(max_features=10)
-            try:
-                tfidf_matrix = tfidf.fit_transform([text])
-                feature_names = tfidf.get_feature_names_out()
-                
-                # Get top 5 keywords based on TF-IDF score
-                tfidf_scores = tfidf_matrix.toarray()[0]
-                keywords = [feature_names[i] for i in tfidf_scores.argsort()[-5:]]
-                return keywords
-            except:
-                # Fallback: return most common words
-                word_counts = {}
-                for word in filtered_tokens:
-                    if word in word_counts:
-                        word_counts[word] += 1
-                    else:
-                        word_counts[word] = 1
-                # Sort by frequency
-                sorted_words = sorted(word_counts.items(), key=lambda x: x[1], reverse=True)
-                return [word for word, freq in sorted_words[:5]]
-        except:
-            # If tokenization fails, extract words using simple split
-            words = text.lower().split()
-            # Remove common words and short words
-            filtered_words = [word for word in words 
-                             if len(word) > 3 and word not in self.stop_words]
-            # Count frequencies                
-            word_counts = {}
-            for word in filtered_words:
-                if word in word_counts:
-                    word_counts[word] += 1
-                else:
-                    word_counts[word] = 1
-            # Sort by frequency
-            sorted_words = sorted(word_counts.items(), key=lambda x: x[1], reverse=True)
-            return [word for word, freq in sorted_words[:5]] 
\ No newline at end of file
+        Returns:
+            list: One list of keywords per text
+        """
+        return self.keyword_engine.top_keywords_batch(texts, k)
@@ -0,0 +1,212 @@
+import re
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+# Mersenne prime used for the universal hash family; products of two values
+# below it still fit into an unsigned 64-bit integer
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+class NearDuplicateIndex:
+    def __init__(self, num_perm=64, bands=16, threshold=0.7, shingle_size=5, seed=1):
+        """
+        Initialize a MinHash/LSH index for near-duplicate question detection.
+
+        Questions are normalized, split into character shingles and summarized
+        by a MinHash signature. Signatures are split into bands, and only
+        questions sharing at least one band bucket are compared, so the cost
+        of a lookup does not grow with the size of the index.
+
+        Args:
+            num_perm (int): Number of hash functions in a signature
+            bands (int): Number of LSH bands (num_perm must be divisible by it)
+            threshold (float): Estimated Jaccard similarity at or above which two
+                questions are duplicates
+            shingle_size (int): Length of the character shingles
+            seed (int): Seed for the hash functions, so signatures are comparable
+                across index instances
+        """
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self.hash_a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+        self.hash_b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+
+        self.signatures = {}  # item_id -> signature
+        self.buckets = defaultdict(list)  # (owner, band, band bytes) -> [item_id]
+        self.indexed_tests = set()
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def _normalize(self, question):
+        """
+        Build the normalized text a question is compared by.
+        """
+        text = f"{question.get('question', '')} {question.get('correct_answer', '')}"
+        text = re.sub(r"[^\w\s]", " ", str(text).lower())
+        return " ".join(text.split())
+
+    def signature(self, question):
+        """
+        Compute the MinHash signature of a question.
+
+        Args:
+            question (dict): Question dictionary
+
+        Returns:
+            numpy.ndarray: Signature of num_perm unsigned integers
+        """
+        text = self._normalize(question)
+        size = self.shingle_size
+        shingles = {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+        values = np.fromiter(
+            (zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+        ) % _MERSENNE_PRIME
+        hashes = (self.hash_a[:, None] * values[None, :] + self.hash_b[:, None]) % _MERSENNE_PRIME
+        return hashes.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature, owner):
+        return [
+            (owner, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def add(self, signature, owner=None):
+        """
+        Add a signature to the index.
+
+        Args:
+            signature (numpy.ndarray): Signature from signature()
+            owner (str, optional): User whose history the question belongs to
+
+        Returns:
+            int: ID of the new item
+        """
+        with self.lock:
+            item_id = self.next_id
+            self.next_id += 1
+            self.signatures[item_id] = signature
+            for key in self._band_keys(signature, owner):
+                self.buckets[key].append(item_id)
+            return item_id
+
+    def query(self, signature, owner=None):
+        """
+        Find indexed questions that are near-duplicates of a signature.
+
+        Args:
+            signature (numpy.ndarray): Signature from signature()
+            owner (str, optional): Only compare against this user's history
+
+        Returns:
+            list: List of (item_id, estimated similarity) tuples
+        """
+        with self.lock:
+            candidates = set()
+            for key in self._band_keys(signature, owner):
+                candidates.update(self.buckets.get(key, ()))
+
+            matches = []
+            for item_id in candidates:
+                similarity = float(np.mean(self.signatures[item_id] == signature))
+                if similarity >= self.threshold:
+                    matches.append((item_id, similarity))
+            return matches
+
+    def index_tests(self, tests):
+        """
+        Add every question from stored tests to their owners' history.
+
+        Tests that were indexed before are skipped, so this can be called
+        again whenever new tests may have been stored.
+
+        Args:
+            tests (dict): Dictionary of test_id -> test data
+        """
+        for test_id, test in tests.items():
+            if test_id in self.indexed_tests:
+                continue
+            self.indexed_tests.add(test_id)
+            self.register(test.get('questions', []), test.get('created_by'))
+
+    def register(self, questions, owner=None):
+        """
+        Add questions to a user's history.
+
+        Args:
+            questions (list): List of question dictionaries
+            owner (str, optional): User the questions were served to
+        """
+        for question in questions:
+            self.add(self.signature(question), owner)
+
+    def filter_questions(self, questions, owner=None, flag=False, accepted=()):
+        """
+        Remove near-duplicates within a batch and against a user's history.
+
+        Args:
+            questions (list): List of question dictionaries
+            owner (str, optional): User whose history is checked
+            flag (bool): Keep duplicates but mark them with 'near_duplicate' instead
+                of dropping them
+            accepted (list): Questions already accepted for the same test; new
+                questions are checked against them, but they are not checked
+                themselves and are not returned
+
+        Returns:
+            tuple: (kept questions, duplicate questions)
+        """
+        batch_index = NearDuplicateIndex(
+            self.num_perm, self.bands, self.threshold, self.shingle_size
+        )
+        batch_index.hash_a, batch_index.hash_b = self.hash_a, self.hash_b
+        for question in accepted:
+            batch_index.add(self.signature(question))
+
+        kept = []
+        duplicates = []
+        for question in questions:
+            signature = self.signature(question)
+            is_duplicate = bool(batch_index.query(signature)) or (
+                owner is not None and bool(self.query(signature, owner))
+            )
+
+            if is_duplicate:
+                duplicates.append(question)
+                if flag:
+                    kept.append(dict(question, near_duplicate=True))
+                continue
+
+            batch_index.add(signature)
+            kept.append(question)
+
+        return kept, duplicates
+
+
+_shared_index = None
+_shared_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index():
+    """
+    Get the process-wide near-duplicate index shared by all sessions.
+
+    Returns:
+        NearDuplicateIndex: The shared index
+    """
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            _shared_index = NearDuplicateIndex()
+        return _shared_index
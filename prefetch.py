@@ -0,0 +1,203 @@
+import queue
+import re
+import threading
+from collections import OrderedDict
+
+# only generated or stored questions are worth holding; fallback and cloze fill is
+# cheap to make at take() time and would hide a live AI generation
+_PREFETCHABLE_SOURCES = ('ai', 'bank', 'cache', 'retrieval')
+
+
+def _request_key(subject, topics, difficulty, num_questions):
+    return (subject, tuple(sorted(topics)), difficulty, int(num_questions))
+
+
+class PrefetchManager:
+    def __init__(self, generator, max_per_user=2, max_users=200, max_questions=5000):
+        """
+        Initialize speculative pre-generation of each user's likely next test.
+
+        Predicted tests are generated by a background worker at prefetch
+        priority and kept in a small per-user ready slot. They are only marked
+        as served to the user when take() hands them out, so a misprediction
+        does not hide questions from the user. Ready tests are
+        evicted least recently used first once the user, per-user or total
+        question bounds are exceeded.
+
+        Args:
+            generator (MCQGenerator): Generator used for the predicted tests
+            max_per_user (int): Maximum ready tests per user
+            max_users (int): Maximum users with ready tests
+            max_questions (int): Maximum questions held across all ready tests
+        """
+        self.generator = generator
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self.max_questions = max_questions
+
+        self.ready = OrderedDict()  # user_id -> OrderedDict of request key -> questions
+        self.pending = set()  # (user_id, request key)
+        self.total_questions = 0
+        self.lock = threading.Lock()
+
+        self.stats = {'predicted': 0, 'generated': 0, 'hits': 0, 'misses': 0, 'evicted': 0}
+        self.work_queue = queue.Queue()
+        self.worker = threading.Thread(target=self._work_loop, daemon=True)
+        self.worker.start()
+
+    def predict(self, subject, topics, difficulty, score, weak_topics=None, num_questions=10):
+        """
+        Predict the tests a user will most likely ask for after a result.
+
+        Args:
+            subject (str): Subject of the test just taken
+            topics (list): Topics of the test just taken
+            difficulty (str): Difficulty of the test just taken
+            score (float): Score of the test just taken (0.0 to 1.0)
+            weak_topics (list, optional): The user's weak topics
+            num_questions (int): Number of questions of the test just taken
+
+        Returns:
+            dict: Predicted requests, under 'next_test' and (if there are weak topics
+                in the subject) 'weak_areas'
+        """
+        next_difficulty = self.generator.adjust_difficulty(difficulty, score)
+        predictions = {'next_test': (subject, list(topics), next_difficulty, num_questions)}
+
+        weak = [topic for topic in (weak_topics or []) if topic in topics]
+        if weak:
+            # weak areas are practised one level easier than the next test
+            easier = self.generator.adjust_difficulty(next_difficulty, 0.0)
+            predictions['weak_areas'] = (subject, weak, easier, num_questions)
+        return predictions
+
+    def schedule(self, user_id, request):
+        """
+        Queue a predicted test for background generation.
+
+        Args:
+            user_id (str): User the test is for
+            request (tuple): (subject, topics, difficulty, num_questions)
+        """
+        key = _request_key(*request)
+        with self.lock:
+            if (user_id, key) in self.pending or key in self.ready.get(user_id, {}):
+                return
+            self.pending.add((user_id, key))
+            self.stats['predicted'] += 1
+        self.work_queue.put((user_id, request))
+
+    def take(self, user_id, subject, topics, difficulty, num_questions):
+        """
+        Take a ready test if it matches a request.
+
+        Args:
+            user_id (str): User asking for the test
+            subject (str): The subject area
+            topics (list): List of topics
+            difficulty (str): Difficulty level
+            num_questions (int): Number of questions
+
+        Returns:
+            list: The ready questions, or None on a miss
+        """
+        key = _request_key(subject, topics, difficulty, num_questions)
+        with self.lock:
+            slots = self.ready.get(user_id)
+            questions = slots.pop(key, None) if slots else None
+            if questions is None:
+                self.stats['misses'] += 1
+                return None
+            if not slots:
+                del self.ready[user_id]
+            self.total_questions -= len(questions)
+            self.stats['hits'] += 1
+        self.generator.record_served(questions, subject, topics, user_id)
+        print(f"Prefetched test served (hit rate {self.get_stats()['hit_rate']:.0%})")
+        return questions
+
+    def get_stats(self):
+        """
+        Get prediction statistics.
+
+        Returns:
+            dict: Counts of predicted, generated, hit, missed and evicted tests,
+                the hit rate, and the number of ready tests and questions held
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+            stats['ready_tests'] = sum(len(slots) for slots in self.ready.values())
+            stats['ready_questions'] = self.total_questions
+            return stats
+
+    def _store(self, user_id, key, questions):
+        with self.lock:
+            self.pending.discard((user_id, key))
+            slots = self.ready.setdefault(user_id, OrderedDict())
+            self.ready.move_to_end(user_id)
+            slots[key] = questions
+            self.total_questions += len(questions)
+            self.stats['generated'] += 1
+
+            # the oldest prediction of the user goes first, then the least recently active users
+            while len(slots) > self.max_per_user:
+                self._evict(slots.popitem(last=False)[1])
+            while self.ready and (len(self.ready) > self.max_users or self.total_questions > self.max_questions):
+                oldest_user, oldest_slots = next(iter(self.ready.items()))
+                self._evict(oldest_slots.popitem(last=False)[1])
+                if not oldest_slots:
+                    del self.ready[oldest_user]
+
+    def _evict(self, questions):
+        self.total_questions -= len(questions)
+        self.stats['evicted'] += 1
+
+    def _work_loop(self):
+        while True:
+            user_id, request = self.work_queue.get()
+            subject, topics, difficulty, num_questions = request
+            key = _request_key(*request)
+            try:
+                questions = self.generator.generate_questions(
+                    subject, topics, difficulty, num_questions, user_id=user_id, priority="prefetch",
+                    record_served=False
+                )
+                if len(questions) >= num_questions and all(
+                        question.get('source') in _PREFETCHABLE_SOURCES for question in questions):
+                    self._store(user_id, key, questions)
+                    continue
+                print(f"Prefetched {subject} test was incomplete, leaving it to live generation")
+            except Exception as e:
+                print(f"Error prefetching test: {e}")
+            with self.lock:
+                self.pending.discard((user_id, key))
+
+
+def weak_topic_names(weaknesses):
+    """
+    Strip the score from PerformanceAnalytics weaknesses, e.g. "Algebra (40.0%)" -> "Algebra".
+    """
+    return [re.sub(r"\s*\([\d.]+%\)$", "", weakness) for weakness in weaknesses]
+
+
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+
+def get_prefetch_manager(generator):
+    """
+    Get the process-wide prefetch manager shared by all sessions.
+
+    Args:
+        generator (MCQGenerator): Generator used when the manager is first created
+
+    Returns:
+        PrefetchManager: The shared manager
+    """
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = PrefetchManager(generator)
+        return _shared_manager
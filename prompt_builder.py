@@ -0,0 +1,168 @@
+from string import Template
+
+from content_processor import estimate_tokens
+
+# templates are compiled once at import time and only substituted per call
+_HEADER_TEMPLATE = Template("""Generate $num_questions multiple-choice questions (MCQs) with the following specifications:
+
+Subject: $subject
+Topics: $topics
+Difficulty Level: $difficulty
+""")
+
+_CUSTOM_TEMPLATE = Template("""
+IMPORTANT CUSTOM REQUIREMENTS (MUST FOLLOW EXACTLY): $custom_description
+
+CRITICAL: The questions MUST strictly follow the custom requirements above. Do not deviate from the specified topic or requirements.
+""")
+
+_CONTENT_TEMPLATE = Template("Base the questions on this educational content: $content\n")
+
+_BATCH_TEMPLATE = Template("""
+This is batch $batch_number of $batch_count for the same test. Cover different aspects of the topics than the other batches so that no question is repeated.
+""")
+
+_EXCLUDE_TEMPLATE = Template("""
+These questions are already in the test. Do NOT repeat or rephrase any of them:
+$excluded_questions
+""")
+
+_REQUIREMENTS_TEMPLATE = Template("""
+Requirements for each question:
+1. Create exactly $num_questions questions
+2. Each question should have exactly 4 multiple choice options
+3. Mark the correct answer clearly
+4. Make sure the difficulty is $difficulty
+5. Questions should be educational and test understanding of: $focus_area
+6. STRICTLY FOLLOW the custom requirements if provided - do not include questions about other topics
+
+Format your response as a valid JSON array like this example:
+[
+    {
+        "question": "What is the time complexity of binary search?",
+        "options": ["O(1)", "O(log n)", "O(n)", "O(n²)"],
+        "correct_answer": "O(log n)",
+        "difficulty": "$difficulty"
+    },
+    {
+        "question": "Which data structure follows LIFO principle?",
+        "options": ["Queue", "Stack", "Array", "Tree"],
+        "correct_answer": "Stack",
+        "difficulty": "$difficulty"
+    }
+]
+
+Generate the questions now:""")
+
+
+class PromptBuilder:
+    # estimated completion tokens for one question object, by difficulty
+    tokens_per_question = {
+        "Easy": 75,
+        "Medium": 95,
+        "Hard": 125
+    }
+
+    def __init__(self, safety_margin=1.3, response_overhead_tokens=30, min_max_tokens=256, max_max_tokens=4000,
+                 max_excluded_questions=30):
+        """
+        Initialize the token-budget-aware prompt builder.
+
+        Args:
+            safety_margin (float): Factor applied to the response estimate when setting
+                max_tokens, so normal completions are not cut off
+            response_overhead_tokens (int): Tokens for the array brackets and any text
+                around the JSON
+            min_max_tokens (int): Lower bound for max_tokens
+            max_max_tokens (int): Upper bound for max_tokens
+            max_excluded_questions (int): Maximum number of existing questions listed as
+                exclusions, to bound the prompt size
+        """
+        self.safety_margin = safety_margin
+        self.response_overhead_tokens = response_overhead_tokens
+        self.min_max_tokens = min_max_tokens
+        self.max_max_tokens = max_max_tokens
+        self.max_excluded_questions = max_excluded_questions
+
+    def estimate_response_tokens(self, num_questions, difficulty):
+        """
+        Estimate the completion length for a number of questions.
+
+        Args:
+            num_questions (int): Number of questions requested
+            difficulty (str): Difficulty level
+
+        Returns:
+            int: Estimated completion tokens
+        """
+        per_question = self.tokens_per_question.get(difficulty, self.tokens_per_question["Medium"])
+        return self.response_overhead_tokens + num_questions * per_question
+
+    def max_tokens_for(self, num_questions, difficulty):
+        """
+        Get the max_tokens setting for a request.
+
+        Args:
+            num_questions (int): Number of questions requested
+            difficulty (str): Difficulty level
+
+        Returns:
+            int: Value for the max_tokens parameter
+        """
+        max_tokens = int(self.estimate_response_tokens(num_questions, difficulty) * self.safety_margin)
+        return max(self.min_max_tokens, min(self.max_max_tokens, max_tokens))
+
+    def build(self, subject, topics, difficulty, num_questions, content=None, custom_description="",
+              batch_index=0, batch_count=1, exclude_questions=None):
+        """
+        Build the prompt and token settings for one batch of questions.
+
+        Args:
+            subject (str): The subject area
+            topics (list): List of topics
+            difficulty (str): Difficulty level
+            num_questions (int): Number of questions in this batch
+            content (str, optional): Educational content to base questions on
+            custom_description (str, optional): Custom user description
+            batch_index (int): Position of this batch when a request is chunked
+            batch_count (int): Total number of batches in the request
+            exclude_questions (list, optional): Texts of questions the model must not repeat
+
+        Returns:
+            dict: The prompt, max_tokens, and the estimated prompt and response tokens
+        """
+        topics_str = ", ".join(topics)
+        parts = [_HEADER_TEMPLATE.substitute(
+            num_questions=num_questions, subject=subject, topics=topics_str, difficulty=difficulty
+        )]
+
+        if custom_description:
+            parts.append(_CUSTOM_TEMPLATE.substitute(custom_description=custom_description))
+
+        if content and len(content.strip()) > 50:
+            parts.append(_CONTENT_TEMPLATE.substitute(content=content))
+
+        if batch_count > 1:
+            parts.append(_BATCH_TEMPLATE.substitute(batch_number=batch_index + 1, batch_count=batch_count))
+
+        if exclude_questions:
+            # the most recent questions are the most likely to be repeated
+            excluded = exclude_questions[-self.max_excluded_questions:]
+            parts.append(_EXCLUDE_TEMPLATE.substitute(
+                excluded_questions="\n".join(f"- {' '.join(str(text).split())[:150]}" for text in excluded)
+            ))
+
+        # Prioritize custom description over general topics if provided
+        parts.append(_REQUIREMENTS_TEMPLATE.substitute(
+            num_questions=num_questions,
+            difficulty=difficulty,
+            focus_area=custom_description if custom_description else topics_str
+        ))
+
+        prompt = "".join(parts)
+        return {
+            'prompt': prompt,
+            'max_tokens': self.max_tokens_for(num_questions, difficulty),
+            'prompt_tokens': estimate_tokens(prompt),
+            'response_tokens': self.estimate_response_tokens(num_questions, difficulty)
+        }
@@ -0,0 +1,368 @@
+import copy
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+from collections import defaultdict
+
+from scheduler import request_context
+
+
+class QuestionBank:
+    def __init__(self, bank_path='data/question_bank.json', min_bucket_size=20, save_delay=2.0):
+        """
+        Initialize a persistent bank of questions indexed by subject, topic and difficulty.
+
+        Args:
+            bank_path (str): JSON file the bank is persisted to, or None for a bank
+                that is only kept in memory
+            min_bucket_size (int): Buckets smaller than this are topped up in the background
+            save_delay (float): Seconds to wait before writing changes to disk, so bursts of
+                changes cost a single write
+        """
+        self.bank_path = bank_path
+        self.min_bucket_size = min_bucket_size
+        self.save_delay = save_delay
+
+        self.items = {}  # question_id -> item data
+        self.index = defaultdict(set)  # (subject, topic, difficulty) -> set of question_ids
+        self.lock = threading.RLock()
+
+        self.refill_queue = queue.Queue()
+        self.pending_refills = set()
+        self.refill_worker = None
+        self.save_timer = None
+        self.save_lock = threading.Lock()  # one writer of the bank file at a time
+
+        self._load()
+
+    def _question_id(self, question):
+        """
+        Build a stable ID from the normalized question text and correct answer.
+        """
+        text = " ".join(str(question.get('question', '')).lower().split())
+        answer = " ".join(str(question.get('correct_answer', '')).lower().split())
+        return hashlib.sha1(f"{text}\x00{answer}".encode()).hexdigest()
+
+    def _is_valid(self, question):
+        return (
+            isinstance(question, dict)
+            and all(key in question for key in ['question', 'options', 'correct_answer', 'difficulty'])
+            and question['correct_answer'] in question['options']
+        )
+
+    def _load(self):
+        """
+        Load the bank from disk (if it exists) and rebuild the index.
+        """
+        if not self.bank_path:
+            return
+
+        try:
+            if os.path.exists(self.bank_path):
+                with open(self.bank_path, 'r') as f:
+                    content = f.read().strip()
+                    self.items = json.loads(content) if content else {}
+        except Exception as e:
+            print(f"Error loading question bank: {e}")
+            self.items = {}
+
+        for question_id, item in self.items.items():
+            # served_to is stored as a sorted list and kept as a set for fast membership checks
+            item['served_to'] = set(item.get('served_to', []))
+            self._index_item(question_id, item)
+
+    def _index_item(self, question_id, item):
+        for topic in item['topics']:
+            self.index[(item['subject'], topic, item['question']['difficulty'])].add(question_id)
+
+    def save(self):
+        """
+        Write the bank to disk.
+
+        Only a shallow snapshot is taken under the lock; the stored question
+        dictionaries are never changed in place, so the JSON is built without
+        blocking draws.
+        """
+        if not self.bank_path:
+            return
+
+        try:
+            with self.save_lock:
+                with self.lock:
+                    self.save_timer = None
+                    snapshot = {
+                        question_id: dict(item, served_to=sorted(item['served_to']))
+                        for question_id, item in self.items.items()
+                    }
+                data = json.dumps(snapshot)
+
+                os.makedirs(os.path.dirname(self.bank_path) or '.', exist_ok=True)
+                tmp_path = f"{self.bank_path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.bank_path)
+        except Exception as e:
+            print(f"Error saving question bank: {e}")
+
+    def _schedule_save(self):
+        if not self.bank_path:
+            return
+        with self.lock:
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(self.save_delay, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def add_questions(self, subject, topics, questions, source='generated', served_to=None):
+        """
+        Add questions to the bank, skipping ones it already holds.
+
+        Args:
+            subject (str): Subject of the questions
+            topics (list): Topics the questions belong to (a question's own 'topic'
+                tag is used instead when present)
+            questions (list): List of question dictionaries
+            source (str): Where the questions came from
+            served_to (str, optional): User who has already seen these questions
+
+        Returns:
+            int: Number of questions added
+        """
+        added = 0
+        with self.lock:
+            for question in questions:
+                if not self._is_valid(question):
+                    continue
+
+                question_id = self._question_id(question)
+                item = self.items.get(question_id)
+                if item is None:
+                    item = {
+                        'question': {key: question[key] for key in ['question', 'options', 'correct_answer', 'difficulty']},
+                        'subject': subject,
+                        'topics': [question['topic']] if question.get('topic') else list(topics),
+                        'source': source,
+                        'served_to': set()
+                    }
+                    self.items[question_id] = item
+                    self._index_item(question_id, item)
+                    added += 1
+
+                if served_to:
+                    item['served_to'].add(served_to)
+
+        self._schedule_save()
+        return added
+
+    def ingest_tests(self, tests):
+        """
+        Add every question from stored tests (e.g. UserManager.tests) to the bank.
+
+        Args:
+            tests (dict): Dictionary of test_id -> test data
+
+        Returns:
+            int: Number of questions added
+        """
+        added = 0
+        for test in tests.values():
+            added += self.add_questions(
+                test.get('subject', 'General'),
+                test.get('topics', ['General']),
+                test.get('questions', []),
+                source='tests',
+                served_to=test.get('created_by')
+            )
+        return added
+
+    def bucket_size(self, subject, topic, difficulty):
+        """
+        Get the number of questions in one subject/topic/difficulty bucket.
+        """
+        with self.lock:
+            return len(self.index.get((subject, topic, difficulty), ()))
+
+    def draw(self, subject, topics, difficulty, num_questions, user_id=None, allow_partial=False, mark_served=True):
+        """
+        Draw questions the user has not seen yet.
+
+        Args:
+            subject (str): The subject area
+            topics (list): List of topics
+            difficulty (str): Difficulty level
+            num_questions (int): Number of questions requested
+            user_id (str, optional): User the questions are for
+            allow_partial (bool): Return what is available even if it is not enough
+            mark_served (bool): Mark the questions as served to the user; without it they
+                can be marked later with add_questions(served_to=...)
+
+        Returns:
+            list: A list of question dictionaries, or None if there are not enough
+        """
+        with self.lock:
+            candidates = set()
+            for topic in topics:
+                bucket = self.index.get((subject, topic, difficulty), set())
+                if len(bucket) < self.min_bucket_size:
+                    self.request_refill(subject, topic, difficulty)
+                candidates.update(bucket)
+
+            if user_id:
+                candidates = [qid for qid in candidates if user_id not in self.items[qid]['served_to']]
+            else:
+                candidates = list(candidates)
+
+            if len(candidates) < num_questions and not allow_partial:
+                return None
+
+            chosen = random.sample(candidates, min(num_questions, len(candidates)))
+            if user_id and mark_served:
+                for question_id in chosen:
+                    self.items[question_id]['served_to'].add(user_id)
+
+            questions = [copy.deepcopy(self.items[question_id]['question']) for question_id in chosen]
+
+        if user_id and mark_served and chosen:
+            self._schedule_save()
+        return questions
+
+    def get_items(self, subject, topics, exclude_user=None):
+        """
+        Get every stored item of a subject's topics, at all difficulties.
+
+        Args:
+            subject (str): The subject area
+            topics (list): List of topics
+            exclude_user (str, optional): Leave out questions served to this user
+
+        Returns:
+            list: List of (question_id, item) tuples (items are copies)
+        """
+        with self.lock:
+            question_ids = set()
+            for topic in topics:
+                for difficulty in ("Easy", "Medium", "Hard"):
+                    question_ids.update(self.index.get((subject, topic, difficulty), ()))
+            return [
+                (question_id, copy.deepcopy(self.items[question_id]))
+                for question_id in question_ids
+                if not exclude_user or exclude_user not in self.items[question_id]['served_to']
+            ]
+
+    def labelled_questions(self):
+        """
+        Get the text and topic of every question stored under a single topic,
+        e.g. to train a topic classifier.
+
+        Returns:
+            list: List of (question text with options, subject, topic) tuples
+        """
+        with self.lock:
+            return [
+                (" ".join([item['question']['question']] + [str(option) for option in item['question']['options']]),
+                 item['subject'], item['topics'][0])
+                for item in self.items.values()
+                if len(item['topics']) == 1
+            ]
+
+    def stored_questions(self):
+        """
+        Get a copy of every stored question with its subject, e.g. to build a search index.
+
+        Returns:
+            list: List of (subject, question dictionary) tuples
+        """
+        with self.lock:
+            return [(item['subject'], dict(item['question'])) for item in self.items.values()]
+
+    def record_responses(self, responses, user_id=None):
+        """
+        Record answers to stored questions, used to calibrate item difficulty.
+
+        Args:
+            responses (list): List of (question dict, correct) tuples
+            user_id (str, optional): User who answered, marked as served
+
+        Returns:
+            int: Number of responses matched to a stored question
+        """
+        recorded = 0
+        with self.lock:
+            for question, correct in responses:
+                item = self.items.get(self._question_id(question))
+                if item is None:
+                    continue
+                item['attempts'] = item.get('attempts', 0) + 1
+                item['correct'] = item.get('correct', 0) + (1 if correct else 0)
+                if user_id:
+                    item['served_to'].add(user_id)
+                recorded += 1
+
+        if recorded:
+            self._schedule_save()
+        return recorded
+
+    def request_refill(self, subject, topic, difficulty):
+        """
+        Queue a bucket to be topped up by the background worker.
+        """
+        key = (subject, topic, difficulty)
+        with self.lock:
+            if self.refill_worker is None or key in self.pending_refills:
+                return
+            self.pending_refills.add(key)
+        self.refill_queue.put(key)
+
+    def start_refill_worker(self, generator, batch_size=10):
+        """
+        Start the background thread that tops up thin buckets.
+
+        Args:
+            generator (MCQGenerator): Generator used to create new questions
+            batch_size (int): Number of questions generated per refill
+        """
+        with self.lock:
+            if self.refill_worker is not None:
+                return
+            self.refill_worker = threading.Thread(
+                target=self._refill_loop, args=(generator, batch_size), daemon=True
+            )
+            self.refill_worker.start()
+
+    def _refill_loop(self, generator, batch_size):
+        while True:
+            subject, topic, difficulty = self.refill_queue.get()
+            try:
+                if self.bucket_size(subject, topic, difficulty) < self.min_bucket_size:
+                    # refills must never delay questions a user is waiting for
+                    with request_context("prefetch"):
+                        questions = generator._generate_cohere_questions(
+                            subject, [topic], difficulty, batch_size, None, ""
+                        )
+                    self.add_questions(subject, [topic], questions, source='refill')
+            except Exception as e:
+                print(f"Error refilling question bank: {e}")
+            finally:
+                with self.lock:
+                    self.pending_refills.discard((subject, topic, difficulty))
+
+
+_shared_bank = None
+_shared_bank_lock = threading.Lock()
+
+
+def get_question_bank():
+    """
+    Get the process-wide question bank shared by all sessions.
+
+    Returns:
+        QuestionBank: The shared bank
+    """
+    global _shared_bank
+    with _shared_bank_lock:
+        if _shared_bank is None:
+            _shared_bank = QuestionBank()
+        return _shared_bank
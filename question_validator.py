@@ -0,0 +1,218 @@
+import difflib
+import re
+import threading
+import unicodedata
+
+# e.g. "B", "b)", "(B)", "Option B", "Answer: B"
+_LETTER_ANSWER_RE = re.compile(r"^(?:(?:option|answer|choice)\s*:?\s*)?\(?([A-Ha-h])[).:]?$", re.IGNORECASE)
+# e.g. "A) Paris", "b. Paris", "(C) Paris"
+_OPTION_LABEL_RE = re.compile(r"^\(?[A-Ha-h][).:]\s+")
+# answers made of digits and separators (numbers, IP addresses, dates) are never fuzzy matched
+_NUMERIC_ANSWER_RE = re.compile(r"^[\d\s.,:/%+\-]+$")
+
+# every rule counted in a validation report
+RULES = [
+    'normalized',
+    'difficulty_fixed',
+    'option_labels_stripped',
+    'duplicate_options_removed',
+    'answer_case_fixed',
+    'answer_letter_resolved',
+    'answer_fuzzy_matched',
+    'answer_added_as_option',
+    'extra_options_trimmed',
+    'rejected_not_a_question',
+    'rejected_empty_question',
+    'rejected_missing_answer',
+    'rejected_ambiguous_answer',
+    'rejected_too_few_options'
+]
+
+
+def _clean(text):
+    # null or structured values from the model count as missing, not as the text "None"
+    if isinstance(text, bool) or not isinstance(text, (str, int, float)):
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", str(text)).split())
+
+
+class QuestionValidator:
+    def __init__(self, num_options=4, fuzzy_cutoff=0.8, fuzzy_margin=0.1, fuzzy_min_length=5,
+                 difficulty_levels=("Easy", "Medium", "Hard")):
+        """
+        Initialize a validator that repairs generated questions where it can.
+
+        Each question is normalized (Unicode NFKC and whitespace), its options
+        are deduplicated and trimmed to num_options, and a correct answer that
+        is not one of the options is resolved by letter ("B"), by case, or by
+        fuzzy matching. Fuzzy matching is skipped for numeric and very short
+        answers, where one character changes the meaning, and only used when a
+        single option is clearly the closest. Only questions that cannot be
+        repaired are rejected, so only those need to be requested again.
+
+        Args:
+            num_options (int): Number of options every question must have
+            fuzzy_cutoff (float): Smallest difflib similarity for matching an answer to an option
+            fuzzy_margin (float): How much closer the best option must be than the second best
+            fuzzy_min_length (int): Shortest answer that may be fuzzy matched
+            difficulty_levels (tuple): Valid difficulty labels
+        """
+        self.num_options = num_options
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.fuzzy_margin = fuzzy_margin
+        self.fuzzy_min_length = fuzzy_min_length
+        self.difficulty_levels = list(difficulty_levels)
+        self.lock = threading.Lock()
+        self.stats = dict.fromkeys(RULES + ['checked', 'repaired'], 0)
+
+    def validate(self, questions, difficulty=None):
+        """
+        Repair a batch of questions and drop the ones that cannot be repaired.
+
+        Args:
+            questions (list): Parsed question dictionaries
+            difficulty (str, optional): Requested difficulty, used when a label is missing
+
+        Returns:
+            tuple: (valid question dictionaries, report with the count of every rule
+                plus 'checked' and 'repaired')
+        """
+        report = dict.fromkeys(RULES + ['checked', 'repaired'], 0)
+        valid = []
+        for question in questions:
+            report['checked'] += 1
+            applied = []
+            repaired = self._repair(question, difficulty, applied)
+            for rule in applied:
+                report[rule] += 1
+            if repaired is None:
+                continue
+            if applied:
+                report['repaired'] += 1
+            valid.append(repaired)
+
+        with self.lock:
+            for rule, count in report.items():
+                self.stats[rule] += count
+        return valid, report
+
+    def _repair(self, question, difficulty, applied):
+        """
+        Repair one question, recording the rules applied.
+
+        Returns:
+            dict: The repaired copy, or None if it cannot be repaired
+        """
+        if not isinstance(question, dict):
+            applied.append('rejected_not_a_question')
+            return None
+
+        text = _clean(question.get('question'))
+        if not text:
+            applied.append('rejected_empty_question')
+            return None
+
+        raw_options = question.get('options')
+        if isinstance(raw_options, dict):
+            raw_options = list(raw_options.values())
+        if not isinstance(raw_options, list):
+            raw_options = []
+        raw_answer = question.get('correct_answer')
+        options = [_clean(option) for option in raw_options]
+        answer = _clean(raw_answer)
+        if (text != question.get('question') or answer != raw_answer
+                or any(a != b for a, b in zip(options, raw_options))):
+            applied.append('normalized')
+
+        # "A) Paris" style labels are dropped when every option has one
+        if options and all(_OPTION_LABEL_RE.match(option) for option in options):
+            options = [_OPTION_LABEL_RE.sub("", option) for option in options]
+            answer = _OPTION_LABEL_RE.sub("", answer) if _OPTION_LABEL_RE.match(answer) else answer
+            applied.append('option_labels_stripped')
+
+        # the answer may refer to an option by letter, so resolve it before deduplicating
+        letter = _LETTER_ANSWER_RE.match(answer)
+        if answer not in options and letter:
+            position = ord(letter.group(1).upper()) - ord('A')
+            if position < len(options):
+                answer = options[position]
+                applied.append('answer_letter_resolved')
+
+        unique = []
+        seen = set()
+        for option in options:
+            key = option.casefold()
+            if option and key not in seen:
+                seen.add(key)
+                unique.append(option)
+        if len(unique) < len(options):
+            applied.append('duplicate_options_removed')
+        options = unique
+
+        if not answer:
+            applied.append('rejected_missing_answer')
+            return None
+        if answer not in options:
+            by_case = {option.casefold(): option for option in options}
+            close = self._fuzzy_matches(answer, options)
+            if answer.casefold() in by_case:
+                answer = by_case[answer.casefold()]
+                applied.append('answer_case_fixed')
+            elif len(close) == 1:
+                answer = close[0]
+                applied.append('answer_fuzzy_matched')
+            elif close:
+                # several options are about as close, so any pick could be the wrong key
+                applied.append('rejected_ambiguous_answer')
+                return None
+            elif len(options) < self.num_options:
+                options.append(answer)
+                applied.append('answer_added_as_option')
+            else:
+                applied.append('rejected_missing_answer')
+                return None
+
+        if len(options) > self.num_options:
+            # drop distractors from the end, never the correct answer
+            distractors = [option for option in options if option != answer][:self.num_options - 1]
+            options = [option for option in options if option == answer or option in distractors]
+            applied.append('extra_options_trimmed')
+        if len(options) < self.num_options:
+            applied.append('rejected_too_few_options')
+            return None
+
+        label = _clean(question.get('difficulty', '')).capitalize()
+        if label not in self.difficulty_levels:
+            label = difficulty if difficulty in self.difficulty_levels else "Medium"
+        if label != question.get('difficulty'):
+            applied.append('difficulty_fixed')
+
+        repaired = dict(question)
+        repaired.update({'question': text, 'options': options, 'correct_answer': answer, 'difficulty': label})
+        return repaired
+
+    def _fuzzy_matches(self, answer, options):
+        """
+        Find the options an answer may be a misspelling of.
+
+        Returns:
+            list: The single clearly closest option, every option within fuzzy_margin
+                of the closest when none stands out, or an empty list
+        """
+        if len(answer) < self.fuzzy_min_length or _NUMERIC_ANSWER_RE.match(answer):
+            return []
+        scores = []
+        for option in options:
+            matcher = difflib.SequenceMatcher(None, answer.casefold(), option.casefold())
+            scores.append((matcher.ratio(), option))
+        scores.sort(key=lambda pair: pair[0], reverse=True)
+        if not scores or scores[0][0] < self.fuzzy_cutoff:
+            return []
+        return [option for score, option in scores if scores[0][0] - score < self.fuzzy_margin]
+
+    def get_stats(self):
+        """
+        Get the number of questions checked and repaired, and the count of every rule.
+        """
+        with self.lock:
+            return dict(self.stats)
@@ -0,0 +1,157 @@
+import hashlib
+
+import numpy as np
+
+
+def variant_seed(*parts):
+    """
+    Build a stable 32-bit seed from any values, e.g. a test ID and a user ID.
+
+    Returns:
+        int: Seed for build_variant or build_forms
+    """
+    text = "\x00".join(str(part) for part in parts)
+    return int.from_bytes(hashlib.sha1(text.encode()).digest()[:4], 'little')
+
+
+def correct_option_indices(questions):
+    """
+    Get the canonical index of the correct option of every question.
+
+    Returns:
+        numpy.ndarray: One index per question, -1 where the correct answer is not an option
+    """
+    indices = np.full(len(questions), -1, dtype=np.int16)
+    for i, question in enumerate(questions):
+        try:
+            indices[i] = question['options'].index(question['correct_answer'])
+        except ValueError:
+            continue
+    return indices
+
+
+class TestVariant:
+    def __init__(self, questions, question_order, option_orders, correct_indices, seed=None):
+        """
+        One ordering of a test's canonical questions and options.
+
+        Only index arrays are stored; questions are read from the shared
+        canonical list when they are displayed, so an attempt costs a few
+        bytes per question instead of a copy of the test.
+
+        Args:
+            questions (list): Canonical question dictionaries (shared, not copied)
+            question_order (numpy.ndarray): Canonical question index shown at each position
+            option_orders (numpy.ndarray): Canonical option index shown at each position,
+                one row per canonical question
+            correct_indices (numpy.ndarray): Canonical index of each correct option
+            seed (int, optional): Seed the variant was built from
+        """
+        self.questions = questions
+        self.question_order = question_order
+        self.option_orders = option_orders
+        self.correct_indices = correct_indices
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.question_order)
+
+    def canonical_index(self, position):
+        """
+        Get the canonical index of the question shown at a position.
+        """
+        return int(self.question_order[position])
+
+    def question(self, position):
+        """
+        Get the question shown at a position, with its options in display order.
+
+        Returns:
+            dict: Question dictionary for display (the canonical one is not modified)
+        """
+        index = self.canonical_index(position)
+        canonical = self.questions[index]
+        options = canonical['options']
+        displayed = dict(canonical)
+        displayed['options'] = [options[i] for i in self.option_orders[index, :len(options)]]
+        return displayed
+
+    def canonical_option(self, position, option_position):
+        """
+        Map an option position on screen back to the canonical option index.
+        """
+        return int(self.option_orders[self.canonical_index(position), option_position])
+
+    def is_correct(self, position, option_position):
+        """
+        Grade one answer given as positions on screen.
+        """
+        index = self.canonical_index(position)
+        return int(self.option_orders[index, option_position]) == int(self.correct_indices[index])
+
+    def grade(self, positions, option_positions):
+        """
+        Grade many answers at once.
+
+        Args:
+            positions (list): Question positions that were answered
+            option_positions (list): Option position chosen for each of them
+
+        Returns:
+            tuple: (canonical question indices, canonical option indices, correctness flags)
+        """
+        indices = self.question_order[np.asarray(positions, dtype=np.intp)]
+        chosen = self.option_orders[indices, np.asarray(option_positions, dtype=np.intp)]
+        return indices, chosen, chosen == self.correct_indices[indices]
+
+
+def build_forms(questions, k, seed=None, shuffle_questions=True, shuffle_options=True):
+    """
+    Build k parallel forms of a test with one vectorized call per ordering.
+
+    Args:
+        questions (list): Canonical question dictionaries
+        k (int): Number of forms
+        seed (int, optional): Seed, so the same forms can be rebuilt later
+        shuffle_questions (bool): Permute the question order
+        shuffle_options (bool): Permute the options of every question
+
+    Returns:
+        list: k TestVariant objects sharing the canonical question list
+    """
+    rng = np.random.default_rng(seed)
+    n = len(questions)
+    option_counts = np.array([len(q['options']) for q in questions], dtype=np.intp)
+    width = int(option_counts.max(initial=1))
+    index_type = np.uint8 if max(n, width) <= 256 else np.uint16
+
+    if shuffle_questions:
+        question_orders = rng.random((k, n)).argsort(axis=1)
+    else:
+        question_orders = np.broadcast_to(np.arange(n), (k, n))
+
+    # sort random keys, with the padding of questions that have fewer options kept at the end
+    if shuffle_options:
+        keys = rng.random((k, n, width))
+    else:
+        keys = np.broadcast_to(np.arange(width, dtype=float), (k, n, width)).copy()
+    keys[:, np.arange(width)[None, :] >= option_counts[:, None]] = np.inf
+    option_orders = keys.argsort(axis=2)
+
+    question_orders = question_orders.astype(index_type)
+    option_orders = option_orders.astype(index_type)
+    correct_indices = correct_option_indices(questions)
+    return [
+        TestVariant(questions, question_orders[form], option_orders[form], correct_indices, seed)
+        for form in range(k)
+    ]
+
+
+def build_variant(questions, seed=None, shuffle_questions=True, shuffle_options=True):
+    """
+    Build a single form of a test, e.g. for one student's attempt.
+
+    Returns:
+        TestVariant: The variant
+    """
+    return build_forms(questions, 1, seed, shuffle_questions, shuffle_options)[0]
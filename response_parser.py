@@ -0,0 +1,251 @@
+import ast
+import json
+import re
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_MISSING_COMMA_RE = re.compile(r'(["\d\]}]|true|false|null)(\s*\n\s*)(")')
+_NON_SPACE_RE = re.compile(r"\S")
+_SMART_QUOTES = str.maketrans({'\u201c': '"', '\u201d': '"', '\u201e': '"'})
+
+
+class IncrementalQuestionParser:
+    # characters that can change the parser state; everything else is copied as-is
+    _SPECIAL_CHARS = re.compile(r'[\[\]{}"\\]')
+
+    def __init__(self):
+        """
+        Initialize an incremental parser for a streamed JSON array of objects.
+
+        Text is fed in arbitrary pieces as it arrives, and every top-level
+        object is returned as soon as its closing brace has been seen.
+        """
+        self.started = False  # seen the opening '[' of the array
+        self.finished = False  # seen the closing ']' of the array
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.buffer = []
+        self.errors = 0
+
+    def feed(self, text):
+        """
+        Feed the next piece of streamed text.
+
+        Args:
+            text (str): Next piece of the response
+
+        Returns:
+            list: Objects completed by this piece of text
+        """
+        objects = []
+        position = 0
+
+        while position < len(text) and not self.finished:
+            if self.escape:
+                # the character after a backslash never changes the state
+                if self.depth > 0:
+                    self.buffer.append(text[position])
+                self.escape = False
+                position += 1
+                continue
+
+            match = self._SPECIAL_CHARS.search(text, position)
+            end = match.start() if match else len(text)
+            if self.depth > 0:
+                self.buffer.append(text[position:end])
+            if not match:
+                break
+
+            char = match.group()
+            position = end + 1
+
+            if not self.started:
+                self.started = char == '['
+                continue
+
+            if self.depth == 0:
+                # between objects only the start of the next object or the end of the array matter
+                if char == '{':
+                    self.depth = 1
+                    self.buffer = ['{']
+                elif char == ']':
+                    self.finished = True
+                continue
+
+            self.buffer.append(char)
+
+            if self.in_string:
+                if char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    parsed = self._parse_object(''.join(self.buffer))
+                    if parsed is not None:
+                        objects.append(parsed)
+                    self.buffer = []
+
+        return objects
+
+    def _parse_object(self, object_text):
+        """
+        Parse the text of one complete object, repairing common defects and
+        counting failures.
+        """
+        parsed = repair_object(object_text)
+        if parsed is None:
+            self.errors += 1
+        return parsed
+
+
+def repair_object(object_text):
+    """
+    Parse the text of one JSON object, repairing common LLM defects.
+
+    Handles trailing commas, missing commas between lines, and Python-style
+    literals (single quotes, True/False/None).
+
+    Args:
+        object_text (str): Text of a single object, from '{' to '}'
+
+    Returns:
+        dict: The parsed object, or None if it could not be repaired
+    """
+    candidates = [object_text]
+    repaired = _TRAILING_COMMA_RE.sub(r"\1", object_text)
+    candidates.append(repaired)
+    candidates.append(_MISSING_COMMA_RE.sub(r"\1,\2\3", repaired))
+
+    for candidate in candidates:
+        try:
+            parsed = json.loads(candidate)
+            return parsed if isinstance(parsed, dict) else None
+        except json.JSONDecodeError:
+            continue
+
+    try:
+        python_text = re.sub(r"\btrue\b", "True", repaired)
+        python_text = re.sub(r"\bfalse\b", "False", python_text)
+        python_text = re.sub(r"\bnull\b", "None", python_text)
+        parsed = ast.literal_eval(python_text)
+        return parsed if isinstance(parsed, dict) else None
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def _scan_objects(text):
+    """
+    Split text into the raw texts of its top-level objects.
+
+    A double quote inside a string is only treated as the end of the string
+    when it is followed by ',', ':', '}', ']' or a new line starting with a
+    quote; otherwise it is escaped, so an unescaped quote inside a question
+    does not derail the scan. Raw newlines inside strings are escaped as well.
+
+    Returns:
+        tuple: (list of object texts, whether the text ended inside an object)
+    """
+    objects = []
+    current = []
+    depth = 0
+    in_string = False
+    escape = False
+
+    for position, char in enumerate(text):
+        if depth == 0:
+            if char == '{':
+                depth = 1
+                current = ['{']
+            continue
+
+        if in_string:
+            if escape:
+                escape = False
+                current.append(char)
+            elif char == '\\':
+                escape = True
+                current.append(char)
+            elif char == '"':
+                following = _NON_SPACE_RE.search(text, position + 1)
+                if (following is None or following.group() in ',:}]'
+                        or (following.group() == '"' and '\n' in text[position + 1:following.start()])):
+                    in_string = False
+                    current.append(char)
+                else:
+                    current.append('\\"')
+            elif char == '\n':
+                current.append('\\n')
+            else:
+                current.append(char)
+            continue
+
+        current.append(char)
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                objects.append(''.join(current))
+                current = []
+
+    return objects, depth > 0
+
+
+def salvage_questions(text):
+    """
+    Recover every well-formed question object from an LLM response.
+
+    The response is first parsed strictly. If that fails, fenced code blocks
+    are unwrapped, smart quotes are straightened, each top-level object is
+    extracted on its own and common JSON defects are repaired, so one broken
+    or truncated object does not cost the whole response.
+
+    Args:
+        text (str): Raw completion text
+
+    Returns:
+        tuple: (list of parsed objects, report dict with the counts of
+            'parsed', 'salvaged' and 'dropped' objects and whether the
+            response was 'truncated')
+    """
+    report = {'parsed': 0, 'salvaged': 0, 'dropped': 0, 'truncated': False}
+
+    start_idx = text.find('[')
+    end_idx = text.rfind(']') + 1
+    if start_idx >= 0 and end_idx > start_idx:
+        try:
+            parsed = json.loads(text[start_idx:end_idx])
+            if isinstance(parsed, list):
+                objects = [item for item in parsed if isinstance(item, dict)]
+                report['parsed'] = len(objects)
+                return objects, report
+        except json.JSONDecodeError:
+            pass
+
+    fenced_blocks = _FENCE_RE.findall(text)
+    if fenced_blocks:
+        text = "\n".join(fenced_blocks)
+
+    raw_objects, report['truncated'] = _scan_objects(text.translate(_SMART_QUOTES))
+
+    objects = []
+    for raw_object in raw_objects:
+        parsed = repair_object(raw_object)
+        if parsed is None:
+            report['dropped'] += 1
+        else:
+            objects.append(parsed)
+    report['salvaged'] = len(objects)
+
+    return objects, report
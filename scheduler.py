@@ -0,0 +1,307 @@
+import contextvars
+import heapq
+import itertools
+import os
+import struct
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks (e.g. Windows), so every process keeps its own budget
+    fcntl = None
+
+# lower rank is served first
+PRIORITIES = {
+    "interactive": 0,
+    "prefetch": 1,
+    "bulk": 2
+}
+
+_request_context = contextvars.ContextVar("llm_request_context", default=("interactive", None))
+
+
+@contextmanager
+def request_context(priority="interactive", user_id=None):
+    """
+    Set the priority class and user of the LLM calls made inside the block.
+
+    The context is copied into asyncio.to_thread workers, so calls of chunked
+    requests keep the priority of the request that started them.
+
+    Args:
+        priority (str): "interactive", "prefetch" or "bulk"
+        user_id (str, optional): User the calls are made for
+    """
+    token = _request_context.set((priority, user_id))
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+
+def current_request():
+    """
+    Get the (priority, user_id) of the LLM calls made from the current context.
+    """
+    return _request_context.get()
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """
+        Initialize a token bucket.
+
+        The bucket is refilled by wall-clock time, so its level can be shared
+        with other processes (see SharedBucketState).
+
+        Args:
+            rate (float): Tokens added per second, or 0 for no limit
+            capacity (float): Maximum number of tokens (the allowed burst)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.time()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, amount, reserve=0.0, now=None):
+        """
+        Get the seconds until amount tokens can be taken while keeping reserve tokens.
+
+        Requests larger than the bucket only need a full bucket.
+        """
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now or time.time())
+        needed = min(amount, self.capacity) + reserve
+        if self.tokens >= needed:
+            return 0.0
+        if needed > self.capacity:
+            # the reserve can never be kept, so wait for a full bucket instead
+            needed = self.capacity
+            if self.tokens >= needed:
+                return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, amount):
+        if self.rate > 0:
+            self.tokens -= min(amount, self.capacity)
+
+
+class SharedBucketState:
+    # level and last refill time of the request bucket, then of the token bucket
+    _layout = struct.Struct('4d')
+
+    def __init__(self, path):
+        """
+        Initialize token bucket levels kept in a small file shared by processes.
+
+        Every process whose scheduler uses the same file (the app, the bulk
+        generation workers, ...) draws from the same budget. Reads and updates
+        happen under an exclusive lock on the file.
+
+        Args:
+            path (str): File the bucket levels are stored in
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @contextmanager
+    def locked(self, request_bucket, token_bucket):
+        """
+        Load the shared levels into the buckets and store them back after the block.
+        """
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            data = os.pread(self.fd, self._layout.size, 0)
+            if len(data) == self._layout.size:
+                request_tokens, request_updated, tokens, updated = self._layout.unpack(data)
+                # the caps of this process apply if processes are configured differently
+                request_bucket.tokens = min(request_tokens, request_bucket.capacity)
+                request_bucket.updated = request_updated
+                token_bucket.tokens = min(tokens, token_bucket.capacity)
+                token_bucket.updated = updated
+            yield
+            os.pwrite(self.fd, self._layout.pack(
+                request_bucket.tokens, request_bucket.updated, token_bucket.tokens, token_bucket.updated
+            ), 0)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+class LLMScheduler:
+    def __init__(self, requests_per_second=5.0, request_burst=10, tokens_per_second=2000.0, token_burst=20000,
+                 reserved_fraction=0.2, wait_samples=500, shared_state_path=None):
+        """
+        Initialize the scheduler that admits every LLM call of the process.
+
+        Calls wait in a single queue ordered by priority class (interactive,
+        then prefetch, then bulk) and, within a class, by per-user virtual time,
+        so one user's large batch cannot starve other users. A call is admitted
+        when both the request bucket and the token bucket allow it. Prefetch and
+        bulk calls must also leave reserved_fraction of both buckets unused, so
+        an interactive call that arrives never has to wait for the buckets to
+        refill. With shared_state_path the buckets are shared with every other
+        process using the same file, so the reserve also holds between, e.g., the
+        app and a bulk generation run.
+
+        Args:
+            requests_per_second (float): Request rate limit, or 0 for no limit
+            request_burst (int): Request bucket capacity
+            tokens_per_second (float): Token rate limit (prompt plus max_tokens), or 0 for no limit
+            token_burst (int): Token bucket capacity
+            reserved_fraction (float): Share of both buckets only interactive calls may use
+            wait_samples (int): Number of recent wait times kept per class for the metrics
+            shared_state_path (str, optional): File the bucket levels are shared through;
+                without it (or without file locks on the platform) the budget is per process
+        """
+        self.request_bucket = TokenBucket(requests_per_second, request_burst)
+        self.token_bucket = TokenBucket(tokens_per_second, token_burst)
+        self.reserved_fraction = reserved_fraction
+        self.shared_state = SharedBucketState(shared_state_path) if shared_state_path and fcntl else None
+
+        self.condition = threading.Condition()
+        self.queue = []  # heap of (class rank, virtual start, sequence, ticket)
+        self.sequence = itertools.count()
+        self.class_clock = defaultdict(float)  # class rank -> virtual start of the last admitted call
+        self.user_finish = defaultdict(float)  # (class rank, user) -> virtual finish of the user's last call
+
+        self.admitted = defaultdict(int)
+        self.timed_out = defaultdict(int)
+        self.waits = defaultdict(lambda: deque(maxlen=wait_samples))
+
+    def _try_take(self, ticket):
+        """
+        Take the tokens of a call if both buckets allow it.
+
+        Returns:
+            float: 0 if the tokens were taken, else the seconds until they may be
+        """
+        reserve = 0.0 if ticket['rank'] == 0 else self.reserved_fraction
+        with self.shared_state.locked(self.request_bucket, self.token_bucket) if self.shared_state else nullcontext():
+            now = time.time()
+            wait = max(
+                self.request_bucket.wait_time(1, reserve * self.request_bucket.capacity, now),
+                self.token_bucket.wait_time(ticket['tokens'], reserve * self.token_bucket.capacity, now)
+            )
+            if wait <= 0:
+                self.request_bucket.take(1)
+                self.token_bucket.take(ticket['tokens'])
+            return wait
+
+    def _drop_cancelled(self):
+        while self.queue and self.queue[0][3]['cancelled']:
+            heapq.heappop(self.queue)
+
+    def acquire(self, tokens, priority="interactive", user_id=None, timeout=None):
+        """
+        Wait until a call may be sent to the provider.
+
+        Args:
+            tokens (int): Estimated tokens of the call (prompt plus max_tokens)
+            priority (str): "interactive", "prefetch" or "bulk"
+            user_id (str, optional): User the call is made for
+            timeout (float, optional): Maximum seconds to wait
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            TimeoutError: If the call was not admitted within the timeout
+        """
+        rank = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+
+        with self.condition:
+            # start-time fair queuing: a user's calls are spaced by their cost in virtual time
+            virtual_start = max(self.class_clock[rank], self.user_finish[(rank, user_id)])
+            self.user_finish[(rank, user_id)] = virtual_start + tokens
+            ticket = {'rank': rank, 'tokens': tokens, 'virtual_start': virtual_start, 'cancelled': False}
+            heapq.heappush(self.queue, (rank, virtual_start, next(self.sequence), ticket))
+
+            while True:
+                self._drop_cancelled()
+                now = time.monotonic()
+                if self.queue[0][3] is ticket:
+                    wait = self._try_take(ticket)
+                    if wait <= 0:
+                        heapq.heappop(self.queue)
+                        self.class_clock[rank] = max(self.class_clock[rank], virtual_start)
+                        waited = now - start
+                        self.admitted[rank] += 1
+                        self.waits[rank].append(waited)
+                        # let the next call in line check the buckets
+                        self.condition.notify_all()
+                        return waited
+                else:
+                    wait = None
+
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        ticket['cancelled'] = True
+                        self.timed_out[rank] += 1
+                        self.condition.notify_all()
+                        raise TimeoutError(f"no {priority} LLM slot within {timeout:.1f}s")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.condition.wait(wait)
+
+    def get_stats(self):
+        """
+        Get queue depth and wait time metrics per priority class.
+
+        Returns:
+            dict: Per class: calls queued now, calls admitted and timed out, and
+                the mean and 95th percentile wait in seconds of recent calls
+        """
+        with self.condition:
+            queued = defaultdict(int)
+            for rank, _, _, ticket in self.queue:
+                if not ticket['cancelled']:
+                    queued[rank] += 1
+
+            stats = {}
+            for priority, rank in PRIORITIES.items():
+                waits = sorted(self.waits[rank])
+                stats[priority] = {
+                    'queued': queued[rank],
+                    'admitted': self.admitted[rank],
+                    'timed_out': self.timed_out[rank],
+                    'mean_wait': sum(waits) / len(waits) if waits else 0.0,
+                    'p95_wait': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+                }
+            return stats
+
+
+_shared_scheduler = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler():
+    """
+    Get the process-wide LLM scheduler shared by all sessions.
+
+    Its rate limits are shared with every other process on the machine through
+    MCQ_SCHEDULER_STATE (default data/llm_budget.bin), so bulk runs and
+    prefetching in other processes still leave the reserve to interactive calls.
+    Set MCQ_SCHEDULER_STATE to an empty string to give a process its own budget.
+
+    Returns:
+        LLMScheduler: The shared scheduler
+    """
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = LLMScheduler(
+                shared_state_path=os.environ.get("MCQ_SCHEDULER_STATE", "data/llm_budget.bin") or None
+            )
+        return _shared_scheduler
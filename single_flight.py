@@ -0,0 +1,184 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _Broadcast:
+    """
+    Items produced by one stream, replayed to every subscriber as they arrive.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def publish(self, item):
+        with self.condition:
+            self.items.append(item)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def subscribe(self, timeout=None):
+        """
+        Yield every item from the first one, waiting for new ones until the stream ends.
+
+        A subscriber that waits longer than timeout seconds in total stops quietly.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        position = 0
+        while True:
+            with self.condition:
+                while position == len(self.items) and not self.done:
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        return
+                    self.condition.wait(remaining)
+                if position == len(self.items):
+                    if self.error is not None:
+                        raise self.error
+                    return
+                item = self.items[position]
+            position += 1
+            yield item
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Initialize a single-flight group.
+
+        Concurrent calls with the same key share one execution: the first
+        caller runs the function and every caller that arrives while it is
+        still running waits for the same result instead of repeating the work.
+        Streams are shared the same way, with every subscriber getting each
+        item as soon as it is produced.
+        """
+        self.in_flight = {}  # key -> Future of the running call, or _Broadcast of the running stream
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn for a key, or wait for the call already running for it.
+
+        Args:
+            key (str): Key identifying identical calls
+            fn (callable): Function run by the first caller
+            timeout (float, optional): Seconds a waiting caller waits for the result
+
+        Returns:
+            tuple: (result, whether the result was shared from another caller's call)
+
+        Raises:
+            Exception: Whatever fn raised, for the caller that ran it and every waiting caller
+        """
+        with self.lock:
+            self.calls += 1
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                is_leader = False
+            else:
+                future = Future()
+                self.in_flight[key] = future
+                is_leader = True
+
+        if not is_leader:
+            return future.result(timeout), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def stream(self, key, fn, timeout=None):
+        """
+        Subscribe to the stream running for a key, or start it with fn.
+
+        The stream is consumed by a background thread, so it runs to its end
+        even if the caller that started it stops reading. Every subscriber,
+        including the one that started it, gets every item from the first one.
+
+        Args:
+            key (str): Key identifying identical streams
+            fn (callable): Function returning the iterator, run by the first caller
+            timeout (float, optional): Seconds a subscriber waits for the stream in total
+
+        Returns:
+            tuple: (iterator of the items, whether the stream was started by another caller)
+
+        Raises:
+            Exception: Whatever the stream raised, at the point the subscriber reaches it
+        """
+        with self.lock:
+            self.calls += 1
+            broadcast = self.in_flight.get(key)
+            if isinstance(broadcast, _Broadcast):
+                self.coalesced += 1
+                return broadcast.subscribe(timeout), True
+            broadcast = _Broadcast()
+            self.in_flight[key] = broadcast
+
+        def produce():
+            error = None
+            try:
+                for item in fn():
+                    broadcast.publish(item)
+            except Exception as e:
+                error = e
+            finally:
+                with self.lock:
+                    self.in_flight.pop(key, None)
+                broadcast.finish(error)
+
+        # copy the context so the stream's calls keep the caller's scheduler priority
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(produce,), daemon=True).start()
+        return broadcast.subscribe(timeout), False
+
+    def get_stats(self):
+        """
+        Get call statistics.
+
+        Returns:
+            dict: Total calls, calls that shared another call's result, and calls running now
+        """
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self.in_flight)
+            }
+
+
+_shared_group = None
+_shared_group_lock = threading.Lock()
+
+
+def get_single_flight():
+    """
+    Get the process-wide single-flight group shared by all sessions.
+
+    Returns:
+        SingleFlight: The shared group
+    """
+    global _shared_group
+    with _shared_group_lock:
+        if _shared_group is None:
+            _shared_group = SingleFlight()
+        return _shared_group
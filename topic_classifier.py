@@ -0,0 +1,166 @@
+import threading
+from collections import defaultdict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+
+def _question_text(question):
+    return " ".join([str(question.get('question', ''))] + [str(option) for option in question.get('options', [])])
+
+
+class TopicClassifier:
+    def __init__(self, question_bank=None, min_score=0.05, refit_growth=0.2):
+        """
+        Initialize a local nearest-centroid topic classifier.
+
+        Questions stored in the bank under a single topic are the training
+        data: each (subject, topic) gets the normalized mean of its questions'
+        TF-IDF vectors, and a question is tagged with the candidate topic whose
+        centroid is most similar. The topic name itself is added to every
+        centroid's documents, so topics without stored questions still work.
+
+        Args:
+            question_bank (QuestionBank, optional): Bank the classifier is trained on
+            min_score (float): Similarity below which a question is left untagged
+            refit_growth (float): Refit once the bank has grown by this fraction
+        """
+        self.question_bank = question_bank
+        self.min_score = min_score
+        self.refit_growth = refit_growth
+
+        self.vectorizer = None
+        self.centroids = None
+        self.labels = {}  # (subject, topic) -> centroid row
+        self.extra_labels = set()  # (subject, topic) asked for without stored questions
+        self.trained_on = 0
+        self.lock = threading.Lock()  # guards labels, refit decisions and fits
+
+    def fit(self, examples):
+        """
+        Fit the centroids.
+
+        Args:
+            examples (list): List of (question text, subject, topic) tuples
+        """
+        with self.lock:
+            self._fit(examples)
+
+    def _fit(self, examples):
+        documents = defaultdict(list)
+        for label in self.extra_labels:
+            documents[label] = []
+        for text, subject, topic in examples:
+            documents[(subject, topic)].append(text)
+        if not documents:
+            return
+
+        labels = list(documents.keys())
+        texts = []
+        owners = []
+        for row, (subject, topic) in enumerate(labels):
+            for text in [topic] + documents[(subject, topic)]:
+                texts.append(text)
+                owners.append(row)
+
+        vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True, dtype=np.float32)
+        try:
+            matrix = vectorizer.fit_transform(texts)
+        except ValueError:
+            return
+
+        # sum the rows of each label with one sparse product, then normalize to unit length
+        membership = csr_matrix(
+            (np.ones(len(texts), dtype=np.float32), (owners, np.arange(len(texts)))),
+            shape=(len(labels), len(texts))
+        )
+        self.vectorizer = vectorizer
+        self.centroids = normalize(membership @ matrix)
+        self.labels = {label: row for row, label in enumerate(labels)}
+
+    def _ensure_fitted(self, force=False):
+        # called with self.lock held
+        if self.question_bank is None:
+            if force or self.vectorizer is None:
+                self._fit([])
+            return
+        size = len(self.question_bank.items)
+        if force or self.vectorizer is None or size > self.trained_on * (1 + self.refit_growth):
+            self.trained_on = size
+            self._fit(self.question_bank.labelled_questions())
+
+    def classify(self, questions, subject, topics):
+        """
+        Tag questions with one of a test's topics in one vectorized batch.
+
+        Args:
+            questions (list): List of question dictionaries
+            subject (str): Subject of the test
+            topics (list): Topics of the test, the only candidate labels
+
+        Returns:
+            list: One topic per question, or None where no topic is similar enough
+        """
+        if not questions or not topics:
+            return [None] * len(questions)
+        if len(topics) == 1:
+            return [topics[0]] * len(questions)
+
+        with self.lock:
+            missing = {(subject, topic) for topic in topics} - set(self.labels) - self.extra_labels
+            # new topics start from their name until questions are stored under them
+            self.extra_labels.update(missing)
+            self._ensure_fitted(force=bool(missing))
+            vectorizer, centroids = self.vectorizer, self.centroids
+            rows = [self.labels.get((subject, topic)) for topic in topics]
+        if vectorizer is None:
+            return [None] * len(questions)
+
+        known = [i for i, row in enumerate(rows) if row is not None]
+        if not known:
+            return [None] * len(questions)
+
+        matrix = vectorizer.transform([_question_text(question) for question in questions])
+        scores = (matrix @ centroids[[rows[i] for i in known]].T).toarray()
+        best = scores.argmax(axis=1)
+        return [
+            topics[known[column]] if scores[i, column] >= self.min_score else None
+            for i, column in enumerate(best)
+        ]
+
+    def tag(self, questions, subject, topics):
+        """
+        Add a 'topic' tag to every question that does not have one yet.
+
+        Args:
+            questions (list): List of question dictionaries (tagged in place)
+            subject (str): Subject of the test
+            topics (list): Topics of the test
+        """
+        untagged = [question for question in questions if not question.get('topic')]
+        for question, topic in zip(untagged, self.classify(untagged, subject, topics)):
+            if topic:
+                question['topic'] = topic
+
+
+_shared_classifier = None
+_shared_classifier_lock = threading.Lock()
+
+
+def get_topic_classifier(question_bank=None):
+    """
+    Get the process-wide topic classifier shared by all sessions.
+
+    Args:
+        question_bank (QuestionBank, optional): Bank used when the classifier is first created
+
+    Returns:
+        TopicClassifier: The shared classifier
+    """
+    global _shared_classifier
+    with _shared_classifier_lock:
+        if _shared_classifier is None:
+            _shared_classifier = TopicClassifier(question_bank)
+        return _shared_classifier
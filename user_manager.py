@@ -2,18 +2,30 @@ import json
 import os
 import uuid
 import hashlib
+import threading
 from datetime import datetime
 
 class UserManager:
-    def __init__(self):
+    def __init__(self, topic_classifier=None):
         """
         Initialize the UserManager with empty data structures.
+        
+        Args:
+            topic_classifier (TopicClassifier, optional): Classifier that tags each
+                question of a new test with one of the test's topics
         """
         # in a real application, this would connect to a database
         self.users = {}  # username -> user data
         self.tests = {}  # test_id -> test data
         self.results = {}  # user_id -> test_id -> results
         
+        # tests can be filled in by background generation threads
+        self.lock = threading.RLock()
+        self.questions_changed = threading.Condition(self.lock)
+        
+        self.topic_classifier = topic_classifier
+        self.test_listeners = []
+        
         # create data directory if it doesn't exist
         os.makedirs('data', exist_ok=True)
         
@@ -65,14 +77,15 @@ class UserManager:
             # make sure the directory exists
             os.makedirs('data', exist_ok=True)
             
-            with open('data/users.json', 'w') as f:
-                json.dump(self.users, f, indent=2)
-            
-            with open('data/tests.json', 'w') as f:
-                json.dump(self.tests, f, indent=2)
-            
-            with open('data/results.json', 'w') as f:
-                json.dump(self.results, f, indent=2)
+            with self.lock:
+                with open('data/users.json', 'w') as f:
+                    json.dump(self.users, f, indent=2)
+                
+                with open('data/tests.json', 'w') as f:
+                    json.dump(self.tests, f, indent=2)
+                
+                with open('data/results.json', 'w') as f:
+                    json.dump(self.results, f, indent=2)
         except Exception as e:
             print(f"Error saving data: {e}")
     
@@ -135,7 +148,26 @@ class UserManager:
         password_hash = self._hash_password(password)
         return password_hash == self.users[username]['password_hash']
     
-    def create_test(self, user_id, test_name, subject, topics, questions, difficulty='Medium', adaptive=True):
+    def add_test_listener(self, listener):
+        """
+        Register a function called whenever questions are saved to a test.
+        
+        Args:
+            listener (callable): Called as listener(test_id, questions, test) after
+                create_test and append_questions
+        """
+        self.test_listeners.append(listener)
+    
+    def _notify_test_listeners(self, test_id, questions):
+        test = self.tests.get(test_id)
+        for listener in self.test_listeners:
+            try:
+                listener(test_id, questions, test)
+            except Exception as e:
+                print(f"Error in test listener: {e}")
+    
+    def create_test(self, user_id, test_name, subject, topics, questions, difficulty='Medium', adaptive=True,
+                    generating=False, sections=None, manifest_key=None):
         """
         Create a new test for a user.
         
@@ -147,35 +179,166 @@ class UserManager:
             questions (list): List of question dictionaries
             difficulty (str): Difficulty level
             adaptive (bool): Whether the test is adaptive
+            generating (bool): Whether more questions are still being generated
+            sections (list, optional): Blueprint sections of a mixed-subject test
+                (see MCQGenerator.assemble_test); questions carry their 'section' index
+            manifest_key (str, optional): Key of the bulk manifest job that created the
+                test, saved with it so an interrupted bulk run does not create it twice
             
         Returns:
             str: Test ID
         """
         test_id = str(uuid.uuid4())
         
-        # Store test data
-        self.tests[test_id] = {
-            'test_name': test_name,
-            'subject': subject,
-            'topics': topics,
-            'difficulty': difficulty,
-            'questions': questions,
-            'created_at': datetime.now().isoformat(),
-            'created_by': user_id,
-            'adaptive': adaptive
-        }
+        # tag each question with its own topic so topic analytics can use real labels
+        if self.topic_classifier is not None:
+            if sections:
+                for index, section in enumerate(sections):
+                    self.topic_classifier.tag(
+                        [q for q in questions if q.get('section') == index], section['subject'], section['topics']
+                    )
+            else:
+                self.topic_classifier.tag(questions, subject, topics)
+        
+        with self.lock:
+            # Store test data
+            self.tests[test_id] = {
+                'test_name': test_name,
+                'subject': subject,
+                'topics': topics,
+                'difficulty': difficulty,
+                'questions': questions,
+                'created_at': datetime.now().isoformat(),
+                'created_by': user_id,
+                'adaptive': adaptive,
+                'generating': generating
+            }
+            if sections:
+                self.tests[test_id]['sections'] = sections
+            if manifest_key:
+                self.tests[test_id]['manifest_key'] = manifest_key
+            
+            # Associate test with user
+            if user_id not in self.users:
+                self.users[user_id] = {'tests': []}
+            
+            if 'tests' not in self.users[user_id]:
+                self.users[user_id]['tests'] = []
+            
+            self.users[user_id]['tests'].append(test_id)
+            
+            self._save_data()
+        self._notify_test_listeners(test_id, questions)
+        return test_id
+    
+    def append_questions(self, test_id, questions):
+        """
+        Append questions to a test whose generation is still in progress.
+        
+        Args:
+            test_id (str): Test ID
+            questions (list): List of question dictionaries
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        with self.lock:
+            if test_id not in self.tests:
+                return False
+            test = self.tests[test_id]
+        
+        if self.topic_classifier is not None:
+            self.topic_classifier.tag(questions, test['subject'], test['topics'])
+        
+        with self.lock:
+            self.tests[test_id]['questions'].extend(questions)
+            self._save_data()
+            self.questions_changed.notify_all()
+        self._notify_test_listeners(test_id, questions)
+        return True
+    
+    def upgrade_questions(self, test_id, questions, replace_sources=('fallback', 'bank', 'cloze'), num_questions=None):
+        """
+        Swap questions that arrived after a generation deadline in for the local fill.
         
-        # Associate test with user
-        if user_id not in self.users:
-            self.users[user_id] = {'tests': []}
+        The last filled-in questions are replaced first. Once none is left, late
+        questions are appended while the test is shorter than num_questions.
+        The test gets a new question list, so attempts already in progress keep
+        the questions they started with.
         
-        if 'tests' not in self.users[user_id]:
-            self.users[user_id]['tests'] = []
+        Args:
+            test_id (str): Test ID
+            questions (list): List of question dictionaries that arrived late
+            replace_sources (tuple): 'source' tags of the questions that may be replaced
+            num_questions (int, optional): Number of questions the test was asked for
+            
+        Returns:
+            tuple: (late questions now in the test, questions they replaced)
+        """
+        with self.lock:
+            test = self.tests.get(test_id)
+            if test is None:
+                return [], []
+        
+        if self.topic_classifier is not None:
+            self.topic_classifier.tag(questions, test['subject'], test['topics'])
+        
+        with self.lock:
+            upgraded = list(test['questions'])
+            replaceable = [i for i, q in enumerate(upgraded) if q.get('source') in replace_sources]
+            used = []
+            swapped_out = []
+            for question in questions:
+                if replaceable:
+                    position = replaceable.pop()
+                    swapped_out.append(upgraded[position])
+                    upgraded[position] = question
+                elif num_questions is not None and len(upgraded) < num_questions:
+                    upgraded.append(question)
+                else:
+                    break
+                used.append(question)
+            if used:
+                test['questions'] = upgraded
+                self._save_data()
+        if used:
+            self._notify_test_listeners(test_id, used)
+        return used, swapped_out
+    
+    def finish_generation(self, test_id):
+        """
+        Mark a test as fully generated.
         
-        self.users[user_id]['tests'].append(test_id)
+        Args:
+            test_id (str): Test ID
+        """
+        with self.lock:
+            if test_id in self.tests:
+                self.tests[test_id]['generating'] = False
+                self._save_data()
+            self.questions_changed.notify_all()
+    
+    def wait_for_questions(self, test_id, count, timeout):
+        """
+        Wait until a test being generated has at least count questions.
         
-        self._save_data()
-        return test_id
+        Args:
+            test_id (str): Test ID
+            count (int): Number of questions to wait for
+            timeout (float): Maximum number of seconds to wait
+            
+        Returns:
+            bool: True if the test has count questions, False if generation
+                finished without them or the timeout passed
+        """
+        with self.lock:
+            self.questions_changed.wait_for(
+                lambda: test_id not in self.tests
+                or len(self.tests[test_id]['questions']) >= count
+                or not self.tests[test_id].get('generating', False),
+                timeout
+            )
+            return test_id in self.tests and len(self.tests[test_id]['questions']) >= count
     
     def get_user_tests(self, user_id):
         """
@@ -345,19 +508,38 @@ class UserManager:
             
             # Get topics for this test
             topics = test.get('topics', [])
+            questions = test.get('questions', [])
+            
+            # answers to tagged questions count for their own topic only
+            untagged_total = result.get('total_questions', 0)
+            untagged_correct = result.get('correct_answers', 0)
+            for answer in result.get('answers', []):
+                index = answer.get('question_index')
+                topic = answer.get('topic') or (
+                    questions[index].get('topic') if isinstance(index, int) and index < len(questions) else None
+                )
+                if not topic:
+                    continue
+                metrics = topic_performance.setdefault(topic, {'total_questions': 0, 'correct_answers': 0})
+                metrics['total_questions'] += 1
+                untagged_total -= 1
+                if answer.get('is_correct', False):
+                    metrics['correct_answers'] += 1
+                    untagged_correct -= 1
             
             # For each topic, update performance metrics
             for topic in topics:
+                if untagged_total <= 0:
+                    break
                 if topic not in topic_performance:
                     topic_performance[topic] = {
                         'total_questions': 0,
                         'correct_answers': 0
                     }
                 
-                # Simplified approach: divide the test questions equally among topics
-                # In a real application, each question would be tagged with its specific topic
-                topic_total_questions = result.get('total_questions', 0) / len(topics)
-                topic_correct_answers = result.get('correct_answers', 0) / len(topics)
+                # questions without a tag are divided equally among the test's topics
+                topic_total_questions = untagged_total / len(topics)
+                topic_correct_answers = untagged_correct / len(topics)
                 
                 topic_performance[topic]['total_questions'] += topic_total_questions
                 topic_performance[topic]['correct_answers'] += topic_correct_answers